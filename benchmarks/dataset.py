@@ -0,0 +1,123 @@
+import argparse
+import csv
+import io
+import random
+import zipfile
+from typing import Iterator, List, Tuple
+
+# First address of the real DB5 data; everything below is one '-' range
+FIRST_ASSIGNED = 16777216
+LAST_IP = 2 ** 32 - 1
+CSV_NAME = "IP2LOCATION-LITE-DB5.CSV"
+
+COUNTRIES = [
+    ("US", "United States of America"), ("CN", "China"), ("JP", "Japan"),
+    ("DE", "Germany"), ("GB", "United Kingdom of Great Britain and Northern Ireland"),
+    ("KR", "Korea (Republic of)"), ("BR", "Brazil"), ("FR", "France"),
+    ("CA", "Canada"), ("IT", "Italy"), ("NL", "Netherlands"), ("RU", "Russian Federation"),
+    ("IN", "India"), ("AU", "Australia"), ("TR", "Turkey"), ("ES", "Spain"),
+    ("MX", "Mexico"), ("SE", "Sweden"), ("PL", "Poland"), ("TW", "Taiwan (Province of China)"),
+    ("ID", "Indonesia"), ("ZA", "South Africa"), ("AR", "Argentina"), ("CH", "Switzerland"),
+    ("VN", "Viet Nam"), ("IR", "Iran (Islamic Republic of)"), ("EG", "Egypt"), ("UA", "Ukraine"),
+    ("NO", "Norway"), ("FI", "Finland"), ("DK", "Denmark"), ("BE", "Belgium"),
+    ("AT", "Austria"), ("CZ", "Czechia"), ("RO", "Romania"), ("CL", "Chile"),
+    ("CO", "Colombia"), ("TH", "Thailand"), ("SG", "Singapore"), ("NZ", "New Zealand")
+]
+
+SYLLABLES = ["an", "bel", "cor", "dra", "en", "fal", "gor", "hal", "is", "jun", "kar", "lor",
+             "mon", "nor", "os", "pel", "quin", "ros", "sal", "tor", "ur", "vel", "wen", "yor", "zan"]
+
+# Range sizes are 2**k addresses; most real DB5 ranges are /24 or smaller
+SIZE_EXPONENTS = list(range(17))
+SIZE_WEIGHTS = [3, 2, 3, 4, 5, 6, 8, 9, 30, 9, 7, 5, 3, 2, 1.5, 1, 0.5]
+
+
+def _name(rng: random.Random, syllables: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+
+def _zipf_weights(count: int) -> List[float]:
+    return [1.0 / rank for rank in range(1, count + 1)]
+
+
+def build_locations(rng: random.Random, countries: int = len(COUNTRIES)):
+    # Per country: its regions and (region, city, latitude, longitude)
+    # entries, with Zipf weights so a few countries and cities own most
+    # of the ranges, like the real data
+    locations = []
+    for country_code, country_name in COUNTRIES[:countries]:
+        cities = []
+        for _ in range(rng.randint(3, 15)):
+            region = _name(rng, rng.randint(2, 3))
+            for _ in range(rng.randint(3, 30)):
+                cities.append((region, _name(rng, rng.randint(2, 4)),
+                               round(rng.uniform(-60, 70), 6), round(rng.uniform(-180, 180), 6)))
+        rng.shuffle(cities)
+        locations.append((country_code, country_name, cities, _zipf_weights(len(cities))))
+    return locations, _zipf_weights(len(locations))
+
+
+def generate_rows(rows: int, seed: int = 1, countries: int = len(COUNTRIES)) -> Iterator[Tuple]:
+    # DB5 rows (ip_from, ip_to, country_code, country_name, region, city,
+    # latitude, longitude): contiguous, non-overlapping and covering the
+    # whole IPv4 space, in runs of one country with unassigned '-' gaps
+    rng = random.Random(seed)
+    locations, country_weights = build_locations(rng, countries)
+    mean_size = sum(2 ** k * w for k, w in zip(SIZE_EXPONENTS, SIZE_WEIGHTS)) / sum(SIZE_WEIGHTS)
+    # Large datasets get proportionally smaller ranges so they still fit
+    scale = min(1.0, (LAST_IP - FIRST_ASSIGNED) / (max(rows, 1) * mean_size * 1.1))
+
+    yield (0, FIRST_ASSIGNED - 1, "-", "-", "-", "-", 0.0, 0.0)
+    start = FIRST_ASSIGNED
+    emitted = 1
+    while emitted < rows - 1 and start < LAST_IP:
+        country_code, country_name, cities, city_weights = rng.choices(locations, country_weights)[0]
+        for _ in range(rng.randint(1, 20)):
+            if emitted >= rows - 1 or start >= LAST_IP:
+                break
+            size = max(1, int(2 ** rng.choices(SIZE_EXPONENTS, SIZE_WEIGHTS)[0] * scale))
+            end = min(start + size - 1, LAST_IP - 1)
+            if rng.random() < 0.05:
+                yield (start, end, "-", "-", "-", "-", 0.0, 0.0)
+            else:
+                region, city, latitude, longitude = rng.choices(cities, city_weights)[0]
+                yield (start, end, country_code, country_name, region, city, latitude, longitude)
+            start = end + 1
+            emitted += 1
+    yield (start, LAST_IP, "-", "-", "-", "-", 0.0, 0.0)
+
+
+def write_csv(rows: int, seed: int = 1, countries: int = len(COUNTRIES)) -> bytes:
+    # Quoted throughout and CRLF terminated, like the files IP2Location ships
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator="\r\n")
+    for row in generate_rows(rows, seed, countries):
+        writer.writerow(row[:6] + (f"{row[6]:.6f}", f"{row[7]:.6f}"))
+    return output.getvalue().encode('utf-8')
+
+
+def write_zip(path: str, rows: int, seed: int = 1, countries: int = len(COUNTRIES)) -> str:
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(CSV_NAME, write_csv(rows, seed, countries))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic IP2Location DB5 LITE CSV/ZIP")
+    parser.add_argument("output", help="Output file (.zip, or .csv for the bare CSV)")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of ranges (default: 100000)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    parser.add_argument("--countries", type=int, default=len(COUNTRIES),
+                        help=f"Number of countries, up to {len(COUNTRIES)}")
+    args = parser.parse_args()
+
+    if args.output.lower().endswith('.csv'):
+        with open(args.output, 'wb') as f:
+            f.write(write_csv(args.rows, args.seed, args.countries))
+    else:
+        write_zip(args.output, args.rows, args.seed, args.countries)
+    print(f"Wrote {args.rows} ranges to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
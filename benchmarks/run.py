@@ -0,0 +1,384 @@
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dataset import write_zip
+from dbmanager import IP2LocationUpdater
+from ip2location_query import IP2LocationQuery
+from storage import IPRangeStorage
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class LocalZipUpdater(IP2LocationUpdater):
+    # The real update path, reading the ZIP from disk instead of
+    # downloading it, so no token or network is needed
+    def __init__(self, zip_path: str, db_path: str):
+        super().__init__(db_path)
+        self.zip_path = zip_path
+
+    def _download_database(self, token):
+        with open(self.zip_path, 'rb') as f:
+            return f.read()
+
+
+def _peak_rss() -> Optional[int]:
+    # Bytes; ru_maxrss is in KiB on Linux and bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _timed(fn: Callable, repeat: int, setup: Optional[Callable] = None) -> Dict:
+    # fn returns how many items it processed; setup (untimed) runs
+    # before every repeat
+    runs = []
+    items = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        items = fn()
+        runs.append(time.perf_counter() - start)
+    return {'runs': runs, 'items': items}
+
+
+def _console(db_path: str):
+    from rich.console import Console
+    from ui_console import InteractiveConsole
+
+    # Rendered into memory: the benchmark measures building and laying out
+    # the tables, not the terminal
+    console = InteractiveConsole(interactive=False)
+    console.console = Console(file=io.StringIO(), width=160, force_terminal=True)
+    console.jobs.shutdown()
+    return console
+
+
+def _stored(storage: IPRangeStorage, db_path: str, query_type: str, value: str) -> str:
+    query = IP2LocationQuery(db_path)
+    search = {
+        'city': query.search_by_city,
+        'region': query.search_by_region,
+        'country': query.search_by_country_name,
+        'country-code': query.search_by_country_code
+    }[query_type]
+    return storage.add_range(query_type, value, search(value))
+
+
+def bench_baseline(ctx: Dict, repeat: int) -> Dict:
+    # Interpreter and imports only, as the reference for peak RSS
+    return {'runs': [0.0], 'items': 0}
+
+
+def bench_updater_import(ctx: Dict, repeat: int) -> Dict:
+    def setup():
+        for path in (ctx['db_path'], f"{ctx['db_path']}.stamp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def run():
+        LocalZipUpdater(ctx['zip_path'], ctx['db_path']).update_database(None)
+        return ctx['rows']
+
+    return _timed(run, repeat, setup)
+
+
+def bench_updater_ensure(ctx: Dict, repeat: int) -> Dict:
+    # Startup check of an already imported (stamped) database
+    updater = LocalZipUpdater(ctx['zip_path'], ctx['db_path'])
+    calls = 1000
+
+    def run():
+        for _ in range(calls):
+            updater.ensure_database_exists(None)
+        return calls
+
+    return _timed(run, repeat)
+
+
+def _bench_search(method: str, pick: str):
+    def bench(ctx: Dict, repeat: int) -> Dict:
+        search = getattr(IP2LocationQuery(ctx['db_path']), method)
+        return _timed(lambda: len(search(ctx['picks'][pick])), repeat)
+    return bench
+
+
+def bench_storage_add_range(ctx: Dict, repeat: int) -> Dict:
+    results = IP2LocationQuery(ctx['db_path']).search_by_country_name(ctx['picks']['country'])
+    storage = IPRangeStorage()
+
+    def run():
+        storage.add_range('country', ctx['picks']['country'], results)
+        return len(results)
+
+    return _timed(run, repeat)
+
+
+def bench_storage_get_ip_list(ctx: Dict, repeat: int) -> Dict:
+    storage = IPRangeStorage()
+    query_id = _stored(storage, ctx['db_path'], 'city', ctx['picks']['expand_city'])
+    return _timed(lambda: len(storage.get_ip_list(query_id)), repeat)
+
+
+def bench_storage_selection(ctx: Dict, repeat: int) -> Dict:
+    # Selecting every other range of the expanded city and listing its IPs
+    storage = IPRangeStorage()
+    query_id = _stored(storage, ctx['db_path'], 'city', ctx['picks']['expand_city'])
+    count = len(storage.get_ranges(query_id)['ip_ranges'])
+    selection_str = ",".join(str(index) for index in range(1, count + 1, 2))
+
+    def run():
+        selection_id = storage.create_selection(query_id, selection_str)
+        return len(storage.get_selection_ip_list(selection_id))
+
+    return _timed(run, repeat)
+
+
+def bench_export_ranges(ctx: Dict, repeat: int) -> Dict:
+    console = _console(ctx['db_path'])
+    query_id = _stored(console.ip_storage, ctx['db_path'], 'country', ctx['picks']['country'])
+    filename = os.path.join(ctx['workdir'], 'export_ranges.txt')
+
+    def run():
+        console.export_ranges(query_id, filename)
+        return len(console.ip_storage.get_ranges(query_id)['ip_ranges'])
+
+    return _timed(run, repeat)
+
+
+def bench_export_full(ctx: Dict, repeat: int) -> Dict:
+    console = _console(ctx['db_path'])
+    query_id = _stored(console.ip_storage, ctx['db_path'], 'city', ctx['picks']['expand_city'])
+    filename = os.path.join(ctx['workdir'], 'export_full.txt')
+
+    def run():
+        console.export_ranges(query_id, filename, '--full')
+        with open(filename) as f:
+            return sum(1 for _ in f)
+
+    return _timed(run, repeat)
+
+
+def bench_display_ranges(ctx: Dict, repeat: int) -> Dict:
+    # 'show ranges' and 'select ranges' tables over the biggest country
+    console = _console(ctx['db_path'])
+    query_id = _stored(console.ip_storage, ctx['db_path'], 'country', ctx['picks']['country'])
+    count = len(console.ip_storage.get_ranges(query_id)['ip_ranges'])
+
+    def run():
+        console.show_ranges()
+        console.select_ranges(query_id, f"1-{count}")
+        return count
+
+    return _timed(run, repeat)
+
+
+def bench_display_ips(ctx: Dict, repeat: int) -> Dict:
+    console = _console(ctx['db_path'])
+    query_id = _stored(console.ip_storage, ctx['db_path'], 'city', ctx['picks']['display_city'])
+    count = len(console.ip_storage.get_ip_list(query_id))
+
+    def run():
+        console.get_ips(query_id)
+        return count
+
+    return _timed(run, repeat)
+
+
+# name: (function, unit of the items it reports)
+BENCHMARKS = {
+    'updater_import': (bench_updater_import, 'rows'),
+    'baseline': (bench_baseline, None),
+    'updater_ensure': (bench_updater_ensure, 'calls'),
+    'query_city': (_bench_search('search_by_city', 'city'), 'rows'),
+    'query_region': (_bench_search('search_by_region', 'region'), 'rows'),
+    'query_country_name': (_bench_search('search_by_country_name', 'country'), 'rows'),
+    'query_country_code': (_bench_search('search_by_country_code', 'country_code'), 'rows'),
+    'storage_add_range': (bench_storage_add_range, 'ranges'),
+    'storage_get_ip_list': (bench_storage_get_ip_list, 'ips'),
+    'storage_selection': (bench_storage_selection, 'ips'),
+    'export_ranges': (bench_export_ranges, 'ranges'),
+    'export_full': (bench_export_full, 'ips'),
+    'display_ranges': (bench_display_ranges, 'ranges'),
+    'display_ips': (bench_display_ips, 'ips'),
+}
+
+
+def _child(name: str, ctx: Dict, repeat: int, queue):
+    logging.getLogger('dbmanager').setLevel(logging.WARNING)
+    try:
+        result = BENCHMARKS[name][0](ctx, repeat)
+        result['peak_rss'] = _peak_rss()
+    except Exception as e:
+        result = {'error': f"{type(e).__name__}: {e}"}
+    queue.put(result)
+
+
+def run_benchmark(name: str, ctx: Dict, repeat: int) -> Dict:
+    # Each benchmark runs in a fresh interpreter, so its peak RSS is its own
+    mp = multiprocessing.get_context('spawn')
+    queue = mp.Queue()
+    process = mp.Process(target=_child, args=(name, ctx, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    if 'error' in result:
+        return result
+    runs = result.pop('runs')
+    best = min(runs)
+    unit = BENCHMARKS[name][1]
+    result.update({
+        'seconds': best,
+        'median_seconds': statistics.median(runs),
+        'runs': runs,
+        'unit': unit
+    })
+    if unit:
+        result['throughput'] = result['items'] / best if best > 0 else None
+    return result
+
+
+def _city_within(conn: sqlite3.Connection, budget: int) -> Optional[str]:
+    row = conn.execute("""
+        SELECT city_name, SUM(ip_to - ip_from + 1) AS total FROM ip2location
+        WHERE city_name != '-' GROUP BY city_name HAVING total <= ?
+        ORDER BY total DESC, city_name LIMIT 1
+    """, (budget,)).fetchone()
+    return row[0] if row else None
+
+
+def pick_values(db_path: str, ip_budget: int, display_budget: int) -> Dict:
+    # The most common value of each search column (the heaviest realistic
+    # query), and the biggest cities whose ranges expand to at most
+    # ip_budget (display_budget for printing) addresses
+    picks = {}
+    with sqlite3.connect(db_path) as conn:
+        for pick, column in (('city', 'city_name'), ('region', 'region_name'),
+                             ('country', 'country_name'), ('country_code', 'country_code')):
+            picks[pick] = conn.execute(f"""
+                SELECT {column} FROM ip2location WHERE {column} != '-'
+                GROUP BY {column} ORDER BY COUNT(*) DESC, {column} LIMIT 1
+            """).fetchone()[0]
+        picks['expand_city'] = _city_within(conn, ip_budget) or picks['city']
+        picks['display_city'] = _city_within(conn, display_budget) or picks['expand_city']
+    return picks
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict, current: Dict):
+    print(f"\n{'benchmark':<22}{'before':>12}{'after':>12}{'change':>10}")
+    for name, result in current['results'].items():
+        old = previous.get('results', {}).get(name, {})
+        if 'seconds' not in result or not old.get('seconds'):
+            continue
+        change = (result['seconds'] - old['seconds']) / old['seconds'] * 100
+        print(f"{name:<22}{old['seconds']:>11.4f}s{result['seconds']:>11.4f}s{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Locus benchmarks on a synthetic IP2Location DB5 dataset")
+    parser.add_argument("--rows", type=int, default=100000, help="Ranges in the dataset (default: 100000)")
+    parser.add_argument("--seed", type=int, default=1, help="Dataset seed (default: 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the best is reported")
+    parser.add_argument("--ip-budget", type=int, default=1000000,
+                        help="Max addresses expanded by the IP list benchmarks (default: 1000000)")
+    parser.add_argument("--display-budget", type=int, default=50000,
+                        help="Max addresses printed by display_ips (default: 50000)")
+    parser.add_argument("--only", nargs='+', choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--workdir", help="Keep the dataset and database here instead of a temp directory")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='locus-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    ctx = {
+        'rows': args.rows,
+        'workdir': workdir,
+        'zip_path': os.path.join(workdir, f"db5-{args.rows}-{args.seed}.zip"),
+        'db_path': os.path.join(workdir, 'ip2location.db')
+    }
+
+    if not os.path.exists(ctx['zip_path']):
+        print(f"Generating {args.rows} ranges (seed {args.seed})...")
+        write_zip(ctx['zip_path'], args.rows, args.seed)
+
+    names = [name for name in BENCHMARKS if not args.only or name in args.only]
+    # Everything else reads the database the import benchmark leaves behind
+    if 'updater_import' not in names and not os.path.exists(ctx['db_path']):
+        names.insert(0, 'updater_import')
+
+    results = {}
+    for name in names:
+        if name.startswith(('query_', 'storage_', 'export_', 'display_')) and 'picks' not in ctx:
+            ctx['picks'] = pick_values(ctx['db_path'], args.ip_budget, args.display_budget)
+        result = run_benchmark(name, ctx, args.repeat)
+        results[name] = result
+        if 'error' in result:
+            print(f"{name:<22} failed: {result['error']}")
+            continue
+        rss = f"{result['peak_rss'] / 2 ** 20:.1f} MiB" if result.get('peak_rss') else "-"
+        rate = f"{result['throughput']:,.0f} {result['unit']}/s" if result.get('throughput') else ""
+        print(f"{name:<22}{result['seconds']:>10.4f}s  {rate:<26}peak RSS {rss}")
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'rows': args.rows,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'ip_budget': args.ip_budget,
+            'display_budget': args.display_budget,
+            'picks': ctx.get('picks')
+        },
+        'results': results
+    }
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    return 0 if all('error' not in result for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from config import MAX_PPS, MAX_SOCKETS
+
+RESOURCES = ('pps', 'sockets')
+
+
+class Allocation:
+    def __init__(self, scheduler: 'BudgetScheduler', allocation_id: int, name: str,
+                 weight: float, priority: int, demand: Dict[str, Optional[float]]):
+        # One running module's share of the global budget. pps and sockets
+        # are None while that resource is unlimited, so the module keeps
+        # its own settings.
+        self.scheduler = scheduler
+        self.id = allocation_id
+        self.name = name
+        self.weight = max(0.01, float(weight))
+        self.priority = int(priority)
+        self.demand = demand
+        self.pps: Optional[float] = None
+        self.sockets: Optional[int] = None
+        self.on_change: Optional[Callable[['Allocation'], None]] = None
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, count: int = 1) -> float:
+        # Token bucket at this allocation's current pps share. The tokens
+        # are taken right away (going into debt if need be) and the return
+        # value is how long the caller should wait before sending them, so
+        # event loops can sleep without blocking.
+        rate = self.pps
+        if rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            # At most 100 ms worth of burst after an idle spell
+            self._tokens = min(rate * 0.1, self._tokens + (now - self._last) * rate)
+            self._last = now
+            self._tokens -= count
+            return -self._tokens / rate if self._tokens < 0 else 0.0
+
+    def acquire(self, count: int = 1):
+        delay = self.reserve(count)
+        if delay:
+            time.sleep(delay)
+
+    def limit(self, resource: str, own: Optional[float]) -> Optional[float]:
+        # The module's own setting, capped by its share
+        share = getattr(self, resource)
+        if share is None:
+            return own
+        if not own:
+            return share
+        return min(own, share)
+
+    def release(self):
+        self.scheduler.release(self)
+
+    def __enter__(self) -> 'Allocation':
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+
+class BudgetScheduler:
+    def __init__(self, max_pps: float = 0, max_sockets: int = 0):
+        # Process-wide budget for packets per second and open sockets,
+        # shared by every running module and background job. The highest
+        # priority level is served first; within a level the budget is
+        # split by weight, max-min fair: a module that wants less than its
+        # weighted share (its demand) keeps only that and the rest goes to
+        # the others. Every module keeps a minimum of 1 so none stalls.
+        # Shares are recomputed whenever a module starts or finishes.
+        self.limits = {'pps': max_pps or 0, 'sockets': max_sockets or 0}
+        self.allocations: Dict[int, Allocation] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, max_pps: Optional[float] = None, max_sockets: Optional[int] = None):
+        with self._lock:
+            if max_pps is not None:
+                self.limits['pps'] = max(0, max_pps)
+            if max_sockets is not None:
+                self.limits['sockets'] = max(0, int(max_sockets))
+            changed = self._rebalance()
+        self._notify(changed)
+
+    def register(self, name: str, weight: float = 1.0, priority: int = 0,
+                 pps: Optional[float] = None, sockets: Optional[int] = None) -> Allocation:
+        # pps/sockets: what the module would use on its own (None = as
+        # much as it gets)
+        demand = {'pps': pps or None, 'sockets': sockets or None}
+        with self._lock:
+            allocation = Allocation(self, next(self._ids), name, weight, priority, demand)
+            self.allocations[allocation.id] = allocation
+            changed = self._rebalance()
+        self._notify([a for a in changed if a is not allocation])
+        return allocation
+
+    def release(self, allocation: Allocation):
+        with self._lock:
+            if self.allocations.pop(allocation.id, None) is None:
+                return
+            changed = self._rebalance()
+        self._notify(changed)
+
+    def _notify(self, changed: List[Allocation]):
+        for allocation in changed:
+            if allocation.on_change:
+                allocation.on_change(allocation)
+
+    def _rebalance(self) -> List[Allocation]:
+        before = {a.id: (a.pps, a.sockets) for a in self.allocations.values()}
+        for resource in RESOURCES:
+            limit = self.limits[resource]
+            if not limit:
+                for allocation in self.allocations.values():
+                    setattr(allocation, resource, None)
+                continue
+
+            remaining = float(limit)
+            levels = sorted({a.priority for a in self.allocations.values()}, reverse=True)
+            for level in levels:
+                members = [a for a in self.allocations.values() if a.priority == level]
+                remaining -= self._water_fill(members, resource, remaining)
+
+            if resource == 'sockets':
+                for allocation in self.allocations.values():
+                    allocation.sockets = max(1, int(allocation.sockets))
+        return [a for a in self.allocations.values() if before[a.id] != (a.pps, a.sockets)]
+
+    @staticmethod
+    def _water_fill(members: List[Allocation], resource: str, available: float) -> float:
+        # Weighted max-min fair split of `available` between members
+        unsatisfied = list(members)
+        given = 0.0
+        while unsatisfied:
+            total_weight = sum(a.weight for a in unsatisfied)
+            left = max(0.0, available - given)
+            capped = [a for a in unsatisfied
+                      if a.demand[resource] is not None and a.demand[resource] <= left * a.weight / total_weight]
+            if not capped:
+                for allocation in unsatisfied:
+                    share = left * allocation.weight / total_weight
+                    setattr(allocation, resource, max(1.0, share))
+                    given += share
+                break
+            for allocation in capped:
+                setattr(allocation, resource, max(1.0, float(allocation.demand[resource])))
+                given += allocation.demand[resource]
+                unsatisfied.remove(allocation)
+        return given
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [{
+                'id': a.id,
+                'name': a.name,
+                'weight': a.weight,
+                'priority': a.priority,
+                'pps': a.pps,
+                'sockets': a.sockets,
+                'demand': dict(a.demand)
+            } for a in sorted(self.allocations.values(), key=lambda a: a.id)]
+
+
+# Shared by everything running in this process
+scheduler = BudgetScheduler(MAX_PPS, MAX_SOCKETS)
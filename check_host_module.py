@@ -2,14 +2,24 @@ from scapy.all import *
 import csv
 from datetime import datetime
 import time
+import heapq
+import itertools
 from concurrent import futures
-from dataclasses import dataclass
-from typing import List, Dict, Set, Optional, Tuple
+from typing import Iterable, List, Dict, Set, Optional, Tuple
 import logging
 from concurrent.futures import ThreadPoolExecutor
 import os
+import random
 import sys
+import threading
 import subprocess
+from checkpoint import Checkpoint, open_checkpoint
+from targets import TargetSet, as_target_set
+from pipeline import TargetStream
+from results_db import RESULTS_DB_PATH, ScanRecorder, ScanResultStore
+from budget import scheduler
+from rate_control import AdaptiveRateController, ConcurrencyLimiter
+from probe_engine import AsyncProbeEngine, BatchProbeEngine, RawReply, SWEEP_PROBES, build_probe, probes_for_level
 
 # Configure logging
 logging.basicConfig(
@@ -68,46 +78,251 @@ MODULE_INFO = {
             'required': False,
             'value': None,
             'type': 'str'
+        },
+        'engine': {
+            'description': 'Probe engine: threaded (one blocking probe per thread), batch (one socket, one sniffer) or async (event loop, raw sockets)',
+            'required': False,
+            'value': 'threaded',
+            'type': 'str'
+        },
+        'batch_size': {
+            'description': 'Hosts per probe batch (batch engine)',
+            'required': False,
+            'value': '1024',
+            'type': 'int'
+        },
+        'max_pps': {
+            'description': 'Maximum probes sent per second, 0 = unlimited (batch and async engines)',
+            'required': False,
+            'value': '0',
+            'type': 'int'
+        },
+        'max_inflight': {
+            'description': 'Maximum probes awaiting a reply at once (async engine)',
+            'required': False,
+            'value': '10000',
+            'type': 'int'
+        },
+        'raw_packets': {
+            'description': 'Render probes from precomputed byte templates and parse replies with struct; false = scapy (async engine)',
+            'required': False,
+            'value': 'true',
+            'type': 'bool'
+        },
+        'adaptive': {
+            'description': 'Adapt in-flight hosts from observed errors and response rate (concurrent_hosts becomes the ceiling)',
+            'required': False,
+            'value': 'false',
+            'type': 'bool'
+        },
+        'sweep': {
+            'description': 'Sweep all targets with ICMP echo + SYN/443 first and run the full probe set only on responders',
+            'required': False,
+            'value': 'false',
+            'type': 'bool'
+        },
+        'sweep_sample': {
+            'description': 'Percentage of sweep non-responders that still get the full probe set',
+            'required': False,
+            'value': '0',
+            'type': 'int'
+        },
+        'early_exit': {
+            'description': 'Stop probing a host once it is known to be alive (skips fingerprinting)',
+            'required': False,
+            'value': 'false',
+            'type': 'bool'
+        },
+        'skip_dead': {
+            'description': 'Leave dead hosts out of the CSV (they are still counted in the summary)',
+            'required': False,
+            'value': 'false',
+            'type': 'bool'
+        },
+        'checkpoint_file': {
+            'description': 'State file for checkpointing progress (continue with: resume <file>)',
+            'required': False,
+            'value': None,
+            'type': 'str'
+        },
+        'results_db': {
+            'description': 'SQLite database that alive hosts are also stored in (empty to disable)',
+            'required': False,
+            'value': RESULTS_DB_PATH,
+            'type': 'str'
         }
     }
 }
 
-@dataclass
-class HostResult:
-    ip: str
-    status: str = 'unknown'
-    discovery_time: str = ''
-    
+HOST_FLAGS = (
     # Level 1: ICMP Results
-    icmp_echo: bool = False
-    icmp_timestamp: bool = False
-    icmp_info: bool = False
-    icmp_mask: bool = False
-    
+    'icmp_echo', 'icmp_timestamp', 'icmp_info', 'icmp_mask',
     # Level 2: Basic TCP Results
-    tcp_syn_80: bool = False
-    tcp_syn_443: bool = False
-    tcp_syn_0: bool = False
-    
+    'tcp_syn_80', 'tcp_syn_443', 'tcp_syn_0',
     # Level 3: Advanced TCP Results
-    tcp_ack: bool = False
-    tcp_null: bool = False
-    tcp_fin: bool = False
-    tcp_xmas: bool = False
-    tcp_window: bool = False
+    'tcp_ack', 'tcp_null', 'tcp_fin', 'tcp_xmas', 'tcp_window'
+)
+
+def _flag_mask(*names: str) -> int:
+    return sum(1 << HOST_FLAGS.index(name) for name in names)
+
+ICMP_MASK = _flag_mask('icmp_echo', 'icmp_timestamp', 'icmp_info', 'icmp_mask')
+TCP_SYN_MASK = _flag_mask('tcp_syn_80', 'tcp_syn_443', 'tcp_syn_0')
+TCP_ADVANCED_MASK = _flag_mask('tcp_ack', 'tcp_null', 'tcp_fin', 'tcp_xmas')
+
+CSV_HEADER = ['ip', 'status', 'discovery_time', *HOST_FLAGS,
+              'window_size', 'ttl', 'mss', 'os_guess']
+
+class HostResult:
+    # Probe outcomes are bits of one integer (see HOST_FLAGS) and the
+    # record has no __dict__, so a result stays a few dozen bytes
+    __slots__ = ('ip', 'status', 'discovery_time', 'flags',
+                 'os_guess', 'window_size', 'ttl', 'mss')
+    
+    def __init__(self, ip: str, status: str = 'unknown', discovery_time: str = '',
+                 flags: int = 0, os_guess: str = '', window_size: int = 0,
+                 ttl: int = 0, mss: int = 0, **probes: bool):
+        self.ip = ip
+        self.status = status
+        self.discovery_time = discovery_time
+        self.flags = flags
+        self.os_guess = os_guess
+        self.window_size = window_size
+        self.ttl = ttl
+        self.mss = mss
+        for name, value in probes.items():
+            setattr(self, name, value)
+            
+    def row(self) -> list:
+        return [self.ip, self.status, self.discovery_time,
+                *(bool(self.flags >> bit & 1) for bit in range(len(HOST_FLAGS))),
+                self.window_size, self.ttl, self.mss, self.os_guess]
+                
+    def fields(self) -> Dict:
+        # What is stored and passed on for an alive host
+        return {
+            'os_guess': self.os_guess,
+            'ttl': self.ttl,
+            'window_size': self.window_size,
+            'mss': self.mss
+        }
+                
+    @classmethod
+    def from_row(cls, row: List[str]) -> 'HostResult':
+        flags = sum(1 << bit for bit, value in enumerate(row[3:3 + len(HOST_FLAGS)]) if value == 'True')
+        window_size, ttl, mss = (int(value or 0) for value in row[15:18])
+        return cls(row[0], row[1], row[2], flags, row[18], window_size, ttl, mss)
+
+def _flag_property(bit: int) -> property:
+    def get(self) -> bool:
+        return bool(self.flags & bit)
     
-    # Additional Information
-    os_guess: str = ''
-    window_size: int = 0
-    ttl: int = 0
-    mss: int = 0
+    def set(self, value: bool):
+        self.flags = self.flags | bit if value else self.flags & ~bit
+        
+    return property(get, set)
+
+for _bit, _name in enumerate(HOST_FLAGS):
+    setattr(HostResult, _name, _flag_property(1 << _bit))
+del _bit, _name
+
+class HostResultWriter:
+    def __init__(self, output_file: str, skip_dead: bool = False,
+                 resume_targets: Optional[TargetSet] = None,
+                 recorder: Optional[ScanRecorder] = None):
+        # Rows are written (and line-flushed) as hosts complete, and the
+        # summary is counted on the way, so nothing is held per host.
+        # On resume the rows already in the file are counted (and recorded)
+        # again, and rows for targets that will be rescanned are not
+        # written twice.
+        self.output_file = output_file
+        self.skip_dead = skip_dead
+        self.recorder = recorder
+        self.summary = {
+            'total_scanned': 0,
+            'alive_hosts': 0,
+            'dead_hosts': 0,
+            'error_hosts': 0,
+            'detection_methods': {'icmp': 0, 'basic_tcp': 0, 'advanced_tcp': 0},
+            'os_distribution': {}
+        }
+        self._written: Set[str] = set()
+        self.lock = threading.Lock()
+        
+        append = resume_targets is not None and os.path.exists(output_file)
+        if append:
+            with open(output_file, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    if len(row) < len(CSV_HEADER):
+                        continue
+                    result = HostResult.from_row(row)
+                    self._count(result)
+                    # Recording is idempotent, and the interrupted run may
+                    # not have flushed its last rows
+                    if recorder and result.status == 'alive':
+                        recorder.add(result.ip, fields=result.fields())
+                    if result.ip in resume_targets:
+                        self._written.add(result.ip)
+                        
+        self.file = open(output_file, 'a' if append else 'w', newline='', encoding='utf-8', buffering=1)
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        if not append:
+            self.writer.writerow(CSV_HEADER)
+            
+    def _count(self, result: HostResult):
+        summary = self.summary
+        summary['total_scanned'] += 1
+        if result.status in ('alive', 'dead', 'error'):
+            summary[f'{result.status}_hosts'] += 1
+        methods = summary['detection_methods']
+        methods['icmp'] += bool(result.flags & ICMP_MASK)
+        methods['basic_tcp'] += bool(result.flags & TCP_SYN_MASK)
+        methods['advanced_tcp'] += bool(result.flags & (TCP_ADVANCED_MASK | _flag_mask('tcp_window')))
+        if result.os_guess:
+            summary['os_distribution'][result.os_guess] = summary['os_distribution'].get(result.os_guess, 0) + 1
+            
+    def add(self, result: HostResult):
+        with self.lock:
+            if self._written:
+                if result.ip in self._written:
+                    self._written.discard(result.ip)
+                    return
+            self._count(result)
+            if self.recorder and result.status == 'alive':
+                self.recorder.add(result.ip, fields=result.fields())
+            if self.skip_dead and result.status == 'dead':
+                return
+            self.writer.writerow(result.row())
+            
+    def close(self):
+        self.file.close()
+        if self.recorder:
+            self.recorder.close()
 
 class HostDiscoveryScanner:
+    # Can take its targets from a TargetStream fed by an earlier pipeline stage
+    accepts_stream = True
+
     def __init__(self):
         self.options = MODULE_INFO['options']
-        self.results: Dict[str, HostResult] = {}
+        self.writer = None
+        self.output_file = None
+        self.stop_scan = False
+        self.result_sink = None
+        self.weight = 1.0
+        self.priority = 0
+        self._allocation = None
         self.timeout = 2.5  # default timeout in seconds
         self.concurrent_hosts = 100
+        self._controller = None
+        self._limiter = None
+        # Worker thread id -> {interface: L3 socket}
+        self._sockets: Dict[int, Dict] = {}
+        self._busy: Set[int] = set()
+        self._closing = False
+        self._sockets_lock = threading.Lock()
         
     def _initialize_scanner(self):
         if os.geteuid() != 0:
@@ -123,6 +338,8 @@ class HostDiscoveryScanner:
                 try:
                     if option['type'] == 'int':
                         option['value'] = int(option['value'])
+                    elif option['type'] == 'bool':
+                        option['value'] = str(option['value']).lower() in ('true', 'yes', '1')
                 except ValueError as e:
                     logging.error(f"Invalid value for {option_name}: {e}")
                     option['value'] = None
@@ -133,15 +350,51 @@ class HostDiscoveryScanner:
         if self.options['concurrent_hosts']['value']:
             self.concurrent_hosts = self.options['concurrent_hosts']['value']
             
-    def validate_options(self):
-        if not self.options['query_id']['value'] and not self.options['input_file']['value']:
+    def validate_options(self, streaming: bool = False):
+        if not streaming and not self.options['query_id']['value'] and not self.options['input_file']['value']:
             return False, "Either query_id or input_file must be set"
             
         if self.options['input_file']['value'] and not os.path.exists(self.options['input_file']['value']):
             return False, f"Input file {self.options['input_file']['value']} does not exist"
             
+        if self.options['engine']['value'] not in ('threaded', 'batch', 'async'):
+            return False, "engine must be one of: threaded, batch, async"
+            
         return True, None
         
+    def _probe(self, packet):
+        # Each worker thread keeps its L3 sockets open for the whole scan;
+        # sr1() would open and tear down a socket for every single probe.
+        # A stopping scan sends nothing more, so running hosts end quickly.
+        if self.stop_scan or self._closing:
+            return None
+        iface = resolve_iface(packet.route()[0] or conf.iface)
+        with self._sockets_lock:
+            sockets = self._sockets.setdefault(threading.get_ident(), {})
+        sock = sockets.get(iface.name)
+        if sock is None:
+            sock = sockets[iface.name] = iface.l3socket(False)(iface=iface)
+        if self._allocation:
+            self._allocation.acquire(1)
+        return sock.sr1(packet, timeout=self.timeout, verbose=0)
+        
+    def _close_thread_sockets(self, ident: int):
+        # Called with _sockets_lock held
+        for sock in self._sockets.pop(ident, {}).values():
+            try:
+                sock.close()
+            except OSError:
+                pass
+        
+    def _close_sockets(self):
+        # Sockets of idle workers are closed here; a worker still probing
+        # closes its own once its host is done (see _scan_host_limited)
+        with self._sockets_lock:
+            self._closing = True
+            for ident in list(self._sockets):
+                if ident not in self._busy:
+                    self._close_thread_sockets(ident)
+        
     def icmp_scan(self, target: str) -> Dict[str, bool]:
         try:
             results = {
@@ -153,42 +406,26 @@ class HostDiscoveryScanner:
             }
             
             # Echo req - type 8
-            echo_reply = sr1(
-                IP(dst=target)/ICMP(type=8, code=0),
-                timeout=self.timeout,
-                verbose=0
-            )
+            echo_reply = self._probe(IP(dst=target)/ICMP(type=8, code=0))
             
             if echo_reply and echo_reply.haslayer(ICMP):
                 results['echo'] = True
                 results['ttl'] = echo_reply.ttl
                 
             # Timestamp req - type 13
-            timestamp_reply = sr1(
-                IP(dst=target)/ICMP(type=13, code=0),
-                timeout=self.timeout,
-                verbose=0
-            )
+            timestamp_reply = self._probe(IP(dst=target)/ICMP(type=13, code=0))
             
             if timestamp_reply and timestamp_reply.haslayer(ICMP):
                 results['timestamp'] = True
                 
             # Information req - type 15
-            info_reply = sr1(
-                IP(dst=target)/ICMP(type=15, code=0),
-                timeout=self.timeout,
-                verbose=0
-            )
+            info_reply = self._probe(IP(dst=target)/ICMP(type=15, code=0))
             
             if info_reply and info_reply.haslayer(ICMP):
                 results['info'] = True
                 
             # Address Mask Req - type 17
-            mask_reply = sr1(
-                IP(dst=target)/ICMP(type=17, code=0),
-                timeout=self.timeout,
-                verbose=0
-            )
+            mask_reply = self._probe(IP(dst=target)/ICMP(type=17, code=0))
             
             if mask_reply and mask_reply.haslayer(ICMP):
                 results['mask'] = True
@@ -203,24 +440,9 @@ class HostDiscoveryScanner:
             results = {}
             
             for port in ports:
-                syn_reply = sr1(
-                    IP(dst=target)/TCP(dport=port, flags="S"),
-                    timeout=self.timeout,
-                    verbose=0
-                )
+                syn_reply = self._probe(IP(dst=target)/TCP(dport=port, flags="S"))
                 
-                if syn_reply and syn_reply.haslayer(TCP):
-                    results[port] = {
-                        'open': bool(syn_reply[TCP].flags & 0x12),
-                        'window_size': syn_reply[TCP].window,
-                        'mss': (syn_reply[TCP].options[0][1] 
-                               if syn_reply[TCP].options and 
-                               len(syn_reply[TCP].options) > 0 and
-                               syn_reply[TCP].options[0][0] == 'MSS'
-                               else 0)
-                    }
-                else:
-                    results[port] = {'open': False, 'window_size': 0, 'mss': 0}
+                results[port] = self._parse_syn_reply(syn_reply)
                     
             return results
         except Exception as e:
@@ -239,42 +461,26 @@ class HostDiscoveryScanner:
             }
             
             # ACK Scan
-            ack_reply = sr1(
-                IP(dst=target)/TCP(dport=80, flags="A"),
-                timeout=self.timeout,
-                verbose=0
-            )
+            ack_reply = self._probe(IP(dst=target)/TCP(dport=80, flags="A"))
             
             if ack_reply and ack_reply.haslayer(TCP):
                 results['ack'] = True
                 results['window_size'] = ack_reply[TCP].window
                 
             # NULL Scan
-            null_reply = sr1(
-                IP(dst=target)/TCP(dport=80, flags=""),
-                timeout=self.timeout,
-                verbose=0
-            )
+            null_reply = self._probe(IP(dst=target)/TCP(dport=80, flags=""))
             
             if null_reply and null_reply.haslayer(TCP):
                 results['null'] = True
                 
             # FIN Scan
-            fin_reply = sr1(
-                IP(dst=target)/TCP(dport=80, flags="F"),
-                timeout=self.timeout,
-                verbose=0
-            )
+            fin_reply = self._probe(IP(dst=target)/TCP(dport=80, flags="F"))
             
             if fin_reply and fin_reply.haslayer(TCP):
                 results['fin'] = True
                 
             # XMAS Scan
-            xmas_reply = sr1(
-                IP(dst=target)/TCP(dport=80, flags="FPU"),
-                timeout=self.timeout,
-                verbose=0
-            )
+            xmas_reply = self._probe(IP(dst=target)/TCP(dport=80, flags="FPU"))
             
             if xmas_reply and xmas_reply.haslayer(TCP):
                 results['xmas'] = True
@@ -312,71 +518,239 @@ class HostDiscoveryScanner:
                 
         return os_guess
         
-    def scan_host(self, target: str) -> HostResult:
-        try:
-            result = HostResult(ip=target)
-            max_level = int(self.options['max_level']['value'])
+    def _parse_syn_reply(self, syn_reply) -> Dict:
+        if isinstance(syn_reply, RawReply):
+            return {'open': bool(syn_reply.flags & 0x12), 'window_size': syn_reply.window, 'mss': syn_reply.mss}
+        if syn_reply and syn_reply.haslayer(TCP):
+            return {
+                'open': bool(syn_reply[TCP].flags & 0x12),
+                'window_size': syn_reply[TCP].window,
+                'mss': (syn_reply[TCP].options[0][1] 
+                       if syn_reply[TCP].options and 
+                       len(syn_reply[TCP].options) > 0 and
+                       syn_reply[TCP].options[0][0] == 'MSS'
+                       else 0)
+            }
+        return {'open': False, 'window_size': 0, 'mss': 0}
+        
+    def _results_from_replies(self, replies: Dict, probes: List[str]) -> Tuple[Dict, Optional[Dict], Optional[Dict]]:
+        echo_reply = replies.get('icmp_echo')
+        icmp_results = {
+            'echo': echo_reply is not None,
+            'timestamp': 'icmp_timestamp' in replies,
+            'info': 'icmp_info' in replies,
+            'mask': 'icmp_mask' in replies,
+            'ttl': echo_reply.ttl if echo_reply is not None else 0
+        }
+        
+        tcp_results = {
+            port: self._parse_syn_reply(replies.get(f'syn_{port}'))
+            for port in [80, 443, 0]
+        }
+        
+        ack_reply = replies.get('ack')
+        ack_window = 0
+        if ack_reply is not None:
+            ack_window = ack_reply.window if isinstance(ack_reply, RawReply) else ack_reply[TCP].window
+        adv_results = {
+            'ack': ack_reply is not None,
+            'null': 'null' in replies,
+            'fin': 'fin' in replies,
+            'xmas': 'xmas' in replies,
+            'window': False,
+            'window_size': ack_window
+        }
+        
+        # Levels that were never probed stay unset in the result
+        if not any(probe.startswith('syn_') for probe in probes):
+            tcp_results = None
+        if 'ack' not in probes:
+            adv_results = None
+        return icmp_results, tcp_results, adv_results
+        
+    def _compose_result(self, target: str, icmp_results: Dict,
+                        tcp_results: Optional[Dict], adv_results: Optional[Dict]) -> HostResult:
+        result = HostResult(ip=target)
+        
+        # Level 1: ICMP Scans
+        result.icmp_echo = icmp_results['echo']
+        result.icmp_timestamp = icmp_results['timestamp']
+        result.icmp_info = icmp_results['info']
+        result.icmp_mask = icmp_results['mask']
+        result.ttl = icmp_results['ttl']
+        
+        if any([result.icmp_echo, result.icmp_timestamp, 
+               result.icmp_info, result.icmp_mask]):
+            result.status = 'alive'
             
-            # Level 1: ICMP Scans
-            icmp_results = self.icmp_scan(target)
-            result.icmp_echo = icmp_results['echo']
-            result.icmp_timestamp = icmp_results['timestamp']
-            result.icmp_info = icmp_results['info']
-            result.icmp_mask = icmp_results['mask']
-            result.ttl = icmp_results['ttl']
-            
-            if any([result.icmp_echo, result.icmp_timestamp, 
-                   result.icmp_info, result.icmp_mask]):
+        # Level 2: Basic TCP Scans
+        if tcp_results is not None:
+            result.tcp_syn_80 = tcp_results[80]['open']
+            result.tcp_syn_443 = tcp_results[443]['open']
+            result.tcp_syn_0 = tcp_results[0]['open']
+            
+            if any([result.tcp_syn_80, result.tcp_syn_443, result.tcp_syn_0]):
                 result.status = 'alive'
+                result.window_size = max(r['window_size'] for r in tcp_results.values())
+                result.mss = max(r['mss'] for r in tcp_results.values())
                 
-            # Level 2: Basic TCP Scans
-            if max_level >= 2:
-                tcp_results = self.tcp_syn_scan(target, [80, 443, 0])
-                
-                result.tcp_syn_80 = tcp_results[80]['open']
-                result.tcp_syn_443 = tcp_results[443]['open']
-                result.tcp_syn_0 = tcp_results[0]['open']
+        # Level 3: Advanced TCP Scans
+        if adv_results is not None:
+            result.tcp_ack = adv_results['ack']
+            result.tcp_null = adv_results['null']
+            result.tcp_fin = adv_results['fin']
+            result.tcp_xmas = adv_results['xmas']
+            result.tcp_window = adv_results['window_size'] > 0
+            
+            if any([result.tcp_ack, result.tcp_null, 
+                   result.tcp_fin, result.tcp_xmas]):
+                result.status = 'alive'
                 
-                if any([result.tcp_syn_80, result.tcp_syn_443, result.tcp_syn_0]):
-                    result.status = 'alive'
-                    result.window_size = max(r['window_size'] for r in tcp_results.values())
-                    result.mss = max(r['mss'] for r in tcp_results.values())
-                    
-            # Level 3: Advanced TCP Scans
-            if max_level >= 3:
-                adv_results = self.advanced_tcp_scan(target)
+            if adv_results['window_size'] > result.window_size:
+                result.window_size = adv_results['window_size']
                 
-                result.tcp_ack = adv_results['ack']
-                result.tcp_null = adv_results['null']
-                result.tcp_fin = adv_results['fin']
-                result.tcp_xmas = adv_results['xmas']
-                result.tcp_window = adv_results['window_size'] > 0
+        # Try to guess OS
+        if result.status == 'alive':
+            result.os_guess = self.guess_os(result.ttl, result.window_size, result.mss)
+            
+        result.discovery_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if result.status == 'unknown':
+            result.status = 'dead'
+            
+        return result
+        
+    def scan_host(self, target: str) -> HostResult:
+        try:
+            max_level = int(self.options['max_level']['value'])
+            early_exit = self.options['early_exit']['value']
+            
+            icmp_results = self.icmp_scan(target)
+            alive = early_exit and any(icmp_results[probe] for probe in ('echo', 'timestamp', 'info', 'mask'))
+            tcp_results = self.tcp_syn_scan(target, [80, 443, 0]) if max_level >= 2 and not alive else None
+            alive = alive or (early_exit and tcp_results is not None
+                              and any(r['open'] for r in tcp_results.values()))
+            adv_results = self.advanced_tcp_scan(target) if max_level >= 3 and not alive else None
+            
+            return self._compose_result(target, icmp_results, tcp_results, adv_results)
+        except Exception as e:
+            logging.error(f"Error scanning host {target}: {str(e)}")
+            return HostResult(ip=target, status='error')
+        
+    def sweep_host(self, target: str) -> HostResult:
+        try:
+            replies = {}
+            for probe in SWEEP_PROBES:
+                reply = self._probe(build_probe(target, probe))
+                if reply is not None:
+                    replies[probe] = reply
+                    if self.options['early_exit']['value']:
+                        break
+            return self._compose_result(target, *self._results_from_replies(replies, SWEEP_PROBES))
+        except Exception as e:
+            logging.error(f"Error sweeping host {target}: {str(e)}")
+            return HostResult(ip=target, status='error')
+        
+    def _run_threaded(self, ip_list: Iterable[str], scan=None):
+        scan = scan or self.scan_host
+        # Sliding window: targets are pulled from the iterator only as
+        # earlier ones finish, so at most `window` futures ever exist
+        window = self.concurrent_hosts * 2
+        targets = enumerate(ip_list)
+        in_flight = {}
+        self._closing = False
+        executor = ThreadPoolExecutor(max_workers=self.concurrent_hosts)
+        try:
+            while True:
+                for index, ip in itertools.islice(targets, window - len(in_flight)):
+                    in_flight[executor.submit(self._scan_host_limited, scan, ip)] = (index, ip)
+                if not in_flight:
+                    break
                 
-                if any([result.tcp_ack, result.tcp_null, 
-                       result.tcp_fin, result.tcp_xmas]):
-                    result.status = 'alive'
-                    
-                if adv_results['window_size'] > result.window_size:
-                    result.window_size = adv_results['window_size']
+                done, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                for future in done:
+                    index, ip = in_flight.pop(future)
+                    try:
+                        yield index, ip, future.result()
+                    except Exception as e:
+                        logging.error(f"Error scanning {ip}: {str(e)}")
+                        yield index, ip, None
+        finally:
+            # Stopped early: queued hosts are dropped rather than waited
+            # for, and hosts being probed finish without further probes
+            executor.shutdown(wait=not in_flight, cancel_futures=True)
+            self._close_sockets()
                     
-            # Try to guess OS
-            if result.status == 'alive':
-                result.os_guess = self.guess_os(result.ttl, result.window_size, result.mss)
-                
-            result.discovery_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            if result.status == 'unknown':
-                result.status = 'dead'
+    def _run_batch(self, ip_list: List[str], probes: Optional[List[str]] = None):
+        probes = probes or probes_for_level(int(self.options['max_level']['value']))
+        engine = BatchProbeEngine(
+            self.timeout,
+            batch_size=self.options['batch_size']['value'] or 1024,
+            max_pps=self.options['max_pps']['value'] or 0,
+            pacer=self._allocation.reserve if self._allocation else None
+        )
+        
+        for index, (ip, replies) in enumerate(engine.run(ip_list, probes)):
+            try:
+                yield index, ip, self._compose_result(ip, *self._results_from_replies(replies, probes))
+            except Exception as e:
+                logging.error(f"Error scanning {ip}: {str(e)}")
+                yield index, ip, None
+        
+    def _run_async(self, ip_list: Iterable[str], probes: Optional[List[str]] = None):
+        probes = probes or probes_for_level(int(self.options['max_level']['value']))
+        engine = AsyncProbeEngine(
+            self.timeout,
+            max_inflight=self.options['max_inflight']['value'] or 10000,
+            max_pps=self.options['max_pps']['value'] or 0,
+            raw_packets=self.options['raw_packets']['value'],
+            pacer=self._allocation.reserve if self._allocation else None
+        )
+        
+        for index, ip, replies in engine.run(ip_list, probes):
+            try:
+                yield index, ip, self._compose_result(ip, *self._results_from_replies(replies, probes))
+            except Exception as e:
+                logging.error(f"Error scanning {ip}: {str(e)}")
+                yield index, ip, None
                 
-            return result
-        except Exception as e:
-            logging.error(f"Error scanning host {target}: {str(e)}")
-            result.status = 'error'
-            return result
+    def _run_engine(self, ip_list: Iterable[str], sweep: bool = False):
+        engine = self.options['engine']['value']
+        if engine == 'batch':
+            return self._run_batch(ip_list, SWEEP_PROBES if sweep else None)
+        if engine == 'async':
+            return self._run_async(ip_list, SWEEP_PROBES if sweep else None)
+        return self._run_threaded(ip_list, self.sweep_host if sweep else None)
         
+    def _run_two_phase(self, ip_list: List[str]):
+        sample = self.options['sweep_sample']['value'] or 0
+        early_exit = self.options['early_exit']['value']
         
-    def scan_hosts(self, ip_list: List[str]):
+        # Phase one: hosts that need no deep probes are final right away;
+        # only responders (and sampled non-responders) are kept for phase two
+        logging.info(f"[*] Sweep phase: {'+'.join(SWEEP_PROBES)} over {len(ip_list)} hosts")
+        deep: List[Tuple[int, HostResult]] = []
+        for index, ip, result in self._run_engine(ip_list, sweep=True):
+            responded = result is not None and result.status == 'alive'
+            if responded and not early_exit or not responded and random.random() * 100 < sample:
+                deep.append((index, result or HostResult(ip=ip, status='dead')))
+            else:
+                yield index, ip, result
+                
+        logging.info(f"[*] Deep phase: {len(deep)} hosts")
+        deep_ips = [sweep_result.ip for _, sweep_result in deep]
+        for deep_index, ip, result in self._run_engine(deep_ips):
+            index, sweep_result = deep[deep_index]
+            # A lost deep probe must not turn a sweep responder dead again
+            if sweep_result.status == 'alive' and (result is None or result.status != 'alive'):
+                result = sweep_result
+            yield index, ip, result
+        
+    def scan_hosts(self, ip_list: List[str], checkpoint: Optional[Checkpoint] = None):
         total_ips = len(ip_list)
         completed = 0
+        base_cursor = checkpoint.cursor if checkpoint else 0
+        finished: List[int] = []
+        next_index = 0
         alive_count = 0
         last_update = time.time()
         update_interval = 1.0  
@@ -385,139 +759,223 @@ class HostDiscoveryScanner:
         logging.info("Status: [IP Address] [Result] [OS Guess] [Detection Method]")
         logging.info("-" * 70)
 
-        with ThreadPoolExecutor(max_workers=self.concurrent_hosts) as executor:
-            future_to_ip = {executor.submit(self.scan_host, ip): ip 
-                          for ip in ip_list}
+        if self.options['engine']['value'] == 'threaded' and self._allocation and self._allocation.sockets is not None:
+            # Every worker thread holds its own sockets, so the pool is
+            # capped by the socket share and later shrinks of the share
+            # limit how many threads probe at once
+            self.concurrent_hosts = int(self._allocation.limit('sockets', self.concurrent_hosts))
+            if not self.options['adaptive']['value']:
+                self._limiter = ConcurrencyLimiter(self.concurrent_hosts)
+                self._allocation.on_change = lambda allocation: self._limiter.set_limit(allocation.sockets)
+            logging.info(f"[*] Budget share: {self.concurrent_hosts} sockets")
             
-            for future in futures.as_completed(future_to_ip):
-                ip = future_to_ip[future]
-                try:
-                    result = future.result()
-                    self.results[ip] = result
-                    completed += 1
-                    
-                    if result.status == 'alive':
-                        alive_count += 1
-                        detection_method = []
-                        if any([result.icmp_echo, result.icmp_timestamp, result.icmp_info, result.icmp_mask]):
-                            detection_method.append("ICMP")
-                        if any([result.tcp_syn_80, result.tcp_syn_443, result.tcp_syn_0]):
-                            detection_method.append("TCP-SYN")
-                        if any([result.tcp_ack, result.tcp_null, result.tcp_fin, result.tcp_xmas]):
-                            detection_method.append("TCP-Advanced")
-                            
-                        logging.info(f"[+] {ip:15} [ALIVE] [{result.os_guess:10}] [{','.join(detection_method)}]")
-
-                    current_time = time.time()
-                    if current_time - last_update >= update_interval:
-                        progress = (completed / total_ips) * 100
-                        alive_percentage = (alive_count / completed) * 100 if completed > 0 else 0
-                        logging.info(f"\rProgress: {progress:.1f}% ({completed}/{total_ips}) | Alive: {alive_count} ({alive_percentage:.1f}%)")
-                        last_update = current_time
+        if self.options['engine']['value'] == 'threaded' and self.options['adaptive']['value']:
+            self._controller = AdaptiveRateController(self.concurrent_hosts, floor=1)
+            self._limiter = ConcurrencyLimiter(self._controller.rate)
+            logging.info(f"[*] Adaptive concurrency enabled (ceiling {self.concurrent_hosts} hosts)")
+            
+        if self.options['sweep']['value']:
+            scan_results = self._run_two_phase(ip_list)
+        else:
+            scan_results = self._run_engine(ip_list)
+        window = {'done': 0, 'alive': 0, 'errors': 0, 'best_ratio': 0.0}
 
-                except Exception as e:
-                    logging.error(f"Error scanning {ip}: {str(e)}")
+        try:
+            for index, ip, result in scan_results:
+                if result is None:
                     # Add error result to maintain consistency
-                    self.results[ip] = HostResult(ip=ip, status='error')
-                    completed += 1
+                    result = HostResult(ip=ip, status='error')
+                self.writer.add(result)
+                completed += 1
+                if self.result_sink and result.status == 'alive':
+                    self.result_sink(ip, None, result.fields())
+            
+                if result.status == 'alive':
+                    alive_count += 1
+                    detection_method = []
+                    if result.flags & ICMP_MASK:
+                        detection_method.append("ICMP")
+                    if result.flags & TCP_SYN_MASK:
+                        detection_method.append("TCP-SYN")
+                    if result.flags & TCP_ADVANCED_MASK:
+                        detection_method.append("TCP-Advanced")
+                    
+                    logging.info(f"[+] {ip:15} [ALIVE] [{result.os_guess:10}] [{','.join(detection_method)}]")
+
+                current_time = time.time()
+                if current_time - last_update >= update_interval:
+                    # A pipeline's target stream grows while it is scanned
+                    total_ips = max(len(ip_list), completed)
+                    progress = (completed / total_ips) * 100
+                    alive_percentage = (alive_count / completed) * 100 if completed > 0 else 0
+                    logging.info(f"\rProgress: {progress:.1f}% ({completed}/{total_ips}) | Alive: {alive_count} ({alive_percentage:.1f}%)")
+                    last_update = current_time
+            
+                if self._controller:
+                    self._adapt_concurrency(window, result)
+            
+                # Hosts finish out of order; the checkpoint cursor only
+                # covers the unbroken prefix of finished targets
+                if checkpoint:
+                    heapq.heappush(finished, index)
+                    while finished and finished[0] == next_index:
+                        heapq.heappop(finished)
+                        next_index += 1
+                    checkpoint.update(base_cursor + next_index)
                     
+                if self.stop_scan:
+                    break
+        finally:
+            scan_results.close()
+            
+        if checkpoint and self.stop_scan:
+            checkpoint.update(checkpoint.cursor, force=True)
+            logging.info(f"[*] Scan stopped, checkpoint saved to {checkpoint.path}")
+            
+        total_ips = max(len(ip_list), completed, 1)
         logging.info(f"\n\nScan completed: {completed}/{total_ips} hosts scanned, {alive_count} alive ({(alive_count/total_ips)*100:.1f}%)")
         logging.info("-" * 70)
                     
-    def save_results(self) -> str:
+    def _scan_host_limited(self, scan, target: str) -> HostResult:
+        ident = threading.get_ident()
+        with self._sockets_lock:
+            self._busy.add(ident)
         try:
-            if not self.options['output_file']['value']:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_file = f'host_discovery_{timestamp}.csv'
-            else:
-                output_file = self.options['output_file']['value']
-                
-            with open(output_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    'ip', 'status', 'discovery_time',
-                    'icmp_echo', 'icmp_timestamp', 'icmp_info', 'icmp_mask',
-                    'tcp_syn_80', 'tcp_syn_443', 'tcp_syn_0',
-                    'tcp_ack', 'tcp_null', 'tcp_fin', 'tcp_xmas', 'tcp_window',
-                    'window_size', 'ttl', 'mss', 'os_guess'
-                ])
-                
-                for result in self.results.values():
-                    writer.writerow([
-                        result.ip, result.status, result.discovery_time,
-                        result.icmp_echo, result.icmp_timestamp,
-                        result.icmp_info, result.icmp_mask,
-                        result.tcp_syn_80, result.tcp_syn_443, result.tcp_syn_0,
-                        result.tcp_ack, result.tcp_null, result.tcp_fin,
-                        result.tcp_xmas, result.tcp_window,
-                        result.window_size, result.ttl, result.mss,
-                        result.os_guess
-                    ])
-                    
-            return output_file
+            if not self._limiter:
+                return scan(target)
+            with self._limiter:
+                return scan(target)
+        finally:
+            with self._sockets_lock:
+                self._busy.discard(ident)
+                if self._closing:
+                    self._close_thread_sockets(ident)
+        
+    def _adapt_concurrency(self, window: Dict, result: Optional[HostResult]):
+        window['done'] += 1
+        if result is None or result.status == 'error':
+            window['errors'] += 1
+        elif result.status == 'alive':
+            window['alive'] += 1
+        if window['done'] < max(10, self._limiter.limit):
+            return
+        
+        # Send errors are loss outright. Dead hosts are normal, so silence
+        # only counts as loss when the response rate collapses compared
+        # with the best window seen so far.
+        ratio = window['alive'] / window['done']
+        losses = window['errors']
+        if window['best_ratio'] and ratio < window['best_ratio'] * 0.5:
+            losses += window['done']
+        window['best_ratio'] = max(window['best_ratio'], ratio)
+        
+        limit = self._controller.update(window['done'], window['alive'], losses)
+        if limit != self._limiter.limit:
+            self._limiter.set_limit(limit)
+            logging.info(f"[*] Concurrency adjusted to {limit} hosts")
+        window.update(done=0, alive=0, errors=0)
+        
+    def _output_file_name(self, checkpoint: Optional[Checkpoint] = None) -> str:
+        if checkpoint and checkpoint.output_file:
+            return checkpoint.output_file
+        if self.options['output_file']['value']:
+            return self.options['output_file']['value']
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f'host_discovery_{timestamp}.csv'
+        
+    def open_writer(self, resumed: Optional[Checkpoint] = None) -> HostResultWriter:
+        output_file = self.output_file or self._output_file_name()
+        try:
+            recorder = None
+            if self.options['results_db']['value']:
+                recorder = ScanRecorder(ScanResultStore(self.options['results_db']['value']),
+                                        __name__, output_file,
+                                        scan_id=resumed.scan_id if resumed else None)
+            return HostResultWriter(
+                output_file,
+                skip_dead=self.options['skip_dead']['value'],
+                resume_targets=resumed.remaining_targets() if resumed else None,
+                recorder=recorder
+            )
         except Exception as e:
-            logging.error(f"Error saving results to CSV: {str(e)}")
+            logging.error(f"Error opening CSV output: {str(e)}")
             raise
         
-    def run(self, ip_list: Optional[List[str]] = None) -> Tuple[bool, Dict]:
+    def run(self, ip_list: Optional[List[str]] = None,
+            checkpoint: Optional[Checkpoint] = None) -> Tuple[bool, Dict]:
         try:
             self._initialize_scanner()
             
-            valid, error = self.validate_options()
-            if not valid:
-                return False, {"error": error}
+            streaming = isinstance(ip_list, TargetStream)
+            if checkpoint:
+                ip_list = checkpoint.remaining_targets()
+            else:
+                valid, error = self.validate_options(streaming)
+                if not valid:
+                    return False, {"error": error}
                 
-            if not ip_list and self.options['input_file']['value']:
+            # A fully scanned checkpoint has no targets left, which must not
+            # fall back to rescanning the whole input file
+            if not ip_list and not checkpoint and self.options['input_file']['value']:
                 try:
                     with open(self.options['input_file']['value'], 'r', encoding='utf-8') as f:
                         ip_list = [line.strip() for line in f if line.strip() and not line.startswith('#')]
                 except Exception as e:
                     return False, {"error": f"Error reading input file: {str(e)}"}
                     
-            if not ip_list:
+            if not ip_list and not checkpoint:
                 return False, {"error": "No IP addresses to scan"}
                 
-            ip_list = list(dict.fromkeys(ip_list))
+            if streaming:
+                # Fed by an earlier pipeline stage; there is no fixed target
+                # list to checkpoint against
+                self.options['checkpoint_file']['value'] = None
+            elif checkpoint or self.options['checkpoint_file']['value'] or isinstance(ip_list, TargetSet):
+                # TargetSets hold unique addresses and are iterated lazily;
+                # checkpoint cursors index their sorted order
+                ip_list = targets = as_target_set(ip_list)
+            else:
+                ip_list = list(dict.fromkeys(ip_list))
             
             current_user = os.getenv('SUDO_USER') if os.getenv('SUDO_USER') else os.getenv('USER')
             logging.info(f"[+] Tarama başlatılıyor... (Kullanıcı: {current_user})")
                 
-            self.scan_hosts(ip_list)
-            
+            self.output_file = self._output_file_name(checkpoint)
+            resumed = checkpoint
+            if self.options['checkpoint_file']['value']:
+                checkpoint = open_checkpoint(__name__, self.options, targets,
+                                             self.output_file, checkpoint)
+            if checkpoint:
+                logging.info(f"[*] Checkpointing to {checkpoint.path} ({checkpoint.cursor} hosts already scanned)")
+                
             try:
-                output_file = self.save_results()
+                self.writer = self.open_writer(resumed)
             except Exception as e:
                 return False, {"error": f"Error saving results: {str(e)}"}
+            if checkpoint and self.writer.recorder:
+                checkpoint.scan_id = self.writer.recorder.scan_id
+                
+            threaded = self.options['engine']['value'] == 'threaded'
+            allocation = scheduler.register(
+                __name__, self.weight, self.priority,
+                pps=self.options['max_pps']['value'] or None,
+                sockets=self.concurrent_hosts if threaded else 3
+            )
+            try:
+                with allocation as self._allocation:
+                    if ip_list:
+                        self.scan_hosts(ip_list, checkpoint)
+            finally:
+                self._allocation = None
+                self.writer.close()
             
-            alive_hosts = len([r for r in self.results.values() if r.status == 'alive'])
-            dead_hosts = len([r for r in self.results.values() if r.status == 'dead'])
-            error_hosts = len([r for r in self.results.values() if r.status == 'error'])
-            
-            detection_methods = {
-                'icmp': len([r for r in self.results.values() 
-                           if any([r.icmp_echo, r.icmp_timestamp, 
-                                 r.icmp_info, r.icmp_mask])]),
-                'basic_tcp': len([r for r in self.results.values() 
-                                if any([r.tcp_syn_80, r.tcp_syn_443, r.tcp_syn_0])]),
-                'advanced_tcp': len([r for r in self.results.values() 
-                                   if any([r.tcp_ack, r.tcp_null, r.tcp_fin, 
-                                         r.tcp_xmas, r.tcp_window])])
-            }
+            if checkpoint and not self.stop_scan:
+                checkpoint.remove()
             
-            os_stats = {}
-            for r in self.results.values():
-                if r.os_guess:
-                    os_stats[r.os_guess] = os_stats.get(r.os_guess, 0) + 1
-            
-            summary = {
-                'total_scanned': len(self.results),
-                'alive_hosts': alive_hosts,
-                'dead_hosts': dead_hosts,
-                'error_hosts': error_hosts,
-                'detection_methods': detection_methods,
-                'os_distribution': os_stats,
-                'output_file': output_file
-            }
+            summary = dict(self.writer.summary, output_file=self.output_file)
+            if self.writer.recorder:
+                summary['scan_id'] = self.writer.recorder.scan_id
+                logging.info(f"[+] Alive hosts stored as scan {summary['scan_id']} in {self.options['results_db']['value']}")
             
             return True, summary
             
@@ -525,6 +983,9 @@ class HostDiscoveryScanner:
             logging.error(f"Error in run(): {str(e)}")
             return False, {"error": str(e)}
 
+    def stop(self):
+        self.stop_scan = True
+
 def create_instance():
     scanner = HostDiscoveryScanner()
     return scanner
\ No newline at end of file
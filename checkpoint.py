@@ -0,0 +1,100 @@
+import json
+import os
+import time
+from typing import Dict, Iterator, Optional
+
+from targets import TargetSet
+
+
+class Checkpoint:
+    def __init__(self, path: str, module: str = None, options: Optional[Dict] = None,
+                 targets: Optional[TargetSet] = None, cursor: int = 0,
+                 output_file: Optional[str] = None, interval: float = 30.0,
+                 scan_id: Optional[int] = None):
+        # cursor counts target addresses, in TargetSet order, that are fully
+        # scanned; a resumed run starts right after them. Results are not
+        # kept here: they are already in output_file, which a resumed run
+        # replays, so the state file stays small however much is found.
+        # scan_id is the results database scan a streaming recorder keeps
+        # appending to.
+        self.path = path
+        self.module = module
+        self.options = options or {}
+        self.targets = targets or TargetSet()
+        self.cursor = cursor
+        self.output_file = output_file
+        self.scan_id = scan_id
+        self.interval = interval
+        self.last_save = 0.0
+
+    @classmethod
+    def load(cls, path: str) -> 'Checkpoint':
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        return cls(
+            path,
+            module=state['module'],
+            options=state.get('options', {}),
+            targets=TargetSet(tuple(r) for r in state.get('ranges', [])),
+            cursor=state.get('cursor', 0),
+            output_file=state.get('output_file'),
+            scan_id=state.get('scan_id')
+        )
+
+    def output_lines(self) -> Iterator[str]:
+        # What the interrupted run wrote; nothing when it never got past
+        # the first cursor step (the output file is then started over)
+        if not self.cursor or not self.output_file or not os.path.exists(self.output_file):
+            return
+        with open(self.output_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield line
+
+    def remaining_targets(self) -> TargetSet:
+        return self.targets.skip(self.cursor)
+
+    def update(self, cursor: int, force: bool = False) -> None:
+        self.cursor = cursor
+        if not force and time.monotonic() - self.last_save < self.interval:
+            return
+        self.save()
+
+    def save(self) -> None:
+        state = {
+            'module': self.module,
+            'options': self.options,
+            'ranges': self.targets.ranges,
+            'cursor': self.cursor,
+            'total': len(self.targets),
+            'output_file': self.output_file,
+            'scan_id': self.scan_id,
+            'saved_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        # Write-then-rename so a crash mid-save never leaves a torn file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.monotonic()
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def open_checkpoint(module: str, options: Dict, targets: TargetSet, output_file: str,
+                    checkpoint: Optional[Checkpoint] = None) -> Optional[Checkpoint]:
+    if checkpoint:
+        return checkpoint
+    path = options.get('checkpoint_file', {}).get('value')
+    if not path:
+        return None
+    return Checkpoint(
+        path,
+        module=module,
+        options={name: option['value'] for name, option in options.items()},
+        targets=targets,
+        output_file=output_file
+    )
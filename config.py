@@ -1 +1,6 @@
-IP2LOCATION_TOKEN = ""
\ No newline at end of file
+IP2LOCATION_TOKEN = ""
+
+# Global budget shared by all modules and background jobs (0 = unlimited);
+# can be changed at runtime with the console's 'budget' command
+MAX_PPS = 0
+MAX_SOCKETS = 0
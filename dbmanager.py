@@ -3,6 +3,7 @@ import requests
 import zipfile
 import os
 import hashlib
+import json
 from io import BytesIO
 import csv
 import logging
@@ -13,6 +14,7 @@ logger = logging.getLogger(__name__)
 class IP2LocationUpdater:
     def __init__(self, db_path="ip2location.db"):
         self.db_path = db_path
+        self.stamp_path = f"{db_path}.stamp"
         
     def _calculate_file_hash(self, file_content):
         return hashlib.sha256(file_content).hexdigest()
@@ -63,10 +65,50 @@ class IP2LocationUpdater:
             csv_file = BytesIO(csv_content)
             csv_reader = csv.reader(csv_file.getvalue().decode('utf-8').splitlines())
             
-            conn.executemany(
+            cursor = conn.executemany(
                 "INSERT INTO ip2location VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (tuple(row) for row in csv_reader)
             )
+            # Built after the bulk insert
+            self._create_indexes(conn)
+            return cursor.rowcount
+            
+    def _create_indexes(self, conn):
+        # Lets result enrichment seek to and walk the ranges in address
+        # order. Also run on databases imported before it existed.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_ip2location_ip_to ON ip2location (ip_to)")
+            
+    def _write_stamp(self, row_count):
+        # mtime/size of the validated database file; as long as they still
+        # match, ensure_database_exists trusts it without touching the tables
+        stat = os.stat(self.db_path)
+        with open(self.stamp_path, 'w') as f:
+            json.dump({
+                'mtime_ns': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'row_count': row_count,
+                'indexed': True
+            }, f)
+            
+    def _stamp_matches(self):
+        try:
+            with open(self.stamp_path, 'r') as f:
+                stamp = json.load(f)
+            stat = os.stat(self.db_path)
+        except (OSError, ValueError):
+            return False
+        # Stamps from before the indexes existed send the database through
+        # the full check once, which builds them
+        return (stamp.get('mtime_ns') == stat.st_mtime_ns
+                and stamp.get('size') == stat.st_size
+                and stamp.get('row_count', 0) > 0
+                and stamp.get('indexed', False))
+            
+    def _stored_row_count(self, conn):
+        row = conn.execute("SELECT value FROM metadata WHERE key = 'row_count'").fetchone()
+        if row:
+            return int(row[0])
+        return conn.execute("SELECT COUNT(*) FROM ip2location").fetchone()[0]
             
     def update_database(self, token):
         logger.info("Downloading IP2Location database...")
@@ -81,8 +123,11 @@ class IP2LocationUpdater:
                 ).fetchone()
                 
                 if stored_hash and stored_hash[0] == file_hash:
-                    count = conn.execute("SELECT COUNT(*) FROM ip2location").fetchone()[0]
+                    count = self._stored_row_count(conn)
                     if count > 0:
+                        self._create_indexes(conn)
+                        conn.commit()
+                        self._write_stamp(count)
                         logger.info("Database is already up to date")
                         return False
             except sqlite3.OperationalError:
@@ -95,11 +140,12 @@ class IP2LocationUpdater:
         self._create_database()
         
         logger.info("Importing data...")
-        self._import_csv_to_db(csv_content)
+        row_count = self._import_csv_to_db(csv_content)
         
         with sqlite3.connect(self.db_path) as conn:
-            conn.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
-                        ('file_hash', file_hash))
+            conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                            [('file_hash', file_hash), ('row_count', str(row_count))])
+        self._write_stamp(row_count)
         
         logger.info("Database update completed")
         return True
@@ -109,7 +155,11 @@ class IP2LocationUpdater:
         
         if not os.path.exists(self.db_path):
             need_update = True
+        elif self._stamp_matches():
+            return True
         else:
+            # The file changed since it was last validated (or was never
+            # stamped), so check the tables for real once and re-stamp
             try:
                 with sqlite3.connect(self.db_path) as conn:
                     try:
@@ -120,8 +170,14 @@ class IP2LocationUpdater:
                         metadata_count = conn.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
                         if metadata_count == 0:
                             need_update = True
+                        if not need_update:
+                            self._create_indexes(conn)
                     except sqlite3.OperationalError:
                         need_update = True
+                # After the connection is closed: building the index
+                # changed the file's mtime/size
+                if not need_update:
+                    self._write_stamp(count)
             except sqlite3.DatabaseError:
                 need_update = True
                 os.remove(self.db_path)
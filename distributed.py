@@ -0,0 +1,452 @@
+import copy
+import hmac
+import importlib
+import json
+import os
+import re
+import secrets
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from results_db import ScanResultStore
+from scan_results import ScanResultAggregator
+from targets import TargetSet, as_target_set
+
+DEFAULT_ADDRESS = '127.0.0.1:7700'
+
+# Workers read the coordinator's token from here
+TOKEN_ENV = 'LOCUS_TOKEN'
+
+# Leases may only name the console's own modules
+MODULE_NAME = re.compile(r'^[A-Za-z_]\w*_module$')
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Messages are JSON objects, one per line. A worker sends 'hello' (with the
+# coordinator's token) once and then 'next' whenever it is idle; the
+# coordinator answers 'next' with a 'lease' (a shard to scan), 'wait'
+# (nothing free right now) or 'done', and a bad hello with 'error'.
+# While scanning, the worker streams 'result' lines and 'heartbeat's for
+# its lease, and ends the shard with 'complete'.
+
+
+def parse_address(address: str):
+    # 'unix:/path/to.sock' or 'host:port'
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '0.0.0.0', int(port))
+
+
+class Connection:
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.lock = threading.Lock()
+
+    def send(self, message: Dict):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        with self.lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def receive(self) -> Optional[Dict]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+
+class Shard:
+    __slots__ = ('id', 'targets', 'attempts', 'worker', 'expires', 'status', 'error')
+
+    def __init__(self, shard_id: int, targets: TargetSet):
+        self.id = shard_id
+        self.targets = targets
+        self.attempts = 0
+        self.worker = None
+        self.expires = 0.0
+        self.status = 'pending'
+        self.error = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.coordinator.serve_worker(Connection(self.rfile, self.wfile))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class Coordinator:
+    def __init__(self, module_id: str, options: Dict, address: str = DEFAULT_ADDRESS,
+                 shard_size: int = 65536, lease_timeout: float = 120.0, max_attempts: int = 3,
+                 local_workers: int = 0, token: Optional[str] = None):
+        # Splits the targets into shards and leases them to whichever worker
+        # asks next. A lease runs out when its worker stops heartbeating or
+        # disconnects; the shard then goes back to the queue until it has
+        # been tried max_attempts times. Results stream into one aggregator,
+        # which also drops the duplicates a retried shard reports. Workers
+        # must present token (a random one unless given) in their hello.
+        self.module_id = module_id
+        self.token = token or secrets.token_urlsafe(16)
+        self.options = copy.deepcopy(options)
+        self.address = address
+        self.shard_size = max(1, int(shard_size))
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max(1, int(max_attempts))
+        self.local_workers = max(0, int(local_workers))
+        self.processes = []
+        self.shards: Dict[int, Shard] = {}
+        self.pending = deque()
+        self.workers = set()
+        self.results = ScanResultAggregator()
+        self.condition = threading.Condition()
+        self.stop_scan = False
+        self.server = None
+
+    @property
+    def progress(self) -> Dict:
+        with self.condition:
+            counts = {'shards': len(self.shards), 'workers': len(self.workers)}
+            for shard in self.shards.values():
+                counts[shard.status] = counts.get(shard.status, 0) + 1
+            return counts
+
+    def _finished(self) -> bool:
+        return self.stop_scan or all(shard.status in ('done', 'failed') for shard in self.shards.values())
+
+    def _release(self, shard: Shard, error: str):
+        # Called with the condition held
+        shard.worker = None
+        shard.error = error
+        if shard.attempts >= self.max_attempts:
+            shard.status = 'failed'
+            print(f"[-] Shard {shard.id} failed after {shard.attempts} attempt(s): {error}")
+        else:
+            shard.status = 'pending'
+            self.pending.append(shard)
+        self.condition.notify_all()
+
+    def _reclaim_expired(self):
+        now = time.monotonic()
+        for shard in self.shards.values():
+            if shard.status == 'leased' and shard.expires < now:
+                self._release(shard, f"lease expired on worker {shard.worker}")
+
+    def lease(self, worker: str) -> Optional[Shard]:
+        with self.condition:
+            self._reclaim_expired()
+            if self.stop_scan or not self.pending:
+                return None
+            shard = self.pending.popleft()
+            shard.status = 'leased'
+            shard.worker = worker
+            shard.attempts += 1
+            shard.expires = time.monotonic() + self.lease_timeout
+            return shard
+
+    def heartbeat(self, shard_id: int, worker: str):
+        with self.condition:
+            shard = self.shards.get(shard_id)
+            if shard and shard.status == 'leased' and shard.worker == worker:
+                shard.expires = time.monotonic() + self.lease_timeout
+
+    def complete(self, shard_id: int, worker: str, success: bool, error: Optional[str] = None):
+        with self.condition:
+            shard = self.shards.get(shard_id)
+            if not shard or shard.status in ('done', 'failed'):
+                return
+            if success:
+                # Also accepted from a worker whose lease already expired:
+                # its results are just as good
+                shard.status = 'done'
+                shard.worker = None
+                self.condition.notify_all()
+            elif shard.worker == worker:
+                self._release(shard, error or 'scan failed')
+
+    def serve_worker(self, conn: Connection):
+        hello = conn.receive()
+        if not hello or hello.get('type') != 'hello':
+            return
+        worker = str(hello.get('worker'))
+        if not hmac.compare_digest(str(hello.get('token') or '').encode('utf-8'), self.token.encode('utf-8')):
+            print(f"[-] Worker {worker} rejected: bad token")
+            conn.send({'type': 'error', 'error': 'authentication failed'})
+            return
+        with self.condition:
+            self.workers.add(worker)
+        print(f"[+] Worker {worker} connected")
+
+        try:
+            while True:
+                message = conn.receive()
+                if message is None:
+                    break
+                kind = message.get('type')
+                if kind == 'result':
+                    self.results.add(message['ip'], message.get('port'), message.get('fields'))
+                elif kind == 'heartbeat':
+                    self.heartbeat(message['shard'], worker)
+                elif kind == 'complete':
+                    self.complete(message['shard'], worker, message.get('success', False), message.get('error'))
+                elif kind == 'next':
+                    shard = self.lease(worker)
+                    if shard:
+                        conn.send({
+                            'type': 'lease',
+                            'shard': shard.id,
+                            'module': self.module_id,
+                            'options': {name: option.get('value') for name, option in self.options.items()},
+                            'ranges': shard.targets.ranges,
+                            'lease_timeout': self.lease_timeout
+                        })
+                    else:
+                        with self.condition:
+                            finished = self._finished()
+                        conn.send({'type': 'done'} if finished else {'type': 'wait', 'delay': 1.0})
+                        if finished:
+                            break
+        except (OSError, ValueError) as e:
+            print(f"[-] Worker {worker} connection error: {str(e)}")
+        finally:
+            # Whatever this worker still held goes back to the queue now
+            # instead of waiting for the lease to run out
+            with self.condition:
+                self.workers.discard(worker)
+                for shard in self.shards.values():
+                    if shard.status == 'leased' and shard.worker == worker:
+                        self._release(shard, f"worker {worker} disconnected")
+            print(f"[*] Worker {worker} disconnected")
+
+    def _start_server(self):
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = _UnixServer(address, _Handler)
+        else:
+            self.server = _TCPServer(address, _Handler)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, name='locus-coordinator', daemon=True).start()
+
+    def _spawn_workers(self):
+        # Worker processes on this machine, for spreading a scan over cores
+        locus = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locus.py')
+        for _ in range(self.local_workers):
+            self.processes.append(subprocess.Popen(
+                [sys.executable, locus, '--worker', self.address],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                env=dict(os.environ, **{TOKEN_ENV: self.token})
+            ))
+
+    def _reap_workers(self):
+        for process in self.processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.terminate()
+        self.processes = []
+
+    def run(self, ip_list=None) -> Tuple[bool, object]:
+        self.stop_scan = False
+        if not ip_list:
+            return False, "No IP addresses to scan"
+        targets = as_target_set(ip_list)
+        self.shards = {
+            shard_id: Shard(shard_id, chunk)
+            for shard_id, chunk in enumerate(targets.chunks(self.shard_size), 1)
+        }
+        self.pending = deque(self.shards.values())
+
+        try:
+            self._start_server()
+        except OSError as e:
+            return False, f"Cannot listen on {self.address}: {str(e)}"
+        print(f"[*] Coordinating {len(targets)} addresses in {len(self.shards)} shard(s) on {self.address}")
+        self._spawn_workers()
+
+        try:
+            with self.condition:
+                while not self._finished():
+                    self.condition.wait(timeout=1.0)
+                    self._reclaim_expired()
+            # Give idle workers the chance to hear 'done' on their next poll
+            time.sleep(1.5)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            self._reap_workers()
+            family, address = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.unlink(address)
+
+        if self.stop_scan:
+            return False, "Scan stopped by user"
+        failed = [shard for shard in self.shards.values() if shard.status == 'failed']
+        for shard in failed:
+            print(f"[-] shard {shard.id}: {shard.error}")
+        if failed and not self.results:
+            return False, f"{len(failed)} shard(s) failed"
+        print(f"[+] {len(self.shards) - len(failed)}/{len(self.shards)} shard(s) completed")
+        # Stored once for the whole job; workers don't store their shards
+        results_db = self.options.get('results_db', {}).get('value')
+        if results_db and self.results:
+            scan_id = ScanResultStore(results_db).record(self.module_id, self.results)
+            print(f"[+] Results stored as scan {scan_id} in {results_db}")
+        return True, self.results
+
+    def stop(self):
+        with self.condition:
+            self.stop_scan = True
+            self.condition.notify_all()
+
+
+class Worker:
+    def __init__(self, address: str = DEFAULT_ADDRESS, name: Optional[str] = None,
+                 retry_interval: float = 2.0, connect_attempts: int = 30,
+                 token: Optional[str] = None):
+        self.address = address
+        self.token = os.environ.get(TOKEN_ENV, '') if token is None else token
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.retry_interval = retry_interval
+        self.connect_attempts = connect_attempts
+        self.instance = None
+        self.stop_scan = False
+
+    def _connect(self) -> socket.socket:
+        family, address = parse_address(self.address)
+        if family == socket.AF_INET and address[0] == '0.0.0.0':
+            address = ('127.0.0.1', address[1])
+        for attempt in range(self.connect_attempts):
+            try:
+                return socket.create_connection(address) if family == socket.AF_INET \
+                    else self._connect_unix(address)
+            except OSError:
+                if attempt == self.connect_attempts - 1:
+                    raise
+                time.sleep(self.retry_interval)
+
+    @staticmethod
+    def _connect_unix(path: str) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _shard_options(self, module, lease: Dict) -> Dict:
+        options = copy.deepcopy(module.MODULE_INFO['options'])
+        for name, value in lease['options'].items():
+            if name in options:
+                options[name]['value'] = value
+        # The shard is passed as the module's ip_list; the coordinator does
+        # the bookkeeping, so no input file and no checkpoint here, and one
+        # output file per shard
+        if 'input_file' in options:
+            options['input_file']['value'] = None
+        if 'query_id' in options:
+            options['query_id']['value'] = f"shard_{lease['shard']}"
+        if 'checkpoint_file' in options:
+            options['checkpoint_file']['value'] = None
+        if 'results_db' in options:
+            options['results_db']['value'] = None
+        if 'output_file' in options:
+            base, ext = os.path.splitext(options['output_file']['value'] or f"{lease['module']}_results.txt")
+            options['output_file']['value'] = f"{base}_shard{lease['shard']}{ext}"
+        return options
+
+    @staticmethod
+    def _load_module(name) -> object:
+        # Never an arbitrary import named by whoever is on the other end
+        if not MODULE_NAME.match(str(name)) or not os.path.isfile(os.path.join(MODULE_DIR, f"{name}.py")):
+            raise ValueError(f"Refusing to load module '{name}'")
+        return importlib.import_module(name)
+
+    def _scan(self, conn: Connection, lease: Dict):
+        shard_id = lease['shard']
+        try:
+            module = self._load_module(lease['module'])
+        except (ValueError, ImportError) as e:
+            conn.send({'type': 'complete', 'shard': shard_id, 'success': False, 'error': str(e)})
+            print(f"[-] Shard {shard_id} failed: {str(e)}")
+            return
+        self.instance = module.create_instance()
+        self.instance.options = self._shard_options(module, lease)
+
+        def result_sink(ip, port=None, fields=None):
+            message = {'type': 'result', 'shard': shard_id, 'ip': ip, 'port': port}
+            if fields:
+                message['fields'] = fields
+            conn.send(message)
+
+        self.instance.result_sink = result_sink
+
+        running = threading.Event()
+        running.set()
+
+        def heartbeat():
+            interval = max(1.0, lease['lease_timeout'] / 3)
+            while running.is_set():
+                time.sleep(interval)
+                if running.is_set():
+                    conn.send({'type': 'heartbeat', 'shard': shard_id})
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            success, result = self.instance.run(TargetSet(tuple(r) for r in lease['ranges']))
+        except Exception as e:
+            success, result = False, str(e)
+        finally:
+            running.clear()
+            self.instance = None
+
+        error = None
+        if not success:
+            error = result.get('error') if isinstance(result, dict) else str(result)
+        conn.send({'type': 'complete', 'shard': shard_id, 'success': bool(success), 'error': error})
+        print(f"[{'+' if success else '-'}] Shard {shard_id} {'done' if success else 'failed: ' + str(error)}")
+
+    def run(self) -> bool:
+        sock = self._connect()
+        conn = Connection(sock.makefile('rb'), sock.makefile('wb'))
+        print(f"[*] Worker {self.name} connected to {self.address}")
+        try:
+            conn.send({'type': 'hello', 'worker': self.name, 'token': self.token})
+            while not self.stop_scan:
+                conn.send({'type': 'next'})
+                message = conn.receive()
+                if message is None or message['type'] == 'done':
+                    break
+                if message['type'] == 'error':
+                    print(f"[-] Worker {self.name}: {message.get('error')} (set {TOKEN_ENV} to the coordinator's token)")
+                    return False
+                if message['type'] == 'wait':
+                    time.sleep(message.get('delay', 1.0))
+                    continue
+                self._scan(conn, message)
+            return True
+        except (OSError, ValueError) as e:
+            print(f"[-] Worker {self.name}: {str(e)}")
+            return False
+        finally:
+            sock.close()
+
+    def stop(self):
+        self.stop_scan = True
+        if self.instance:
+            self.instance.stop()
@@ -8,6 +8,29 @@ class IP2LocationQuery:
     def _int_to_ip(self, ip_int):
         return str(ipaddress.IPv4Address(ip_int))
     
+    def iter_location_ranges(self, start_ip=0):
+        # (ip_from, ip_to, location) in address order, from the range
+        # holding start_ip on; fetched lazily so a merge join only reads
+        # as far as it needs. Ranges don't overlap, so ip_to order is
+        # ip_from order and the ip_to index serves both the seek and sort.
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute("""
+                SELECT 
+                    ip_from, ip_to,
+                    city_name, region_name,
+                    country_name, country_code
+                FROM ip2location
+                WHERE ip_to >= ?
+                ORDER BY ip_to
+            """, (int(start_ip),))
+            for ip_from, ip_to, city, region, country, country_code in cursor:
+                yield int(ip_from), int(ip_to), {
+                    'city': city,
+                    'region': region,
+                    'country': country,
+                    'country_code': country_code
+                }
+    
     def search_by_city(self, city_name):
         with sqlite3.connect(self.db_path) as conn:
             conn.row_factory = sqlite3.Row
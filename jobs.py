@@ -0,0 +1,121 @@
+import copy
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+
+class Job:
+    def __init__(self, job_id: int, module_id: str, instance, options: Dict, targets,
+                 weight: float = 1.0, priority: int = 0):
+        self.id = job_id
+        self.module_id = module_id
+        self.instance = instance
+        self.options = options
+        self.targets = targets
+        self.weight = weight
+        self.priority = priority
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.success = None
+        self.result = None
+        self.future = None
+
+    @property
+    def runtime(self) -> float:
+        if not self.started:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobManager:
+    def __init__(self, max_concurrent: int = 2, on_finish=None):
+        # At most max_concurrent module runs execute at once; later jobs
+        # wait in the executor queue as 'queued' until a slot frees up
+        self.max_concurrent = max(1, max_concurrent)
+        self.on_finish = on_finish
+        self.jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent,
+                                            thread_name_prefix='locus-job')
+
+    def submit(self, module_id: str, module, options: Dict, targets,
+               weight: float = 1.0, priority: int = 0) -> Job:
+        # Each job gets its own copy of the options, so changing them (or
+        # starting another run of the same module) cannot affect it
+        instance = module.create_instance()
+        instance.options = copy.deepcopy(options)
+        # The job's share of the global pps/socket budget (budget.py)
+        instance.weight, instance.priority = weight, priority
+        return self.submit_instance(module_id, instance, targets, weight, priority)
+
+    def submit_instance(self, module_id: str, instance, targets,
+                        weight: float = 1.0, priority: int = 0) -> Job:
+        # For runners that already hold their own options, like a Pipeline
+        with self._lock:
+            job = Job(next(self._ids), module_id, instance, instance.options, targets, weight, priority)
+            self.jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: Job):
+        if job.status == 'killed':
+            return
+        job.status = 'running'
+        job.started = time.time()
+        try:
+            job.success, job.result = job.instance.run(job.targets)
+        except Exception as e:
+            job.success, job.result = False, {"error": str(e)}
+        job.finished = time.time()
+        if job.status == 'stopping':
+            job.status = 'killed'
+        else:
+            job.status = 'done' if job.success else 'failed'
+        if self.on_finish:
+            self.on_finish(job)
+
+    def get(self, job_id) -> Optional[Job]:
+        try:
+            return self.jobs.get(int(job_id))
+        except (TypeError, ValueError):
+            return None
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self.jobs.values(), key=lambda job: job.id)
+
+    def kill(self, job_id) -> bool:
+        job = self.get(job_id)
+        if job is None or job.status not in ('queued', 'running'):
+            return False
+        if job.future.cancel():
+            job.status = 'killed'
+            job.finished = time.time()
+            return True
+        stop = getattr(job.instance, 'stop', None)
+        if stop is None:
+            return False
+        job.status = 'stopping'
+        stop()
+        return True
+
+    def active(self) -> List[Job]:
+        return [job for job in self.list() if not job.future.done()]
+
+    def wait(self):
+        # Until every submitted job has finished (or been killed)
+        while True:
+            active = self.active()
+            if not active:
+                return
+            wait([job.future for job in active])
+
+    def shutdown(self):
+        for job in self.active():
+            self.kill(job.id)
+        self._executor.shutdown(wait=False)
@@ -1,6 +1,10 @@
 import argparse
+import contextlib
+import json
 import shlex
 import ipaddress
+import sys
+import threading
 from rich.console import Console
 from rich.table import Table
 from rich import box
@@ -8,6 +12,7 @@ from dbmanager import IP2LocationUpdater
 from ip2location_query import IP2LocationQuery
 from config import IP2LOCATION_TOKEN
 from ui_console import InteractiveConsole
+from distributed import Worker
 from colorama import init, Fore, Style
 
 
@@ -74,6 +79,11 @@ def process_args(args_str=None):
     parser.add_argument('--country', help='Search by country name')
     parser.add_argument('--country-code', help='Search by country code (e.g., US, TR)')
     parser.add_argument('--region', help='Search by region/state name')
+    parser.add_argument('--script', metavar='FILE', help='Run console commands from FILE (one per line) without the prompt')
+    parser.add_argument('--exec', dest='exec_commands', metavar='COMMANDS',
+                        help='Run ";"-separated console commands without the prompt')
+    parser.add_argument('--worker', metavar='ADDRESS',
+                        help='Scan shards for a coordinator at host:port or unix:/path (see "distribute")')
     
     if args_str:
         try:
@@ -87,7 +97,7 @@ def process_args(args_str=None):
 
 def handle_command(args, console=None):
     if not args:
-        return
+        return False
     
     try:
         updater = IP2LocationUpdater()
@@ -98,11 +108,11 @@ def handle_command(args, console=None):
                 print("[+] Database updated successfully")
             else:
                 print("[*] Database is already up to date")
-            return
+            return True
         
         if not updater.ensure_database_exists(IP2LOCATION_TOKEN):
             print("[-] Failed to create/verify database")
-            return
+            return False
         
         query = IP2LocationQuery()
         results = None
@@ -130,11 +140,13 @@ def handle_command(args, console=None):
             display_results(results)
             if console:
                 console.store_query_results(query_type, query_value, results)
-        else:
-            print("[-] No results found")
+            return True
+        print("[-] No results found")
+        return False
             
     except Exception as e:
         print(f"[-] Error: {str(e)}")
+        return False
 
 
 
@@ -164,8 +176,90 @@ ____-###::^-..
     """
     print(banner)
 
+def split_commands(text):
+    # Commands end at a newline or at a ';' outside quotes; lines starting
+    # with '#' are comments
+    commands = []
+    for line in text.splitlines():
+        if line.strip().startswith('#'):
+            continue
+        current = ''
+        quote = None
+        for char in line:
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ('"', "'"):
+                quote = char
+            elif char == ';':
+                commands.append(current)
+                current = ''
+                continue
+            current += char
+        commands.append(current)
+    return [command.strip() for command in commands if command.strip()]
+
+def run_headless(commands):
+    # Every command's outcome is written to stdout as one JSON line, and
+    # everything meant for a human (tables, module output) goes to stderr.
+    # Stops at the first failing command; exits 0 only if all succeeded.
+    out = sys.stdout
+    lock = threading.Lock()
+    
+    def emit(record):
+        with lock:
+            out.write(json.dumps(record, default=str) + '\n')
+            out.flush()
+    
+    failed = False
+    with contextlib.redirect_stdout(sys.stderr):
+        console = InteractiveConsole(interactive=False)
+        console.emit = emit
+        
+        for command in commands:
+            console.error_message = None
+            console.last_result = None
+            
+            result = console.process_command(command)
+            success = console.error_message is None
+            if result:
+                success = handle_command(process_args(result), console) and success
+            
+            emit({'command': command, 'success': success,
+                  'error': console.error_message, 'result': console.last_result})
+            if not success:
+                failed = True
+                break
+            if not console.running:
+                break
+        
+        # Background jobs ('run -j') report their own JSON line when done
+        if not failed:
+            console.jobs.wait()
+            failed = any(job.status != 'done' for job in console.jobs.list())
+        else:
+            console.jobs.shutdown()
+    
+    return 1 if failed else 0
+
 def main():
     args = process_args()
+    
+    if args.worker:
+        sys.exit(0 if Worker(args.worker).run() else 1)
+    
+    if args.script or args.exec_commands:
+        if args.script:
+            try:
+                with open(args.script, 'r', encoding='utf-8') as f:
+                    commands = split_commands(f.read())
+            except OSError as e:
+                print(f"[-] Error reading script: {str(e)}", file=sys.stderr)
+                sys.exit(2)
+        else:
+            commands = split_commands(args.exec_commands)
+        sys.exit(run_headless(commands))
+    
     console = InteractiveConsole()
     
     if args and (args.city or args.country or args.country_code or args.region or args.update):
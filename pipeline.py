@@ -0,0 +1,158 @@
+import copy
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from scan_results import ScanResultAggregator
+from targets import TargetSet
+
+_CLOSED = object()
+
+
+class TargetStream:
+    def __init__(self):
+        # Addresses found by an upstream stage, in arrival order and without
+        # duplicates. The downstream module iterates it like an ip_list and
+        # blocks until more arrive or the upstream stage finishes.
+        self._queue = queue.Queue()
+        self._seen = set()
+        self._lock = threading.Lock()
+        self.count = 0
+        self.closed = False
+
+    def put(self, ip: str, port: Optional[int] = None, fields: Optional[Dict] = None) -> None:
+        with self._lock:
+            if self.closed or ip in self._seen:
+                return
+            self._seen.add(ip)
+            self.count += 1
+        self._queue.put(ip)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        self._queue.put(_CLOSED)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __bool__(self) -> bool:
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            ip = self._queue.get()
+            if ip is _CLOSED:
+                self._queue.put(_CLOSED)
+                return
+            yield ip
+
+    def batches(self, size: int, linger: float = 2.0) -> Iterator[TargetSet]:
+        # A batch is handed on when it is full or when nothing new has
+        # arrived for `linger` seconds, so a trickle still gets scanned
+        batch = []
+        while True:
+            try:
+                ip = self._queue.get(timeout=linger if batch else None)
+            except queue.Empty:
+                yield TargetSet.from_ip_list(batch)
+                batch = []
+                continue
+            if ip is _CLOSED:
+                self._queue.put(_CLOSED)
+                if batch:
+                    yield TargetSet.from_ip_list(batch)
+                return
+            batch.append(ip)
+            if len(batch) >= size:
+                yield TargetSet.from_ip_list(batch)
+                batch = []
+
+
+class Pipeline:
+    def __init__(self, stages: List[Tuple[str, object, Dict]], locator=None):
+        # stages: (module_id, module, options). Every stage runs at the same
+        # time on its own instance and options copy; each result a stage
+        # reports through result_sink becomes a target of the next stage,
+        # and the last stage's results are collected (and located).
+        self.stages = []
+        for index, (module_id, module, options) in enumerate(stages):
+            instance = module.create_instance()
+            if index and not getattr(instance, 'accepts_stream', False):
+                raise ValueError(f"Module '{module_id}' cannot take targets from another module")
+            instance.options = copy.deepcopy(options)
+            self.stages.append((module_id, instance))
+        self.locator = locator
+        self.options = {
+            f"{module_id}.{name}": option
+            for module_id, instance in self.stages
+            for name, option in instance.options.items()
+        }
+        self.streams: List[TargetStream] = []
+        self.results = ScanResultAggregator()
+        self.stop_scan = False
+
+    def _collect(self, ip: str, port: Optional[int] = None, fields: Optional[Dict] = None) -> None:
+        info = dict(fields) if fields else None
+        if self.locator and ip not in self._located:
+            self._located.add(ip)
+            location = self.locator.locate(ip)
+            if location:
+                info = dict(info or {}, location=location)
+        self.results.add(ip, port, info)
+
+    def _run_stage(self, index: int, instance, source, outcomes: List) -> None:
+        try:
+            outcomes[index] = instance.run(source)
+        except Exception as e:
+            outcomes[index] = (False, str(e))
+        finally:
+            # Whatever happened, the next stage must learn that no more
+            # targets are coming
+            if index < len(self.streams):
+                self.streams[index].close()
+
+    def run(self, ip_list=None):
+        self.stop_scan = False
+        self._located = set()
+        self.streams = [TargetStream() for _ in self.stages[1:]]
+        outcomes: List = [None] * len(self.stages)
+        threads = []
+
+        for index, (module_id, instance) in enumerate(self.stages):
+            if index < len(self.streams):
+                instance.result_sink = self.streams[index].put
+            else:
+                instance.result_sink = self._collect
+            source = ip_list if index == 0 else self.streams[index - 1]
+            thread = threading.Thread(target=self._run_stage, args=(index, instance, source, outcomes),
+                                      name=f'pipeline-{module_id}', daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        errors = [
+            f"{module_id}: {outcome[1]}"
+            for (module_id, _), outcome in zip(self.stages, outcomes)
+            if not outcome or not outcome[0]
+        ]
+        if self.stop_scan:
+            return False, "Pipeline stopped by user"
+        if errors and not self.results:
+            return False, "; ".join(str(error) for error in errors)
+        for error in errors:
+            print(f"[-] {error}")
+        return True, self.results
+
+    def stop(self):
+        self.stop_scan = True
+        for _, instance in self.stages:
+            stop = getattr(instance, 'stop', None)
+            if stop:
+                stop()
+        for stream in self.streams:
+            stream.close()
@@ -0,0 +1,564 @@
+import asyncio
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from scapy.all import IP, ICMP, TCP, conf, resolve_iface
+
+ICMP_PROBES = {
+    'icmp_echo': 8,
+    'icmp_timestamp': 13,
+    'icmp_info': 15,
+    'icmp_mask': 17,
+}
+
+# ICMP request type -> matching reply type
+ICMP_REPLIES = {8: 0, 13: 14, 15: 16, 17: 18}
+
+TCP_PROBES = {
+    'syn_80': (80, 'S'),
+    'syn_443': (443, 'S'),
+    'syn_0': (0, 'S'),
+    'ack': (80, 'A'),
+    'null': (80, ''),
+    'fin': (80, 'F'),
+    'xmas': (80, 'FPU'),
+}
+
+PROBE_LEVELS = {
+    1: ['icmp_echo', 'icmp_timestamp', 'icmp_info', 'icmp_mask'],
+    2: ['syn_80', 'syn_443', 'syn_0'],
+    3: ['ack', 'null', 'fin', 'xmas'],
+}
+
+
+# Cheap first pass of two-phase discovery
+SWEEP_PROBES = ['icmp_echo', 'syn_443']
+
+_END = object()
+
+
+def probes_for_level(max_level: int) -> List[str]:
+    probes = []
+    for level in sorted(PROBE_LEVELS):
+        if level <= max_level:
+            probes.extend(PROBE_LEVELS[level])
+    return probes
+
+
+def build_probe(target: str, probe: str, ident: int = 0, seq: int = 0, sport: int = 20):
+    if probe in ICMP_PROBES:
+        return IP(dst=target)/ICMP(type=ICMP_PROBES[probe], code=0, id=ident, seq=seq)
+    dport, flags = TCP_PROBES[probe]
+    return IP(dst=target)/TCP(sport=sport, dport=dport, flags=flags)
+
+
+def _checksum_add(checksum: int, value: int) -> int:
+    # RFC 1624 incremental update for fields that were zero when the
+    # checksum was computed: fold the new words into the complement
+    total = (~checksum & 0xffff) + value
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def _word_sum(data: bytes) -> int:
+    return sum(struct.unpack(f'!{len(data) // 2}H', data))
+
+
+class ProbeTemplates:
+    def __init__(self, probes: List[str]):
+        # Each probe is serialized by scapy once, with addresses, ICMP
+        # id/seq and TCP source port left at zero. Rendering a probe for a
+        # target only patches those bytes and adjusts the checksums.
+        self.templates = {}
+        for probe in probes:
+            packet = build_probe('0.0.0.0', probe, 0, 0, 0)
+            packet[IP].src = '0.0.0.0'
+            packet[IP].id = 0
+            data = bytes(packet)
+            ip_checksum = struct.unpack_from('!H', data, 10)[0]
+            if probe in ICMP_PROBES:
+                checksum = struct.unpack_from('!H', data, 22)[0]
+            else:
+                checksum = struct.unpack_from('!H', data, 36)[0]
+            self.templates[probe] = (data, ip_checksum, checksum)
+
+    def render(self, probe: str, src: bytes, dst: bytes, address_sum: int,
+               ident: int = 0, seq: int = 0, sport: int = 0) -> bytes:
+        template, ip_checksum, checksum = self.templates[probe]
+        data = bytearray(template)
+        data[12:16] = src
+        data[16:20] = dst
+        struct.pack_into('!H', data, 10, _checksum_add(ip_checksum, address_sum))
+        if probe in ICMP_PROBES:
+            struct.pack_into('!HHH', data, 22, _checksum_add(checksum, ident + seq), ident, seq)
+        else:
+            # The TCP checksum covers the addresses through the pseudo-header
+            struct.pack_into('!H', data, 20, sport)
+            struct.pack_into('!H', data, 36, _checksum_add(checksum, address_sum + sport))
+        return bytes(data)
+
+
+class RawReply:
+    __slots__ = ('ttl', 'flags', 'window', 'mss')
+
+    def __init__(self, ttl: int, flags: int = 0, window: int = 0, mss: int = 0):
+        self.ttl = ttl
+        self.flags = flags
+        self.window = window
+        self.mss = mss
+
+
+def parse_reply(data: bytes) -> Tuple[Optional[tuple], Optional[RawReply]]:
+    # struct-only dissection of the fields discovery actually reads
+    if len(data) < 20 or data[0] >> 4 != 4:
+        return None, None
+    ihl = (data[0] & 0x0f) * 4
+    ttl, proto = data[8], data[9]
+    src = socket.inet_ntoa(data[12:16])
+    if proto == socket.IPPROTO_ICMP and len(data) >= ihl + 8:
+        icmp_type, _, _, ident, seq = struct.unpack_from('!BBHHH', data, ihl)
+        return (src, 'icmp', icmp_type, ident, seq), RawReply(ttl)
+    if proto == socket.IPPROTO_TCP and len(data) >= ihl + 20:
+        sport, dport, _, _, offset, flags, window = struct.unpack_from('!HHIIBBH', data, ihl)
+        mss = 0
+        options = ihl + 20
+        if (offset >> 4) * 4 > 20 and len(data) >= options + 4 and data[options] == 2:
+            mss = struct.unpack_from('!H', data, options + 2)[0]
+        return (src, 'tcp', sport, dport), RawReply(ttl, flags, window, mss)
+    return None, None
+
+
+class ProbeMatcher:
+    def __init__(self):
+        # Every probe gets a unique ICMP seq / TCP source port, so a reply
+        # maps back to exactly one (host, probe) by its key
+        self.icmp_id = os.getpid() & 0xffff
+        self._seq = 0
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xffff
+        return self._seq
+
+    def _key(self, target: str, probe: str) -> Tuple[tuple, int, int]:
+        seq = self._next_seq()
+        sport = 1024 + seq % 64511
+        if probe in ICMP_PROBES:
+            key = (target, 'icmp', ICMP_REPLIES[ICMP_PROBES[probe]], self.icmp_id, seq)
+        else:
+            key = (target, 'tcp', TCP_PROBES[probe][0], sport)
+        return key, seq, sport
+
+    def _build(self, target: str, probe: str):
+        key, seq, sport = self._key(target, probe)
+        return key, build_probe(target, probe, self.icmp_id, seq, sport)
+
+    def _reply_key(self, packet):
+        if IP not in packet:
+            return None
+        src = packet[IP].src
+        if TCP in packet:
+            return (src, 'tcp', packet[TCP].sport, packet[TCP].dport)
+        if ICMP in packet:
+            icmp = packet[ICMP]
+            return (src, 'icmp', icmp.type, icmp.id, icmp.seq)
+        return None
+
+
+class BatchProbeEngine(ProbeMatcher):
+    def __init__(self, timeout: float, batch_size: int = 1024, max_pps: int = 0,
+                 max_inflight_batches: int = 4, pacer: Optional[Callable[[int], float]] = None,
+                 linger: float = 2.0):
+        # Probes for a whole batch of hosts go out back to back on one L3
+        # socket per outgoing interface, while a single receiver thread on
+        # those sockets matches replies to their (host, probe) by address
+        # and ICMP id/seq or TCP ports. Every batch shares one timeout
+        # window, so a dead host costs no thread time. Targets are read by
+        # a feeder thread, so a slow source (a pipeline stream) never holds
+        # back finished batches, and a partial batch goes out once nothing
+        # new has arrived for `linger` seconds.
+        super().__init__()
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.max_pps = max_pps
+        self.max_inflight_batches = max(1, max_inflight_batches)
+        self.linger = linger
+        # Optional shared rate budget: called per packet, returns how long
+        # to wait before sending it
+        self.pacer = pacer
+
+        self._pending: Dict[tuple, Tuple[str, str]] = {}
+        self._replies: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._sockets = {}
+        self._running = False
+        self._next_send = 0.0
+
+    def _put(self, feed: queue.Queue, item) -> bool:
+        while self._running:
+            try:
+                feed.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _feed(self, targets: Iterable[str], feed: queue.Queue):
+        item = _END
+        try:
+            for target in targets:
+                if not self._put(feed, target):
+                    return
+        except Exception as e:
+            item = e
+        self._put(feed, item)
+
+    def _on_packet(self, packet):
+        key = self._reply_key(packet)
+        if key is None:
+            return
+        with self._lock:
+            match = self._pending.pop(key, None)
+            if match:
+                target, probe = match
+                self._replies.setdefault(target, {})[probe] = packet
+
+    def _socket_for(self, target: str):
+        # Same selection as sr(): loopback gets a raw socket, everything
+        # else the interface's L3 packet socket
+        iface = resolve_iface(conf.route.route(target)[0] or conf.iface)
+        sock = self._sockets.get(iface.name)
+        if sock is None:
+            sock = iface.l3socket(False)(iface=iface)
+            self._sockets[iface.name] = sock
+        return sock
+
+    def _receive(self):
+        while self._running:
+            sockets = list(self._sockets.values())
+            if not sockets:
+                time.sleep(0.05)
+                continue
+            try:
+                readable, _, _ = select.select(sockets, [], [], 0.2)
+                for sock in readable:
+                    packet = sock.recv()
+                    if packet is not None:
+                        self._on_packet(packet)
+            except (OSError, ValueError):
+                if self._running:
+                    continue
+                break
+
+    def _pace(self):
+        if self.pacer:
+            delay = self.pacer(1)
+            if delay:
+                time.sleep(delay)
+        if not self.max_pps:
+            return
+        now = time.monotonic()
+        if self._next_send > now:
+            time.sleep(self._next_send - now)
+        self._next_send = max(now, self._next_send) + 1.0 / self.max_pps
+
+    def _send_batch(self, batch: List[str], probes: List[str]) -> List[tuple]:
+        keys = []
+        for target in batch:
+            for probe in probes:
+                key, packet = self._build(target, probe)
+                with self._lock:
+                    self._pending[key] = (target, probe)
+                keys.append(key)
+                self._pace()
+                try:
+                    self._socket_for(target).send(packet)
+                except OSError:
+                    pass
+        return keys
+
+    def _finish_batch(self, batch: List[str], keys: List[tuple]) -> Iterator[Tuple[str, Dict]]:
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+            replies = [(target, self._replies.pop(target, {})) for target in batch]
+        yield from replies
+
+    def run(self, targets: Iterable[str], probes: List[str]) -> Iterator[Tuple[str, Dict]]:
+        self._running = True
+        receiver = threading.Thread(target=self._receive, daemon=True)
+        receiver.start()
+        # Unbounded feed would let a huge target set run far ahead
+        feed = queue.Queue(maxsize=self.batch_size * self.max_inflight_batches)
+        threading.Thread(target=self._feed, args=(targets, feed), daemon=True).start()
+        inflight = deque()
+        try:
+            batch = []
+            batch_deadline = None
+            exhausted = False
+            while not exhausted or batch or inflight:
+                if not exhausted:
+                    # Wait for targets only until a batch is due
+                    due = [deadline for deadline in (batch_deadline, inflight[0][0] if inflight else None)
+                           if deadline is not None]
+                    timeout = max(0.0, min(due) - time.monotonic()) if due else None
+                    try:
+                        item = feed.get(timeout=timeout)
+                    except queue.Empty:
+                        item = None
+                    if item is _END:
+                        exhausted = True
+                    elif isinstance(item, Exception):
+                        raise item
+                    elif item is not None:
+                        if not batch:
+                            batch_deadline = time.monotonic() + self.linger
+                        batch.append(item)
+                        
+                if batch and (len(batch) >= self.batch_size or exhausted
+                              or batch_deadline <= time.monotonic()):
+                    keys = self._send_batch(batch, probes)
+                    inflight.append((time.monotonic() + self.timeout, batch, keys))
+                    batch = []
+                    batch_deadline = None
+                    
+                while inflight and (len(inflight) >= self.max_inflight_batches
+                                    or inflight[0][0] <= time.monotonic()
+                                    or exhausted and not batch):
+                    deadline, done, done_keys = inflight.popleft()
+                    time.sleep(max(0.0, deadline - time.monotonic()))
+                    yield from self._finish_batch(done, done_keys)
+        finally:
+            self._running = False
+            receiver.join(timeout=1.0)
+            for sock in self._sockets.values():
+                sock.close()
+            self._sockets = {}
+
+
+class AsyncProbeEngine(ProbeMatcher):
+    def __init__(self, timeout: float, max_inflight: int = 10000, max_pps: int = 0,
+                 raw_packets: bool = True, pacer: Optional[Callable[[int], float]] = None):
+        # One event loop drives every probe: packets go out on a
+        # non-blocking raw socket, replies are read from raw ICMP/TCP
+        # sockets by loop readers, and each probe has its own timer
+        # instead of a thread waiting on it. With raw_packets, probes are
+        # rendered from ProbeTemplates and replies parsed by parse_reply;
+        # otherwise scapy builds and dissects every packet. Targets are
+        # read by a feeder thread, as iterating a pipeline stream blocks
+        # and the loop has to keep reading replies and firing timers.
+        super().__init__()
+        self.timeout = timeout
+        self.max_inflight = max(1, max_inflight)
+        self.max_pps = max_pps
+        self.raw_packets = raw_packets
+        self.pacer = pacer
+        self.templates = None
+
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        self._next_send = 0.0
+        self._stop = threading.Event()
+        self._loop = None
+        self._targets = None
+
+    def _open_sockets(self):
+        self._send_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        self._recv_sockets = [
+            socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP),
+            socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+        ]
+        for sock in [self._send_socket] + self._recv_sockets:
+            sock.setblocking(False)
+        for sock in self._recv_sockets:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+    def _close_sockets(self, loop):
+        for sock in self._recv_sockets:
+            loop.remove_reader(sock.fileno())
+            sock.close()
+        self._send_socket.close()
+
+    def _on_readable(self, sock):
+        while True:
+            try:
+                data = sock.recv(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if self.templates:
+                key, packet = parse_reply(data)
+            else:
+                packet = IP(data)
+                key = self._reply_key(packet)
+            future = self._pending.pop(key, None) if key else None
+            if future is not None and not future.done():
+                future.set_result(packet)
+
+    def _expire(self, key):
+        # A busy loop may run timers before readers; drain replies that
+        # already arrived so they are not counted as lost
+        for sock in self._recv_sockets:
+            self._on_readable(sock)
+        future = self._pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    async def _pace(self):
+        if self.pacer:
+            delay = self.pacer(1)
+            if delay:
+                await asyncio.sleep(delay)
+        if not self.max_pps:
+            return
+        now = time.monotonic()
+        if self._next_send > now:
+            await asyncio.sleep(self._next_send - now)
+        self._next_send = max(now, self._next_send) + 1.0 / self.max_pps
+
+    async def _send(self, target: str, data: bytes):
+        while True:
+            try:
+                self._send_socket.sendto(data, (target, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                await asyncio.sleep(0.001)
+            except OSError:
+                return
+
+    async def _probe(self, loop, target: str, probe: str, addresses) -> Optional[object]:
+        await self._pace()
+        if self.templates:
+            key, seq, sport = self._key(target, probe)
+            data = self.templates.render(probe, *addresses, self.icmp_id, seq, sport)
+        else:
+            key, packet = self._build(target, probe)
+            data = bytes(packet)
+        future = loop.create_future()
+        self._pending[key] = future
+        timer = loop.call_later(self.timeout, self._expire, key)
+        await self._send(target, data)
+        try:
+            return await future
+        finally:
+            timer.cancel()
+
+    async def _probe_host(self, loop, index: int, target: str, probes: List[str], slots, out):
+        try:
+            addresses = None
+            if self.templates:
+                # Route lookup once per host; every probe reuses it
+                src = socket.inet_aton(conf.route.route(target)[1])
+                dst = socket.inet_aton(target)
+                addresses = (src, dst, _word_sum(src + dst))
+            answers = await asyncio.gather(*(self._probe(loop, target, probe, addresses) for probe in probes))
+            replies = {probe: reply for probe, reply in zip(probes, answers) if reply is not None}
+            while not self._stop.is_set():
+                try:
+                    out.put_nowait((index, target, replies))
+                    break
+                except queue.Full:
+                    # The consumer is behind; wait without blocking the loop
+                    await asyncio.sleep(0.01)
+        finally:
+            slots.release()
+
+    def _deliver(self, item) -> bool:
+        # Hands an item to the loop's target queue from another thread
+        loop, targets = self._loop, self._targets
+        if loop is None:
+            return False
+        try:
+            loop.call_soon_threadsafe(targets.put_nowait, item)
+            return True
+        except RuntimeError:
+            # The loop has already finished
+            return False
+
+    def _feed(self, targets: Iterable[str], room: threading.Semaphore):
+        item = _END
+        try:
+            for target in targets:
+                # `room` keeps the feeder at most max_inflight targets ahead
+                while not room.acquire(timeout=0.2):
+                    if self._stop.is_set():
+                        break
+                if self._stop.is_set():
+                    break
+                if not self._deliver(target):
+                    return
+        except Exception as e:
+            item = e
+        self._deliver(item)
+
+    async def _main(self, targets: Iterable[str], probes: List[str], out):
+        loop = asyncio.get_running_loop()
+        if self.raw_packets:
+            self.templates = ProbeTemplates(probes)
+        self._open_sockets()
+        for sock in self._recv_sockets:
+            loop.add_reader(sock.fileno(), self._on_readable, sock)
+
+        self._loop = loop
+        self._targets = asyncio.Queue()
+        room = threading.Semaphore(self.max_inflight)
+        threading.Thread(target=self._feed, args=(targets, room), daemon=True).start()
+
+        slots = asyncio.Semaphore(max(1, self.max_inflight // max(1, len(probes))))
+        tasks = set()
+        index = 0
+        try:
+            while not self._stop.is_set():
+                target = await self._targets.get()
+                room.release()
+                if target is _END or self._stop.is_set():
+                    break
+                if isinstance(target, Exception):
+                    raise target
+                await slots.acquire()
+                task = loop.create_task(self._probe_host(loop, index, target, probes, slots, out))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            self._loop = None
+            for task in tasks:
+                task.cancel()
+            self._close_sockets(loop)
+
+    def _run_loop(self, targets, probes, out):
+        try:
+            asyncio.run(self._main(targets, probes, out))
+        except Exception as e:
+            out.put(e)
+        finally:
+            out.put(None)
+
+    def run(self, targets: Iterable[str], probes: List[str]) -> Iterator[Tuple[int, str, Dict]]:
+        # Hosts finish in reply order, so results carry their target index
+        out = queue.Queue(maxsize=self.max_inflight)
+        self._stop.clear()
+        loop_thread = threading.Thread(target=self._run_loop, args=(targets, probes, out), daemon=True)
+        loop_thread.start()
+        try:
+            while True:
+                item = out.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._stop.set()
+            # Wakes a loop that is waiting for the next target
+            self._deliver(_END)
+            loop_thread.join(timeout=self.timeout + 1.0)
@@ -0,0 +1,142 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+
+class ProcessSupervisor:
+    def __init__(self, cmd, on_stdout=None, on_stderr=None, stdin_lines=None,
+                 terminate_grace=5.0):
+        self.cmd = cmd
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+        self.stdin_lines = stdin_lines
+        self.terminate_grace = terminate_grace
+
+        self.process = None
+        self.returncode = None
+        self.stopped = False
+        self.timed_out = False
+
+        self._wake = threading.Event()
+        self._threads = []
+        self._stderr_tail = []
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.cmd,
+            stdin=subprocess.PIPE if self.stdin_lines is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            bufsize=1,
+            # sudo needs the controlling terminal for its password prompt
+            start_new_session=self.cmd[0] != 'sudo'
+        )
+
+        self._spawn(self._drain, self.process.stdout, self.on_stdout, None)
+        self._spawn(self._drain, self.process.stderr, self.on_stderr, self._stderr_tail)
+        if self.stdin_lines is not None:
+            self._spawn(self._feed, self.process.stdin, self.stdin_lines)
+        self._spawn(self._reap)
+        return self
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _drain(self, stream, callback, tail):
+        # Both pipes are drained concurrently so a chatty child can never
+        # block on a full pipe buffer while we wait on the other one.
+        try:
+            for line in stream:
+                line = line.rstrip('\n')
+                if tail is not None:
+                    tail.append(line)
+                    if len(tail) > 50:
+                        del tail[0]
+                if callback:
+                    try:
+                        callback(line)
+                    except Exception:
+                        pass
+        except (ValueError, OSError):
+            pass
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _feed(self, stream, lines):
+        try:
+            for line in lines:
+                if self.stopped:
+                    break
+                stream.write(line + '\n')
+        except (BrokenPipeError, ValueError, OSError):
+            pass
+        finally:
+            try:
+                stream.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def _reap(self):
+        self.process.wait()
+        self._wake.set()
+
+    def wait(self, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+
+        while self.process.poll() is None:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out = True
+                    self.terminate()
+                    break
+            self._wake.wait(remaining)
+            if self.stopped:
+                self.terminate()
+                break
+
+        for thread in self._threads:
+            thread.join(timeout=self.terminate_grace)
+
+        self.returncode = self.process.returncode
+        return self.returncode
+
+    def terminate(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        # The child normally leads its own process group, so helpers it
+        # forked (and which still hold our pipes) go down with it
+        try:
+            self._signal(signal.SIGTERM)
+            self.process.wait(timeout=self.terminate_grace)
+        except subprocess.TimeoutExpired:
+            self._signal(signal.SIGKILL)
+            self.process.wait()
+        except OSError:
+            pass
+
+    def _signal(self, signum):
+        try:
+            if os.getpgid(self.process.pid) == self.process.pid:
+                os.killpg(self.process.pid, signum)
+                return
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.send_signal(signum)
+
+    def stop(self):
+        self.stopped = True
+        self._wake.set()
+
+    @property
+    def stderr_tail(self):
+        return '\n'.join(self._stderr_tail)
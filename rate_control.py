@@ -0,0 +1,54 @@
+import threading
+
+
+class AdaptiveRateController:
+    def __init__(self, ceiling, floor=None, initial=None, increase=0.1,
+                 decrease=0.5, loss_threshold=0.02):
+        # Additive-increase / multiplicative-decrease: climb towards the
+        # ceiling in steps of `increase * ceiling` while losses stay under
+        # loss_threshold, and cut the rate by `decrease` as soon as they
+        # don't. Operators set the ceiling; the controller finds the rate.
+        self.ceiling = max(1, int(ceiling))
+        self.floor = max(1, int(floor if floor is not None else self.ceiling * 0.05))
+        self.rate = max(self.floor, int(initial if initial is not None else self.ceiling * 0.25))
+        self.increase = increase
+        self.decrease = decrease
+        self.loss_threshold = loss_threshold
+        self.lock = threading.Lock()
+
+    def update(self, sent, responses=0, losses=0):
+        with self.lock:
+            if sent <= 0:
+                return self.rate
+            loss_ratio = losses / sent
+            if loss_ratio > self.loss_threshold:
+                self.rate = max(self.floor, int(self.rate * self.decrease))
+            else:
+                step = max(1, int(self.ceiling * self.increase))
+                self.rate = min(self.ceiling, self.rate + step)
+            return self.rate
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def set_limit(self, limit):
+        with self.condition:
+            self.limit = max(1, int(limit))
+            self.condition.notify_all()
+
+    def __enter__(self):
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+        return False
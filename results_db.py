@@ -0,0 +1,243 @@
+import ipaddress
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+RESULTS_DB_PATH = "scan_results.db"
+LOCATION_DB_PATH = "ip2location.db"
+
+# Port stored for results that are a live host rather than an open port
+HOST_PORT = 0
+
+LOCATION_FILTERS = {
+    'city': 'city_name',
+    'region': 'region_name',
+    'country': 'country_name',
+    'country-code': 'country_code'
+}
+
+
+class ScanResultStore:
+    def __init__(self, db_path: str = RESULTS_DB_PATH, location_db: str = LOCATION_DB_PATH,
+                 read_only: bool = False):
+        # Results live in their own database so scans never touch the
+        # (stamped) ip2location file; ips are stored as integers like its
+        # ip_from/ip_to columns, and the two are joined through ATTACH.
+        # A read-only store never creates the file, which must exist.
+        self.db_path = db_path
+        self.location_db = location_db
+        self.read_only = read_only
+        if read_only:
+            if not os.path.isfile(db_path):
+                raise FileNotFoundError(f"Results database not found: {db_path}")
+        else:
+            self._create_database()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Background jobs may write at the same time; wait for the lock
+        if self.read_only:
+            return sqlite3.connect(f"file:{os.path.abspath(self.db_path)}?mode=ro", uri=True, timeout=30)
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _create_database(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scans (
+                    scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    module TEXT,
+                    started TEXT,
+                    finished TEXT,
+                    output_file TEXT,
+                    result_count INTEGER DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    scan_id INTEGER,
+                    ip INTEGER,
+                    port INTEGER,
+                    fields TEXT,
+                    PRIMARY KEY (scan_id, ip, port)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_port_ip ON results (port, ip)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_ip ON results (ip)")
+
+    def start_scan(self, module: str, output_file: Optional[str] = None) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO scans (module, started, output_file) VALUES (?, ?, ?)",
+                (module, time.strftime('%Y-%m-%d %H:%M:%S'), output_file)
+            )
+            return cursor.lastrowid
+
+    def has_scan(self, scan_id: int) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM scans WHERE scan_id = ?", (scan_id,)).fetchone() is not None
+
+    def _insert(self, params: List[Tuple]) -> int:
+        # One transaction and one executemany per call; callers hand in
+        # thousands of rows at a time
+        if not params:
+            return 0
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", params)
+        return len(params)
+
+    def add_results(self, scan_id: int, rows: Iterable[Tuple[str, Optional[int], Optional[Dict]]]) -> int:
+        return self._insert([
+            (scan_id, int(ipaddress.IPv4Address(ip)), HOST_PORT if port is None else int(port),
+             json.dumps(fields) if fields else None)
+            for ip, port, fields in rows
+        ])
+
+    def add_aggregator(self, scan_id: int, aggregator, batch_size: int = 50000) -> int:
+        # Entries come out in ip order with integer ips, so they go in as-is
+        # and land on the primary key in append order
+        batch = []
+        count = 0
+        for ip_int, ports, info in aggregator.entries():
+            fields = json.dumps(info) if info else None
+            if not ports:
+                batch.append((scan_id, ip_int, HOST_PORT, fields))
+            for port in sorted(ports):
+                batch.append((scan_id, ip_int, port, fields))
+            if len(batch) >= batch_size:
+                count += self._insert(batch)
+                batch = []
+        return count + self._insert(batch)
+
+    def finish_scan(self, scan_id: int):
+        with self._connect() as conn:
+            conn.execute("""
+                UPDATE scans SET finished = ?,
+                    result_count = (SELECT COUNT(*) FROM results WHERE scan_id = ?)
+                WHERE scan_id = ?
+            """, (time.strftime('%Y-%m-%d %H:%M:%S'), scan_id, scan_id))
+
+    def record(self, module: str, aggregator, output_file: Optional[str] = None) -> int:
+        scan_id = self.start_scan(module, output_file)
+        self.add_aggregator(scan_id, aggregator)
+        self.finish_scan(scan_id)
+        return scan_id
+
+    def scans(self, limit: int = 20) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(
+                "SELECT * FROM scans ORDER BY scan_id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def query(self, port: Optional[int] = None, last: Optional[int] = None,
+              scan_id: Optional[int] = None, module: Optional[str] = None,
+              cidr: Optional[str] = None, limit: Optional[int] = None,
+              **location: str) -> List[Dict]:
+        # location takes city/region/country/country-code (see
+        # LOCATION_FILTERS). With one set, the matching ip2location ranges
+        # drive the query and each is joined to results through an index
+        # range scan on ip, instead of locating every result row.
+        where = []
+        params: List = []
+
+        scan_filter = []
+        if scan_id is not None:
+            scan_filter.append("scan_id = ?")
+            params.append(int(scan_id))
+        if module:
+            scan_filter.append("module = ?")
+            params.append(module)
+        if scan_filter or last:
+            sql = f"SELECT scan_id FROM scans{' WHERE ' + ' AND '.join(scan_filter) if scan_filter else ''}"
+            if last:
+                sql += " ORDER BY scan_id DESC LIMIT ?"
+                params.append(int(last))
+            where.append(f"r.scan_id IN ({sql})")
+
+        if port is not None:
+            where.append("r.port = ?")
+            params.append(int(port))
+        if cidr:
+            network = ipaddress.IPv4Network(cidr, strict=False)
+            where.append("r.ip BETWEEN ? AND ?")
+            params.extend([int(network.network_address), int(network.broadcast_address)])
+
+        location_where = []
+        location_params = []
+        for name, value in location.items():
+            if value is None:
+                continue
+            if name not in LOCATION_FILTERS:
+                raise ValueError(f"Unknown location filter: {name}")
+            location_where.append(f"LOWER(l.{LOCATION_FILTERS[name]}) = LOWER(?)")
+            location_params.append(value)
+
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if location_where:
+                conn.execute("ATTACH DATABASE ? AS loc", (self.location_db,))
+                # CROSS JOIN keeps the (few) matching ranges as the outer loop
+                sql = """
+                    SELECT r.scan_id, r.ip, r.port, r.fields,
+                           l.city_name, l.region_name, l.country_name, l.country_code
+                    FROM loc.ip2location AS l CROSS JOIN results AS r
+                        ON r.ip BETWEEN l.ip_from AND l.ip_to
+                """
+                where = location_where + where
+                params = location_params + params
+            else:
+                sql = "SELECT r.scan_id, r.ip, r.port, r.fields FROM results AS r"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY r.ip, r.port, r.scan_id"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(int(limit))
+            rows = conn.execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            result = {
+                'scan_id': row['scan_id'],
+                'ip': str(ipaddress.IPv4Address(row['ip'])),
+                'port': row['port'],
+                'fields': json.loads(row['fields']) if row['fields'] else {}
+            }
+            if location_where:
+                result['location'] = {
+                    'city': row['city_name'],
+                    'region': row['region_name'],
+                    'country': row['country_name'],
+                    'country_code': row['country_code']
+                }
+            results.append(result)
+        return results
+
+
+class ScanRecorder:
+    def __init__(self, store: ScanResultStore, module: str, output_file: Optional[str] = None,
+                 batch_size: int = 10000, scan_id: Optional[int] = None):
+        # For modules that stream results instead of aggregating them:
+        # rows are buffered and inserted batch_size at a time. A resumed
+        # run passes the scan_id it started with to keep appending to it.
+        self.store = store
+        if scan_id is None or not store.has_scan(scan_id):
+            scan_id = store.start_scan(module, output_file)
+        self.scan_id = scan_id
+        self.batch_size = batch_size
+        self.pending = []
+
+    def add(self, ip: str, port: Optional[int] = None, fields: Optional[Dict] = None):
+        self.pending.append((ip, port, fields))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.store.add_results(self.scan_id, self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.store.finish_scan(self.scan_id)
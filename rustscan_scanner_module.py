@@ -1,8 +1,19 @@
-import subprocess
 import tempfile
 import os
+import threading
+import itertools
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import re
+from process_supervisor import ProcessSupervisor
+from targets import TargetSet, as_target_set
+from scan_results import ScanResultAggregator
+from checkpoint import open_checkpoint
+from rate_control import AdaptiveRateController
+from pipeline import TargetStream
+from results_db import RESULTS_DB_PATH, ScanResultStore
+from budget import scheduler
 
 MODULE_INFO = {
     'name': 'RustScan Scanner',
@@ -48,36 +59,108 @@ MODULE_INFO = {
             'description': 'Output file name (default: rustscan_results_<timestamp>.txt)',
             'required': False,
             'value': None
+        },
+        'chunk_size': {
+            'description': 'Number of target addresses per rustscan process (e.g., 65536)',
+            'required': False,
+            'value': '65536'
+        },
+        'workers': {
+            'description': 'Number of concurrent rustscan processes sharing batch_size/ulimit',
+            'required': False,
+            'value': '4'
+        },
+        'chunk_timeout': {
+            'description': 'Maximum time per chunk in seconds before it is retried (0 = no limit)',
+            'required': False,
+            'value': '0'
+        },
+        'retries': {
+            'description': 'Number of retries for a failed or timed out chunk',
+            'required': False,
+            'value': '1'
+        },
+        'adaptive': {
+            'description': 'Adapt batch size per chunk from observed timeouts (batch_size becomes the ceiling)',
+            'required': False,
+            'value': 'false'
+        },
+        'checkpoint_file': {
+            'description': 'State file for checkpointing progress (continue with: resume <file>)',
+            'required': False,
+            'value': None
+        },
+        'results_db': {
+            'description': 'SQLite database that open ports are also stored in (empty to disable)',
+            'required': False,
+            'value': RESULTS_DB_PATH
         }
     }
 }
 
+# Linux caps a single argv string at 128 KiB (MAX_ARG_STRLEN)
+MAX_INLINE_ADDRESSES = 120000
+
+OPEN_PATTERN = re.compile(r"^Open (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d+)$")
+PORT_PATTERN = re.compile(r"^Port (\d+) is open on (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})$")
+
 class RustScanScanner:
+    # Can take its targets from a TargetStream fed by an earlier pipeline stage
+    accepts_stream = True
+
     def __init__(self):
         self.options = MODULE_INFO['options']
+        self.stop_scan = False
+        self.result_sink = None
+        self.weight = 1.0
+        self.priority = 0
+        self._allocation = None
+        self._supervisors = set()
+        self._lock = threading.Lock()
+        self._controller = None
         
-    def validate_options(self):
+    def validate_options(self, streaming=False):
         for name, opt in self.options.items():
             if opt['required'] and not opt['value']:
                 return False, f"Required option '{name}' is not set"
         
-        if not self.options['query_id']['value'] and not self.options['input_file']['value']:
+        if not streaming and not self.options['query_id']['value'] and not self.options['input_file']['value']:
             return False, "Either query_id or input_file must be set"
             
         return True, None
     
-    def _create_target_file(self, ip_list):
+    def _create_target_file(self, cidrs):
         fd, path = tempfile.mkstemp()
         with os.fdopen(fd, 'w') as temp:
-            for ip in ip_list:
-                temp.write(ip + '\n')
+            for cidr in cidrs:
+                temp.write(cidr + '\n')
         return path
     
-    def _build_rustscan_command(self, input_file):
+    def _build_target_argument(self, ip_list):
+        # RustScan expands CIDRs itself, so we hand it the aggregated networks
+        # instead of every address. They go inline on the command line when
+        # they fit, and only very fragmented target sets fall back to a
+        # (CIDR-sized) file. RustScan refuses FIFOs, so a pipe is not an option.
+        cidrs = list(as_target_set(ip_list).cidrs())
+        addresses = ','.join(cidrs)
+        if len(addresses) <= MAX_INLINE_ADDRESSES:
+            return addresses, False
+        return self._create_target_file(cidrs), True
+    
+    def _int_option(self, name, default):
+        try:
+            return int(self.options[name]['value'] or default)
+        except ValueError:
+            return default
+    
+    def _bool_option(self, name):
+        return str(self.options[name]['value']).lower() in ('true', 'yes', '1')
+    
+    def _build_rustscan_command(self, addresses, workers=1, batch_size=None):
         cmd = ['rustscan']
         
-        # Add addresses file
-        cmd.extend(['--addresses', input_file])
+        # Add addresses (comma-separated list or file)
+        cmd.extend(['--addresses', addresses])
         
         # Add ports
         ports = self.options['ports']['value']
@@ -86,124 +169,268 @@ class RustScanScanner:
         # Add optional parameters
         if self.options['timeout']['value']:
             cmd.extend(['--timeout', self.options['timeout']['value']])
+        
+        # batch_size and ulimit are a budget for the whole scan, split
+        # evenly between the concurrent workers
+        if not batch_size and self.options['batch_size']['value']:
+            batch_size = self._int_option('batch_size', 2500)
+        ulimit = self._int_option('ulimit', 5000) if self.options['ulimit']['value'] else None
+        if self._allocation:
+            batch_size, ulimit = self._budget_limits(batch_size, ulimit)
             
-        if self.options['batch_size']['value']:
-            cmd.extend(['--batch-size', self.options['batch_size']['value']])
+        if batch_size:
+            cmd.extend(['--batch-size', str(max(1, batch_size // workers))])
             
-        if self.options['ulimit']['value']:
-            cmd.extend(['--ulimit', self.options['ulimit']['value']])
+        if ulimit:
+            cmd.extend(['--ulimit', str(max(1, ulimit // workers))])
             
         if self.options['tries']['value']:
             cmd.extend(['--tries', self.options['tries']['value']])
         
         return cmd
     
-    def run(self, ip_list=None):
-        valid, error = self.validate_options()
+    def _estimated_pps(self, batch_size):
+        # Every connect in a batch is a SYN sent within one timeout window
+        timeout = max(0.001, self._int_option('timeout', 2500) / 1000)
+        return batch_size / timeout
+    
+    def _budget_limits(self, batch_size, ulimit):
+        # Cap the scan-wide batch size and fd limit by this scan's share of
+        # the global budget; they are re-read for every chunk
+        ulimit = self._allocation.limit('sockets', ulimit)
+        if ulimit:
+            ulimit = int(ulimit)
+            batch_size = min(batch_size or ulimit, ulimit)
+        if self._allocation.pps is not None and batch_size:
+            timeout = max(0.001, self._int_option('timeout', 2500) / 1000)
+            batch_size = min(batch_size, max(1, int(self._allocation.pps * timeout)))
+        return batch_size, ulimit
+    
+    def _load_targets(self, ip_list, checkpoint=None):
+        if checkpoint:
+            return checkpoint.remaining_targets()
+        if self.options['input_file']['value']:
+            try:
+                return TargetSet.from_file(self.options['input_file']['value'])
+            except ValueError:
+                # Hostnames and other entries only rustscan understands
+                return None
+        return as_target_set(ip_list)
+    
+    def _handle_line(self, line, results, outfile):
+        # True when the line reports an open port (new or not); banners
+        # and other chatter don't count
+        line = line.strip()
+        match = OPEN_PATTERN.match(line)
+        if match:
+            ip, port = match.group(1), int(match.group(2))
+        else:
+            match = PORT_PATTERN.match(line)
+            if not match:
+                return False
+            port, ip = int(match.group(1)), match.group(2)
+        
+        if not results.add(ip, port):
+            return True
+        with self._lock:
+            print(f"{ip}:{port}")
+            outfile.write(f"{ip}:{port}\n")
+            outfile.flush()
+        if self.result_sink:
+            self.result_sink(ip, port)
+        return True
+    
+    def _restore_results(self, checkpoint, results):
+        # The output file holds one ip:port per line
+        for line in checkpoint.output_lines():
+            ip, _, port = line.strip().rpartition(':')
+            try:
+                results.add(ip, int(port))
+            except ValueError:
+                continue
+    
+    def _scan_chunk(self, addresses, workers, results, outfile):
+        target, cleanup_target = (addresses, False) if isinstance(addresses, str) \
+            else self._build_target_argument(addresses)
+        timeout = self._int_option('chunk_timeout', 0)
+        attempts = self._int_option('retries', 1) + 1
+        error = None
+        
+        try:
+            for attempt in range(attempts):
+                if self.stop_scan:
+                    return False, "Scan stopped by user"
+                
+                batch_size = self._controller.rate if self._controller else None
+                cmd = self._build_rustscan_command(target, workers, batch_size)
+                found = []
+                
+                def handle_line(line):
+                    if self._handle_line(line, results, outfile) and not found:
+                        found.append(True)
+                
+                supervisor = ProcessSupervisor(cmd, on_stdout=handle_line)
+                with self._lock:
+                    self._supervisors.add(supervisor)
+                try:
+                    supervisor.start()
+                    if self.stop_scan:
+                        supervisor.stop()
+                    returncode = supervisor.wait(timeout=timeout or None)
+                finally:
+                    with self._lock:
+                        self._supervisors.discard(supervisor)
+                
+                if supervisor.stopped:
+                    return False, "Scan stopped by user"
+                if self._controller:
+                    # A timed out or failed chunk (a crash or ulimit error,
+                    # even after some ports were reported) counts as loss and
+                    # halves the batch size; clean chunks ramp it back up
+                    lost = supervisor.timed_out or returncode != 0
+                    self._controller.update(1, losses=1 if lost else 0)
+                if supervisor.timed_out:
+                    error = f"chunk timed out after {timeout} seconds"
+                elif returncode != 0 and not found:
+                    error = f"RustScan failed with error: {supervisor.stderr_tail}"
+                else:
+                    return True, None
+            return False, error
+        finally:
+            if cleanup_target:
+                try:
+                    os.unlink(target)
+                except OSError:
+                    pass
+    
+    def run(self, ip_list=None, checkpoint=None):
+        batch_size = self._int_option('batch_size', 2500)
+        with scheduler.register(__name__, self.weight, self.priority,
+                                pps=self._estimated_pps(batch_size),
+                                sockets=self._int_option('ulimit', 5000)) as self._allocation:
+            return self._run(ip_list, checkpoint)
+    
+    def _run(self, ip_list=None, checkpoint=None):
+        self.stop_scan = False
+        streaming = isinstance(ip_list, TargetStream)
+        
+        valid, error = self.validate_options(streaming)
         if not valid:
             return False, error
             
         try:
-            target_file = None
-            cleanup_target = False
-            
-            if self.options['input_file']['value']:
-                target_file = self.options['input_file']['value']
-                if not os.path.exists(target_file):
-                    return False, f"Input file not found: {target_file}"
-            else:
-                if not ip_list:
+            if streaming:
+                # Chunks are cut from the stream as an earlier pipeline stage
+                # produces addresses, so there is no total to checkpoint
+                targets = None
+                chunks = ip_list.batches(max(1, self._int_option('chunk_size', 65536)))
+                workers = max(1, self._int_option('workers', 4))
+            elif not checkpoint:
+                if self.options['input_file']['value']:
+                    if not os.path.exists(self.options['input_file']['value']):
+                        return False, f"Input file not found: {self.options['input_file']['value']}"
+                elif not ip_list:
                     return False, "No IP list provided and no input file specified"
-                target_file = self._create_target_file(ip_list)
-                cleanup_target = True
             
-            if not self.options['output_file']['value']:
+            if not streaming:
+                targets = self._load_targets(ip_list, checkpoint)
+                if targets is None:
+                    chunks = [self.options['input_file']['value']]
+                else:
+                    chunks = list(targets.chunks(max(1, self._int_option('chunk_size', 65536))))
+                workers = max(1, min(self._int_option('workers', 4), len(chunks)))
+            
+            if checkpoint and checkpoint.output_file:
+                output_file = checkpoint.output_file
+            elif not self.options['output_file']['value']:
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_file = f'rustscan_results_{timestamp}.txt'
             else:
                 output_file = self.options['output_file']['value']
             
-            cmd = self._build_rustscan_command(target_file)
+            results = ScanResultAggregator()
+            if targets is not None:
+                checkpoint = open_checkpoint(__name__, self.options, targets, output_file, checkpoint)
+            if checkpoint:
+                self._restore_results(checkpoint, results)
+                print(f"Checkpointing to {checkpoint.path} ({checkpoint.cursor} addresses already scanned)")
             
-            try:
-                print(f"Running command: {' '.join(cmd)}")
-                
-                with open(output_file, 'w') as outfile:
-                    # Start process
-                    process = subprocess.Popen(
-                        cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        universal_newlines=True,
-                        bufsize=1
-                    )
-                    
-                    results = []
-                    current_ip = None
-                    current_ports = set()
-                    
-                    # İlk satır kontrolü için flag
-                    first_line_checked = False
-                    ip_port_pattern = r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$"
-                    
-                    for line in process.stdout:
-                        line = line.strip()
-                        if line:
-                            if line.startswith('Open'):
-                                ip_port = line.split('Open ')[1].strip()
-                                
-                                print(ip_port)
-                                
-                                if not first_line_checked:
-                                    first_line_checked = True
-                                    if not re.match(ip_port_pattern, ip_port):
-                                        continue  # İlk satır uygun formatta değilse kaydetme
-                                
-                                outfile.write(ip_port + '\n')
-                                outfile.flush()
+            if self._bool_option('adaptive'):
+                self._controller = AdaptiveRateController(self._int_option('batch_size', 2500))
+                print(f"Adaptive batch size enabled (ceiling {self._controller.ceiling})")
+            else:
+                self._controller = None
+            
+            if streaming:
+                print(f"Running streamed chunks across {workers} rustscan worker(s)")
+            else:
+                print(f"Running {len(chunks)} chunk(s) across {workers} rustscan worker(s)")
+            print(f"Running command: {' '.join(self._build_rustscan_command('<targets>', workers))}")
+            
+            failed = []
+            completed = set()
+            next_chunk = 0
+            # Sliding window: chunks are pulled (from a stream, as they are
+            # cut) only as earlier ones finish, so at most `window` futures
+            # ever exist and failures are reported as they happen
+            window = workers * 2
+            indexed_chunks = enumerate(chunks)
+            in_flight = {}
+            with open(output_file, 'a' if checkpoint and checkpoint.cursor else 'w') as outfile:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    while True:
+                        for index, chunk in itertools.islice(indexed_chunks, window - len(in_flight)):
+                            in_flight[executor.submit(self._scan_chunk, chunk, workers, results, outfile)] = index
+                        if not in_flight:
+                            break
+                        
+                        done, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+                        for future in done:
+                            index = in_flight.pop(future)
+                            success, error = future.result()
+                            if not success:
+                                failed.append(f"chunk {index + 1}: {error}")
+                                continue
                             
-                            if "Port" in line and "is open on" in line:
-                                try:
-                                    parts = line.split()
-                                    port = int(parts[1])
-                                    ip = parts[-1]
-                                    
-                                    if current_ip != ip:
-                                        if current_ip and current_ports:
-                                            results.append({
-                                                'ip': current_ip,
-                                                'open_ports': sorted(list(current_ports))
-                                            })
-                                        current_ip = ip
-                                        current_ports = set()
-                                    
-                                    current_ports.add(port)
-                                except (ValueError, IndexError):
-                                    continue
-                    
-                    if current_ip and current_ports:
-                        results.append({
-                            'ip': current_ip,
-                            'open_ports': sorted(list(current_ports))
-                        })
-                    
-                    _, stderr = process.communicate()
-                    
-                    if process.returncode != 0 and not results:
-                        return False, f"RustScan failed with error: {stderr}"
-                    
-                print(f"\nScan results saved to: {output_file}")
-                return True, results
-                
-            finally:
-                if cleanup_target:
-                    try:
-                        os.unlink(target_file)
-                    except:
-                        pass
+                            # The cursor only moves over an unbroken prefix of
+                            # finished chunks, so a resume never skips a gap
+                            completed.add(index)
+                            if checkpoint:
+                                while next_chunk in completed:
+                                    checkpoint.cursor += len(chunks[next_chunk])
+                                    next_chunk += 1
+                                checkpoint.update(checkpoint.cursor)
+            
+            if checkpoint:
+                if self.stop_scan or failed:
+                    checkpoint.update(checkpoint.cursor, force=True)
+                    print(f"Checkpoint saved to {checkpoint.path}")
+                else:
+                    checkpoint.remove()
+            
+            if self.stop_scan:
+                return False, "Scan stopped by user"
+            
+            if failed and not results:
+                return False, "; ".join(failed)
+            
+            for failure in failed:
+                print(f"[-] {failure}")
+            
+            print(f"\nScan results saved to: {output_file}")
+            if self.options['results_db']['value']:
+                scan_id = ScanResultStore(self.options['results_db']['value']).record(__name__, results, output_file)
+                print(f"Results stored as scan {scan_id} in {self.options['results_db']['value']}")
+            return True, results
                 
         except Exception as e:
             return False, str(e)
+    
+    def stop(self):
+        self.stop_scan = True
+        with self._lock:
+            for supervisor in self._supervisors:
+                supervisor.stop()
 
 def create_instance():
     return RustScanScanner()
\ No newline at end of file
@@ -0,0 +1,214 @@
+import bisect
+import heapq
+import ipaddress
+import json
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from storage import merge_locations
+
+
+class ScanResultAggregator:
+    def __init__(self, max_in_memory: int = 500000, spill_dir: Optional[str] = None,
+                 filter_bits: int = 1 << 25):
+        # Open ports are stored as one integer bitmap per IP, where bit i
+        # stands for self.ports[i]. Once max_in_memory IPs are held, the
+        # in-memory part is written out as a sorted run and cleared; the
+        # runs are merged back together when the results are iterated.
+        # Every run also gets a sorted file of 8-byte (ip, port) keys, so
+        # add() can still report repeats as seen. A fixed-size Bloom filter
+        # over those keys keeps the (mmapped) key files out of the way of
+        # anything that was never spilled; its hits are checked exactly.
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self.ports: List[int] = []
+        self.port_bits: Dict[int, int] = {}
+        self.hosts: Dict[int, int] = {}
+        self.info: Dict[int, dict] = {}
+        self.runs: List[str] = []
+        self.filter_bits = max(8, int(filter_bits))
+        self.filter = bytearray(0)
+        self.run_keys: List[memoryview] = []
+        self._maps: List[mmap.mmap] = []
+        self.lock = threading.Lock()
+        self._tmpdir = None
+        self._finalizer = None
+
+    def _port_bit(self, port: int) -> int:
+        bit = self.port_bits.get(port)
+        if bit is None:
+            bit = len(self.ports)
+            self.ports.append(port)
+            self.port_bits[port] = bit
+        return 1 << bit
+
+    def _decode_ports(self, bitmap: int) -> List[int]:
+        ports = []
+        bit = 0
+        while bitmap:
+            if bitmap & 1:
+                ports.append(self.ports[bit])
+            bitmap >>= 1
+            bit += 1
+        return sorted(ports)
+
+    @staticmethod
+    def _key(ip_int: int, port: Optional[int] = None) -> int:
+        # Port slot 0 marks the host itself
+        return ip_int << 17 | (0 if port is None else port + 1)
+
+    def _filter_positions(self, key: int) -> Iterator[int]:
+        # Three positions by double hashing
+        h1 = (key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        h2 = (key * 0xC2B2AE3D27D4EB4F) & 0xFFFFFFFFFFFFFFFF | 1
+        for i in range(3):
+            yield (h1 + i * h2) % self.filter_bits
+
+    def _was_spilled(self, ip_int: int, port: Optional[int] = None) -> bool:
+        if not self.runs:
+            return False
+        key = self._key(ip_int, port)
+        for position in self._filter_positions(key):
+            if not self.filter[position >> 3] & (1 << (position & 7)):
+                return False
+        for keys in self.run_keys:
+            index = bisect.bisect_left(keys, key)
+            if index < len(keys) and keys[index] == key:
+                return True
+        return False
+
+    def add(self, ip: str, port: Optional[int] = None, info: Optional[dict] = None) -> bool:
+        ip_int = int(ipaddress.IPv4Address(ip))
+        with self.lock:
+            known = self.hosts.get(ip_int)
+            is_new = known is None and not self._was_spilled(ip_int)
+            bitmap = known or 0
+            if port is not None:
+                bit = self._port_bit(int(port))
+                is_new = not bitmap & bit and not self._was_spilled(ip_int, int(port))
+                bitmap |= bit
+            self.hosts[ip_int] = bitmap
+            if info:
+                self.info.setdefault(ip_int, {}).update(info)
+            if len(self.hosts) >= self.max_in_memory:
+                self._spill()
+            return is_new
+
+    def _spill(self) -> None:
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.mkdtemp(prefix='locus_results_', dir=self.spill_dir)
+            self._finalizer = weakref.finalize(self, shutil.rmtree, self._tmpdir, True)
+        if not self.filter:
+            self.filter = bytearray((self.filter_bits + 7) // 8)
+        path = os.path.join(self._tmpdir, f'run_{len(self.runs)}.jsonl')
+        # Keys come out sorted: ips in order, each host before its ports
+        keys = array('Q')
+        with open(path, 'w') as f:
+            for ip_int in sorted(self.hosts):
+                ports = self._decode_ports(self.hosts[ip_int])
+                keys.append(self._key(ip_int))
+                keys.extend(self._key(ip_int, port) for port in ports)
+                f.write(json.dumps([ip_int, ports, self.info.get(ip_int)]) + '\n')
+        for key in keys:
+            for position in self._filter_positions(key):
+                self.filter[position >> 3] |= 1 << (position & 7)
+        keys_path = path[:-len('.jsonl')] + '.keys'
+        with open(keys_path, 'wb') as f:
+            keys.tofile(f)
+        with open(keys_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        self.run_keys.append(memoryview(mapped).cast('Q'))
+        self.runs.append(path)
+        self.hosts = {}
+        self.info = {}
+
+    def _memory_run(self, hosts: Dict[int, int], info: Dict[int, dict]) -> Iterator[list]:
+        for ip_int in sorted(hosts):
+            yield [ip_int, self._decode_ports(hosts[ip_int]), info.get(ip_int)]
+
+    def _file_run(self, path: str) -> Iterator[list]:
+        with open(path, 'r') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def entries(self) -> Iterator[list]:
+        # [ip_int, ports, info] in ip order, with spilled runs merged in.
+        # Taken from a snapshot, as scanner threads may add (and spill)
+        # while the results are read, e.g. by a checkpoint or pipeline.
+        with self.lock:
+            paths = list(self.runs)
+            hosts = dict(self.hosts)
+            info = {ip_int: dict(fields) for ip_int, fields in self.info.items()}
+        runs = [self._file_run(path) for path in paths]
+        runs.append(self._memory_run(hosts, info))
+
+        current = None
+        for ip_int, ports, info in heapq.merge(*runs, key=lambda entry: entry[0]):
+            if current and current[0] == ip_int:
+                current[1].update(ports)
+                if info:
+                    current[2].update(info)
+                continue
+            if current:
+                yield current
+            current = [ip_int, set(ports), dict(info or {})]
+        if current:
+            yield current
+
+    def __iter__(self) -> Iterator[dict]:
+        for entry in self.entries():
+            yield self._record(*entry)
+
+    def located(self, ranges: Iterable) -> Iterator[dict]:
+        # Records with fields['location'] from (start, end, location)
+        # ranges sorted by start, merge-joined with the ip-ordered entries
+        for (ip_int, ports, info), location in merge_locations(self.entries(), ranges,
+                                                               key=lambda entry: entry[0]):
+            if location:
+                info['location'] = location
+            yield self._record(ip_int, ports, info)
+
+    def _record(self, ip_int: int, ports: set, info: dict) -> dict:
+        record = {
+            'ip': str(ipaddress.IPv4Address(ip_int)),
+            'open_ports': sorted(ports)
+        }
+        if info:
+            record['fields'] = info
+        return record
+
+    def __bool__(self) -> bool:
+        return bool(self.hosts) or bool(self.runs)
+
+    def close(self) -> None:
+        for keys in self.run_keys:
+            keys.release()
+        for mapped in self._maps:
+            mapped.close()
+        self.run_keys = []
+        self._maps = []
+        if self._finalizer:
+            self._finalizer()
+        self.runs = []
+        self.filter = bytearray(0)
+
+
+class LocatedResults:
+    def __init__(self, results: ScanResultAggregator, ranges: Callable[[], Iterable]):
+        # Lazily located view of the results that can be iterated more than
+        # once; ranges() gives a fresh (start, end, location) iterable
+        self.results = results
+        self.ranges = ranges
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.results.located(self.ranges())
+
+    def __bool__(self) -> bool:
+        return bool(self.results)
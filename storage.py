@@ -1,5 +1,41 @@
+import bisect
 import ipaddress
-from typing import List, Dict, Optional, Set, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from targets import TargetSet
+
+def merge_locations(items: Iterable, ranges: Iterable[Tuple[int, int, Dict]],
+                    key: Callable = lambda item: item) -> Iterator[Tuple[object, Optional[Dict]]]:
+    # Merge join: items sorted by their integer ip (key) against
+    # non-overlapping (start, end, location) ranges sorted by start. Both
+    # sides are walked once, so n items over m ranges cost O(n + m).
+    ranges = iter(ranges)
+    current = next(ranges, None)
+    for item in items:
+        ip_int = key(item)
+        while current is not None and current[1] < ip_int:
+            current = next(ranges, None)
+        if current is not None and current[0] <= ip_int:
+            yield item, current[2]
+        else:
+            yield item, None
+
+def sorted_ranges(ip_ranges: List[Dict]) -> List[Tuple[int, int, Dict]]:
+    return sorted(((int(r['start']), int(r['end']), r['location']) for r in ip_ranges),
+                  key=lambda entry: entry[0])
+
+class RangeLocator:
+    def __init__(self, entries: List[Tuple[int, int, Dict]]):
+        # entries as returned by sorted_ranges()
+        self.starts = [entry[0] for entry in entries]
+        self.ends = [entry[1] for entry in entries]
+        self.locations = [entry[2] for entry in entries]
+        
+    def locate(self, ip: str) -> Optional[Dict]:
+        ip_int = int(ipaddress.IPv4Address(ip))
+        index = bisect.bisect_right(self.starts, ip_int) - 1
+        if index >= 0 and ip_int <= self.ends[index]:
+            return self.locations[index]
+        return None
 
 class IPRangeStorage:
     def __init__(self):
@@ -52,6 +88,25 @@ class IPRangeStorage:
             ips.extend([str(ipaddress.IPv4Address(ip)) for ip in range(int(start_ip), int(end_ip) + 1)])
         return ips
     
+    def get_target_set(self, query_key: str) -> TargetSet:
+        if query_key not in self.ranges:
+            return TargetSet()
+        
+        return TargetSet.from_ip_ranges(self.ranges[query_key]['ip_ranges'])
+    
+    def get_location_ranges(self, query_key: str) -> List[Tuple[int, int, Dict]]:
+        if query_key.lower() == 'all':
+            return sorted_ranges([r for query in self.ranges.values() for r in query['ip_ranges']])
+        if query_key in self.selections:
+            query_key = self.selections[query_key]['query_id']
+        if query_key not in self.ranges:
+            return []
+        
+        return sorted_ranges(self.ranges[query_key]['ip_ranges'])
+    
+    def get_locator(self, query_key: str) -> RangeLocator:
+        return RangeLocator(self.get_location_ranges(query_key))
+    
     def get_range_list(self, query_key: str) -> List[Tuple[str, str]]:
         if query_key not in self.ranges:
             return []
@@ -112,6 +167,13 @@ class IPRangeStorage:
             ips.extend([str(ipaddress.IPv4Address(ip)) for ip in range(int(start_ip), int(end_ip) + 1)])
         return ips
     
+    def get_selection_target_set(self, selection_id: str) -> TargetSet:
+        selection = self.selections.get(selection_id)
+        if not selection:
+            return TargetSet()
+        
+        return TargetSet.from_ip_ranges(selection['ip_ranges'])
+    
     def get_selection_range_list(self, selection_id: str) -> List[Tuple[str, str]]:
         selection = self.selections.get(selection_id)
         if not selection:
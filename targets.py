@@ -0,0 +1,104 @@
+import bisect
+import ipaddress
+from typing import Iterable, Iterator, List, Tuple
+
+
+class TargetSet:
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        self.ranges: List[Tuple[int, int]] = self._merge(ranges)
+
+    @staticmethod
+    def _merge(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    @classmethod
+    def from_ip_ranges(cls, ip_ranges: List[dict]) -> 'TargetSet':
+        return cls((int(r['start']), int(r['end'])) for r in ip_ranges)
+
+    @classmethod
+    def from_ip_list(cls, ip_list: Iterable[str]) -> 'TargetSet':
+        return cls((ip, ip) for ip in (int(ipaddress.IPv4Address(ip.strip())) for ip in ip_list))
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> 'TargetSet':
+        ranges = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if ' - ' in line:
+                start, end = line.split(' - ', 1)
+                ranges.append((int(ipaddress.IPv4Address(start.strip())),
+                               int(ipaddress.IPv4Address(end.strip()))))
+            else:
+                network = ipaddress.IPv4Network(line, strict=False)
+                ranges.append((int(network.network_address), int(network.broadcast_address)))
+        return cls(ranges)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'TargetSet':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_lines(f)
+
+    def extend(self, other: 'TargetSet') -> 'TargetSet':
+        self.ranges = self._merge(self.ranges + other.ranges)
+        return self
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in self.ranges)
+
+    def __contains__(self, ip: str) -> bool:
+        ip_int = int(ipaddress.IPv4Address(ip))
+        index = bisect.bisect_right(self.ranges, (ip_int, 0xffffffff)) - 1
+        return index >= 0 and self.ranges[index][0] <= ip_int <= self.ranges[index][1]
+
+    def __iter__(self) -> Iterator[str]:
+        for start, end in self.ranges:
+            for ip in range(start, end + 1):
+                yield str(ipaddress.IPv4Address(ip))
+
+    def skip(self, offset: int) -> 'TargetSet':
+        ranges = []
+        for start, end in self.ranges:
+            count = end - start + 1
+            if offset >= count:
+                offset -= count
+                continue
+            ranges.append((start + offset, end))
+            offset = 0
+        return TargetSet(ranges)
+
+    def chunks(self, size: int) -> Iterator['TargetSet']:
+        chunk = []
+        remaining = size
+        for start, end in self.ranges:
+            while start <= end:
+                stop = min(end, start + remaining - 1)
+                chunk.append((start, stop))
+                remaining -= stop - start + 1
+                start = stop + 1
+                if remaining == 0:
+                    yield TargetSet(chunk)
+                    chunk = []
+                    remaining = size
+        if chunk:
+            yield TargetSet(chunk)
+
+    def cidrs(self) -> Iterator[str]:
+        for start, end in self.ranges:
+            for network in ipaddress.summarize_address_range(
+                    ipaddress.IPv4Address(start), ipaddress.IPv4Address(end)):
+                yield network.with_prefixlen if network.prefixlen < 32 else str(network.network_address)
+
+
+def as_target_set(targets) -> TargetSet:
+    if isinstance(targets, TargetSet):
+        return targets
+    return TargetSet.from_ip_list(targets)
@@ -0,0 +1,53 @@
+import os
+import stat
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def stub_binary(tmp_path, monkeypatch):
+    # Writes an executable Python script named `name` into a directory that
+    # is put first on PATH (inherited by worker processes too)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def write(name, source):
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\n{source}")
+        path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        return path
+
+    return write
+
+
+# Prints a banner, then every odd address of --addresses (CIDRs inline or
+# one per line in a file) as open on each of --ports; with STUB_LOG set,
+# also logs the addresses it was given
+RUSTSCAN_STUB = r'''
+import ipaddress, os, sys
+args = sys.argv[1:]
+print('.----. .-. .-. .----..---.  .----. .---.   .--.  .-. .-.')
+addresses = args[args.index('--addresses') + 1]
+ports = args[args.index('--ports') + 1].split(',')
+if os.path.isfile(addresses):
+    with open(addresses) as f:
+        addresses = ','.join(line.strip() for line in f if line.strip())
+if os.environ.get('STUB_LOG'):
+    with open(os.environ['STUB_LOG'], 'a') as log:
+        log.write(addresses + '\n')
+for cidr in addresses.split(','):
+    for ip in ipaddress.IPv4Network(cidr):
+        if int(ip) % 2:
+            for port in ports:
+                print(f'Open {ip}:{port}', flush=True)
+'''
+
+
+@pytest.fixture
+def stub_rustscan(stub_binary):
+    return stub_binary('rustscan', RUSTSCAN_STUB)
@@ -0,0 +1,56 @@
+import pytest
+
+from budget import BudgetScheduler
+
+
+def shares(scheduler, resource='pps'):
+    return [getattr(allocation, resource) for allocation in scheduler.allocations.values()]
+
+
+def test_unlimited_budget_leaves_modules_alone():
+    scheduler = BudgetScheduler()
+    with scheduler.register('a', pps=500, sockets=10) as allocation:
+        assert (allocation.pps, allocation.sockets) == (None, None)
+        assert allocation.limit('pps', 500) == 500
+        assert allocation.reserve(10) == 0.0
+
+
+def test_water_fill_gives_spare_capacity_to_the_others():
+    scheduler = BudgetScheduler(max_pps=100)
+    small = scheduler.register('small', pps=10)
+    light = scheduler.register('light', weight=1)
+    heavy = scheduler.register('heavy', weight=3)
+
+    assert small.pps == 10
+    assert light.pps == pytest.approx(22.5)
+    assert heavy.pps == pytest.approx(67.5)
+    assert light.limit('pps', 5) == 5
+
+    small.release()
+    assert (light.pps, heavy.pps) == (pytest.approx(25), pytest.approx(75))
+
+
+def test_higher_priority_is_served_first():
+    scheduler = BudgetScheduler(max_sockets=100)
+    background = scheduler.register('background', sockets=80)
+    urgent = scheduler.register('urgent', priority=1, sockets=90)
+
+    assert (urgent.sockets, background.sockets) == (90, 10)
+    # Nobody is starved completely
+    other = scheduler.register('other', sockets=50)
+    assert min(shares(scheduler, 'sockets')) >= 1
+    assert other.sockets + background.sockets <= 10
+
+
+def test_others_hear_about_a_changed_share():
+    scheduler = BudgetScheduler(max_pps=100)
+    first = scheduler.register('first')
+    changes = []
+    first.on_change = lambda allocation: changes.append(allocation.pps)
+
+    second = scheduler.register('second')
+    scheduler.configure(max_pps=200)
+    second.release()
+
+    assert changes == [50, 100, 200]
+    assert scheduler.snapshot()[0]['name'] == 'first'
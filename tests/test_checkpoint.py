@@ -0,0 +1,118 @@
+import copy
+import ipaddress
+import sqlite3
+
+import pytest
+
+import check_host_module
+import rustscan_scanner_module
+from checkpoint import Checkpoint, open_checkpoint
+from results_db import ScanRecorder, ScanResultStore
+from targets import TargetSet
+
+FIRST = int(ipaddress.IPv4Address('10.0.0.0'))
+
+
+def module_options(module, **values):
+    options = copy.deepcopy(module.MODULE_INFO['options'])
+    for name, value in values.items():
+        options[name]['value'] = value
+    return options
+
+
+def test_state_round_trips_and_saves_on_interval(tmp_path):
+    path = str(tmp_path / 'scan.ckpt')
+    targets = TargetSet([(FIRST, FIRST + 99)])
+    checkpoint = open_checkpoint('x_module', {'checkpoint_file': {'value': path}, 'ports': {'value': '80'}},
+                                 targets, 'out.txt')
+    checkpoint.scan_id = 7
+    checkpoint.update(10, force=True)
+    # Within the save interval the cursor only moves in memory
+    checkpoint.update(20)
+
+    loaded = Checkpoint.load(path)
+    assert (loaded.module, loaded.cursor, loaded.output_file, loaded.scan_id) == ('x_module', 10, 'out.txt', 7)
+    assert loaded.options == {'checkpoint_file': path, 'ports': '80'}
+    assert loaded.remaining_targets().ranges == [(FIRST + 10, FIRST + 99)]
+
+    checkpoint.remove()
+    assert not (tmp_path / 'scan.ckpt').exists()
+
+
+def test_output_is_only_replayed_past_the_first_step(tmp_path):
+    output = tmp_path / 'out.txt'
+    output.write_text('10.0.0.1:80\n')
+    checkpoint = Checkpoint(str(tmp_path / 'c'), targets=TargetSet([(FIRST, FIRST + 9)]),
+                            output_file=str(output))
+
+    assert list(checkpoint.output_lines()) == []
+    checkpoint.cursor = 4
+    assert list(checkpoint.output_lines()) == ['10.0.0.1:80\n']
+
+
+def test_rustscan_resumes_after_the_cursor(tmp_path, monkeypatch, stub_rustscan):
+    log = tmp_path / 'rustscan.log'
+    monkeypatch.setenv('STUB_LOG', str(log))
+    output = tmp_path / 'out.txt'
+    output.write_text('10.0.0.1:80\n10.0.0.3:80\n')
+    options = module_options(rustscan_scanner_module, query_id='test_1', ports='80', chunk_size='4',
+                             workers='1', output_file=str(output), results_db='')
+    checkpoint = Checkpoint(str(tmp_path / 'scan.ckpt'), module='rustscan_scanner_module',
+                            options={name: option['value'] for name, option in options.items()},
+                            targets=TargetSet([(FIRST, FIRST + 15)]), cursor=4, output_file=str(output))
+
+    scanner = rustscan_scanner_module.create_instance()
+    scanner.options = options
+    success, results = scanner.run(checkpoint=checkpoint)
+
+    assert success, results
+    assert log.read_text().split() == ['10.0.0.4/30', '10.0.0.8/30', '10.0.0.12/30']
+    assert [record['ip'] for record in results] == [f'10.0.0.{i}' for i in range(1, 16, 2)]
+    assert output.read_text().splitlines()[:2] == ['10.0.0.1:80', '10.0.0.3:80']
+    assert len(output.read_text().splitlines()) == 8
+    assert not (tmp_path / 'scan.ckpt').exists()
+
+
+def test_finished_host_discovery_checkpoint_does_not_rescan(tmp_path, monkeypatch):
+    input_file = tmp_path / 'targets.txt'
+    input_file.write_text('10.0.0.0/30\n')
+    output = tmp_path / 'hosts.csv'
+    writer = check_host_module.HostResultWriter(str(output))
+    writer.add(check_host_module.HostResult(ip='10.0.0.1', status='alive'))
+    writer.add(check_host_module.HostResult(ip='10.0.0.2', status='dead'))
+    writer.close()
+
+    scanner = check_host_module.create_instance()
+    scanner.options = module_options(check_host_module, input_file=str(input_file), results_db='',
+                                     checkpoint_file=str(tmp_path / 'scan.ckpt'))
+    monkeypatch.setattr(check_host_module.os, 'geteuid', lambda: 0)
+    monkeypatch.setattr(scanner, 'scan_hosts', lambda *args: pytest.fail('finished checkpoint was rescanned'))
+    checkpoint = Checkpoint(str(tmp_path / 'scan.ckpt'), module='check_host_module',
+                            targets=TargetSet([(FIRST, FIRST + 3)]), cursor=4, output_file=str(output))
+
+    success, summary = scanner.run(checkpoint=checkpoint)
+
+    assert success, summary
+    assert (summary['total_scanned'], summary['alive_hosts'], summary['dead_hosts']) == (2, 1, 1)
+
+
+def test_resumed_host_discovery_keeps_recording_its_scan(tmp_path):
+    store = ScanResultStore(str(tmp_path / 'results.db'))
+    output = str(tmp_path / 'hosts.csv')
+    recorder = ScanRecorder(store, 'check_host_module', output)
+    writer = check_host_module.HostResultWriter(output, recorder=recorder)
+    writer.add(check_host_module.HostResult(ip='10.0.0.1', status='alive'))
+    # Interrupted before the recorder flushed anything
+    writer.file.close()
+
+    resumed = ScanRecorder(store, 'check_host_module', output, scan_id=recorder.scan_id)
+    writer = check_host_module.HostResultWriter(output, resume_targets=TargetSet([(FIRST + 2, FIRST + 3)]),
+                                                recorder=resumed)
+    writer.add(check_host_module.HostResult(ip='10.0.0.3', status='alive'))
+    writer.close()
+
+    with sqlite3.connect(store.db_path) as conn:
+        rows = conn.execute("SELECT scan_id, ip FROM results ORDER BY ip").fetchall()
+        scans = conn.execute("SELECT scan_id, result_count FROM scans").fetchall()
+    assert rows == [(recorder.scan_id, FIRST + 1), (recorder.scan_id, FIRST + 3)]
+    assert scans == [(recorder.scan_id, 2)]
@@ -0,0 +1,70 @@
+import json
+import sqlite3
+
+import pytest
+
+from dbmanager import IP2LocationUpdater
+
+ROWS = [(0, 16777215, '-', '-', '-', '-', 0.0, 0.0),
+        (16777216, 16777471, 'AU', 'Australia', 'Queensland', 'Brisbane', -27.47, 153.03)]
+
+
+@pytest.fixture
+def updater(tmp_path, monkeypatch):
+    # An imported database, as left by a version without the ip_to index
+    updater = IP2LocationUpdater(str(tmp_path / 'ip2location.db'))
+    updater._create_database()
+    with sqlite3.connect(updater.db_path) as conn:
+        conn.executemany("INSERT INTO ip2location VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ROWS)
+        conn.executemany("INSERT INTO metadata VALUES (?, ?)", [('file_hash', 'x'), ('row_count', '2')])
+    monkeypatch.setattr(updater, 'update_database', lambda token: pytest.fail('database was downloaded again'))
+    return updater
+
+
+def indexes(updater):
+    with sqlite3.connect(updater.db_path) as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'ip2location'")]
+
+
+def test_unstamped_database_is_checked_indexed_and_stamped(updater, monkeypatch):
+    assert updater.ensure_database_exists('token')
+    assert indexes(updater) == ['idx_ip2location_ip_to']
+    assert updater._stamp_matches()
+
+    # A matching stamp skips the tables entirely
+    monkeypatch.setattr(sqlite3, 'connect', lambda *args, **kwargs: pytest.fail('tables were read'))
+    assert updater.ensure_database_exists('token')
+
+
+def test_stamp_is_invalidated_by_a_changed_file(updater):
+    updater.ensure_database_exists('token')
+    with sqlite3.connect(updater.db_path) as conn:
+        conn.execute("INSERT INTO ip2location VALUES (16777472, 16777727, 'CN', 'China', '-', '-', 0, 0)")
+
+    assert not updater._stamp_matches()
+    assert updater.ensure_database_exists('token')
+    assert updater._stamp_matches()
+
+
+def test_stamp_from_before_the_index_is_not_trusted(updater):
+    updater.ensure_database_exists('token')
+    with open(updater.stamp_path) as f:
+        stamp = json.load(f)
+    del stamp['indexed']
+    with open(updater.stamp_path, 'w') as f:
+        json.dump(stamp, f)
+
+    assert not updater._stamp_matches()
+    assert updater.ensure_database_exists('token')
+    assert updater._stamp_matches()
+
+
+def test_empty_database_is_downloaded(tmp_path):
+    updater = IP2LocationUpdater(str(tmp_path / 'ip2location.db'))
+    updater._create_database()
+    downloads = []
+    updater.update_database = lambda token: downloads.append(token) or True
+
+    assert updater.ensure_database_exists('token')
+    assert downloads == ['token']
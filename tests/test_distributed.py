@@ -0,0 +1,49 @@
+import copy
+import ipaddress
+import sqlite3
+
+import pytest
+
+import rustscan_scanner_module
+from distributed import Coordinator, Worker
+from targets import TargetSet
+
+
+def test_two_local_workers_merge_into_one_scan(tmp_path, stub_rustscan):
+    options = copy.deepcopy(rustscan_scanner_module.MODULE_INFO['options'])
+    results_db = tmp_path / 'results.db'
+    (tmp_path / 'out').mkdir()
+    for name, value in {'query_id': 'test_1', 'ports': '80', 'results_db': str(results_db),
+                        'output_file': str(tmp_path / 'out' / 'rustscan.txt')}.items():
+        options[name]['value'] = value
+
+    coordinator = Coordinator('rustscan_scanner_module', options, f"unix:{tmp_path / 'c.sock'}",
+                              shard_size=64, local_workers=2)
+    first = int(ipaddress.IPv4Address('10.0.0.0'))
+    success, results = coordinator.run(TargetSet([(first, first + 511)]))
+
+    assert success, results
+    assert all(shard.status == 'done' for shard in coordinator.shards.values())
+    expected = [str(ipaddress.IPv4Address(ip)) for ip in range(first + 1, first + 512, 2)]
+    assert [record['ip'] for record in results] == expected
+
+    with sqlite3.connect(results_db) as conn:
+        scans = conn.execute("SELECT module, result_count FROM scans").fetchall()
+    assert scans == [('rustscan_scanner_module', 256)]
+
+
+def test_worker_with_wrong_token_is_rejected(tmp_path):
+    address = f"unix:{tmp_path / 'c.sock'}"
+    coordinator = Coordinator('rustscan_scanner_module', {}, address, token='secret')
+    coordinator._start_server()
+    try:
+        assert Worker(address, token='nope', connect_attempts=3, retry_interval=0.1).run() is False
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
+
+
+@pytest.mark.parametrize('name', ['os', '../locus_module', 'missing_module'])
+def test_worker_refuses_foreign_modules(name):
+    with pytest.raises(ValueError):
+        Worker._load_module(name)
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def run_locus(tmp_path, *args):
+    # From an empty directory, so nothing is read from or left in the repo
+    process = subprocess.run([sys.executable, os.path.join(ROOT, 'locus.py'), *args],
+                             cwd=tmp_path, capture_output=True, text=True, timeout=120)
+    return process.returncode, [json.loads(line) for line in process.stdout.splitlines()]
+
+
+def test_every_command_reports_one_json_line(tmp_path):
+    code, records = run_locus(tmp_path, '--exec',
+                              'use module rustscan_scanner_module; set ports 443; show options; budget pps=500')
+
+    assert code == 0
+    assert [record['command'] for record in records] == [
+        'use module rustscan_scanner_module', 'set ports 443', 'show options', 'budget pps=500']
+    assert all(record['success'] and record['error'] is None for record in records)
+    assert records[0]['result']['module'] == 'rustscan_scanner_module'
+    assert records[2]['result']['options']['ports'] == '443'
+    assert records[3]['result']['limits']['pps'] == 500
+
+
+def test_first_failure_stops_the_script(tmp_path):
+    script = tmp_path / 'scan.locus'
+    script.write_text('show modules\nuse module no_such_module\nshow options\n')
+    code, records = run_locus(tmp_path, '--script', str(script))
+
+    assert code == 1
+    assert [record['success'] for record in records] == [True, False]
+    assert 'no_such_module' in records[1]['error']
+    assert any(module['id'] == 'rustscan_scanner_module' for module in records[0]['result'])
+
+
+def test_reading_a_missing_results_db_fails_without_creating_it(tmp_path):
+    code, records = run_locus(tmp_path, '--exec', 'show scans db=missing.db')
+
+    assert code == 1
+    assert 'missing.db' in records[0]['error']
+    assert not (tmp_path / 'missing.db').exists()
@@ -0,0 +1,69 @@
+import threading
+import types
+
+from jobs import JobManager
+
+
+class Scanner:
+    def __init__(self):
+        self.options = {}
+        self.stop_scan = threading.Event()
+
+    def run(self, targets):
+        if targets == 'fail':
+            raise RuntimeError('boom')
+        if targets == 'block':
+            self.stop_scan.wait(5)
+            return False, 'stopped'
+        return True, list(targets)
+
+    def stop(self):
+        self.stop_scan.set()
+
+
+MODULE = types.SimpleNamespace(create_instance=Scanner)
+
+
+def test_jobs_queue_run_and_report():
+    jobs = JobManager(max_concurrent=1)
+    blocking = jobs.submit('scanner_module', MODULE, {'ports': {'value': '80'}}, 'block', weight=2, priority=1)
+    queued = jobs.submit('scanner_module', MODULE, {}, ['10.0.0.1'])
+    failing = jobs.submit('scanner_module', MODULE, {}, 'fail')
+
+    assert queued.status == 'queued'
+    assert (blocking.weight, blocking.priority) == (2, 1)
+    assert (blocking.instance.weight, blocking.instance.priority) == (2, 1)
+    assert jobs.kill(failing.id)
+    assert failing.status == 'killed'
+
+    assert jobs.kill(blocking.id)
+    jobs.wait()
+
+    assert blocking.status == 'killed'
+    assert (queued.status, queued.success, queued.result) == ('done', True, ['10.0.0.1'])
+    assert [job.id for job in jobs.list()] == [1, 2, 3]
+    assert jobs.active() == []
+    jobs.shutdown()
+
+
+def test_failures_are_reported_to_on_finish():
+    finished = []
+    jobs = JobManager(on_finish=finished.append)
+    job = jobs.submit('scanner_module', MODULE, {}, 'fail')
+    jobs.wait()
+
+    assert finished == [job]
+    assert (job.status, job.result) == ('failed', {'error': 'boom'})
+    assert jobs.get('nope') is None and jobs.get(str(job.id)) is job
+    jobs.shutdown()
+
+
+def test_options_are_copied_per_job():
+    jobs = JobManager()
+    options = {'ports': {'value': '80'}}
+    job = jobs.submit('scanner_module', MODULE, options, [])
+    options['ports']['value'] = '443'
+    jobs.wait()
+
+    assert job.options == {'ports': {'value': '80'}}
+    jobs.shutdown()
@@ -0,0 +1,139 @@
+import socket
+import threading
+import time
+import types
+
+import probe_engine
+from pipeline import Pipeline, TargetStream
+
+
+def test_stream_drops_duplicates_and_ends_on_close():
+    stream = TargetStream()
+    for ip in ['10.0.0.1', '10.0.0.2', '10.0.0.1']:
+        stream.put(ip, 80)
+    stream.close()
+    stream.put('10.0.0.3')
+
+    assert len(stream) == 2
+    assert list(stream) == ['10.0.0.1', '10.0.0.2']
+    # Closed streams stay closed for every reader
+    assert list(stream) == []
+
+
+def test_stream_batches_flush_a_partial_batch_after_linger():
+    stream = TargetStream()
+    stream.put('10.0.0.1')
+    batches = stream.batches(100, linger=0.1)
+
+    started = time.monotonic()
+    assert list(next(batches)) == ['10.0.0.1']
+    assert time.monotonic() - started < 1.0
+
+    stream.put('10.0.0.2')
+    stream.close()
+    assert [list(batch) for batch in batches] == [['10.0.0.2']]
+
+
+class Producer:
+    def __init__(self, release):
+        self.release = release
+        self.options = {}
+        self.result_sink = None
+
+    def run(self, ip_list):
+        for ip in ip_list:
+            self.result_sink(ip)
+            # The second host only comes once the next stage saw the first
+            self.release.wait(5)
+        return True, None
+
+
+class Consumer:
+    accepts_stream = True
+
+    def __init__(self, release):
+        self.release = release
+        self.options = {}
+        self.result_sink = None
+
+    def run(self, ip_list):
+        for ip in ip_list:
+            self.release.set()
+            self.result_sink(ip, 443, {'seen_by': 'consumer'})
+        return True, None
+
+
+def module(factory):
+    return types.SimpleNamespace(create_instance=factory)
+
+
+def test_pipeline_streams_targets_between_stages():
+    release = threading.Event()
+    pipeline = Pipeline([('producer_module', module(lambda: Producer(release)), {}),
+                         ('consumer_module', module(lambda: Consumer(release)), {})])
+
+    success, results = pipeline.run(['10.0.0.2', '10.0.0.1'])
+
+    assert success, results
+    assert [(record['ip'], record['open_ports'], record['fields']) for record in results] == [
+        ('10.0.0.1', [443], {'seen_by': 'consumer'}),
+        ('10.0.0.2', [443], {'seen_by': 'consumer'}),
+    ]
+
+
+class IdleAsyncEngine(probe_engine.AsyncProbeEngine):
+    # Sockets that never see a reply, so every probe times out
+    def _open_sockets(self):
+        self._send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.setblocking(False)
+        self._recv_sockets = [receiver]
+
+    async def _send(self, target, data):
+        pass
+
+
+class IdleBatchEngine(probe_engine.BatchProbeEngine):
+    def _send_batch(self, batch, probes):
+        return [self._build(target, probe)[0] for target in batch for probe in probes]
+
+
+def first_result_while_stream_is_open(engine):
+    stream = TargetStream()
+    stream.put('192.0.2.1')
+    results = engine.run(stream, ['icmp_echo'])
+    started = time.monotonic()
+    first = next(results)
+    elapsed = time.monotonic() - started
+    stream.close()
+    rest = list(results)
+    return first, elapsed, rest
+
+
+def test_async_engine_times_out_probes_while_the_stream_is_idle():
+    first, elapsed, rest = first_result_while_stream_is_open(IdleAsyncEngine(0.2, raw_packets=False))
+
+    assert first == (0, '192.0.2.1', {})
+    assert elapsed < 2.0
+    assert rest == []
+
+
+def test_batch_engine_sends_a_partial_batch_while_the_stream_is_idle():
+    first, elapsed, rest = first_result_while_stream_is_open(IdleBatchEngine(0.2, batch_size=100, linger=0.1))
+
+    assert first == ('192.0.2.1', {})
+    assert elapsed < 2.0
+    assert rest == []
+
+
+def test_async_engine_stops_while_the_stream_is_idle():
+    engine = IdleAsyncEngine(0.2, raw_packets=False)
+    stream = TargetStream()
+    stream.put('192.0.2.1')
+    results = engine.run(stream, ['icmp_echo'])
+    next(results)
+
+    started = time.monotonic()
+    results.close()
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,74 @@
+import os
+
+from scan_results import LocatedResults, ScanResultAggregator
+
+
+def addresses(count):
+    return [f"10.0.{i // 256}.{i % 256}" for i in range(count)]
+
+
+def test_repeats_are_reported_after_a_spill():
+    results = ScanResultAggregator(max_in_memory=10)
+    ips = addresses(100)
+    assert all(results.add(ip, 80) for ip in ips)
+    assert len(results.runs) == 10
+
+    assert not any(results.add(ip, 80) for ip in ips)
+    assert all(results.add(ip, 443) for ip in ips[:5])
+    assert not results.add(ips[0])
+    assert results.add('10.9.9.9')
+
+    records = list(results)
+    assert [record['ip'] for record in records] == ips + ['10.9.9.9']
+    assert records[0]['open_ports'] == [80, 443] and records[50]['open_ports'] == [80]
+    results.close()
+
+
+def test_spilled_keys_are_not_held_in_memory():
+    # The filter is sized once; more spills only add key files on disk
+    results = ScanResultAggregator(max_in_memory=10, filter_bits=1 << 12)
+    for ip in addresses(50):
+        results.add(ip, 80)
+    filter_size = len(results.filter)
+    for ip in addresses(2000)[50:]:
+        results.add(ip, 80)
+
+    assert len(results.filter) == filter_size
+    assert len(results.run_keys) == len(results.runs) == 200
+    # A saturated filter only costs lookups, never a wrong answer
+    assert results.add('10.200.0.1', 80)
+    assert not results.add('10.0.3.0', 80)
+    results.close()
+
+
+def test_fields_are_merged_across_runs():
+    results = ScanResultAggregator(max_in_memory=1)
+    results.add('192.0.2.1', 80, {'ttl': '64'})
+    results.add('192.0.2.2', 80)
+    results.add('192.0.2.1', 443, {'window': '1024'})
+
+    assert list(results)[0] == {'ip': '192.0.2.1', 'open_ports': [80, 443],
+                                'fields': {'ttl': '64', 'window': '1024'}}
+
+
+def test_close_removes_spilled_runs():
+    results = ScanResultAggregator(max_in_memory=2)
+    for ip in addresses(10):
+        results.add(ip, 22)
+    spill_dir = os.path.dirname(results.runs[0])
+    results.close()
+
+    assert not os.path.exists(spill_dir)
+    assert not results
+
+
+def test_located_results_can_be_read_twice():
+    results = ScanResultAggregator(max_in_memory=2)
+    for ip in addresses(4):
+        results.add(ip, 80)
+    city = {'city': 'Ankara'}
+    located = LocatedResults(results, lambda: iter([(167772160, 167772161, city)]))
+
+    first = [record.get('fields', {}).get('location') for record in located]
+    assert first == [city, city, None, None]
+    assert [record.get('fields', {}).get('location') for record in located] == first
@@ -0,0 +1,40 @@
+import ipaddress
+
+from targets import TargetSet
+
+
+def ip(address):
+    return int(ipaddress.IPv4Address(address))
+
+
+def test_overlapping_and_adjacent_ranges_are_merged():
+    targets = TargetSet([(ip('10.0.0.10'), ip('10.0.0.20')), (ip('10.0.0.0'), ip('10.0.0.9')),
+                         (ip('10.0.0.15'), ip('10.0.0.30')), (ip('10.0.1.0'), ip('10.0.1.0'))])
+
+    assert targets.ranges == [(ip('10.0.0.0'), ip('10.0.0.30')), (ip('10.0.1.0'), ip('10.0.1.0'))]
+    assert len(targets) == 32
+    assert '10.0.0.30' in targets and '10.0.1.0' in targets
+    assert '10.0.0.31' not in targets
+
+
+def test_skip_moves_across_ranges():
+    targets = TargetSet([(ip('10.0.0.0'), ip('10.0.0.3')), (ip('10.0.1.0'), ip('10.0.1.3'))])
+
+    assert list(targets.skip(5)) == ['10.0.1.1', '10.0.1.2', '10.0.1.3']
+    assert len(targets.skip(8)) == 0
+    assert list(targets.skip(0)) == list(targets)
+
+
+def test_chunks_cover_the_set_in_order():
+    targets = TargetSet([(ip('10.0.0.0'), ip('10.0.0.9')), (ip('10.0.2.0'), ip('10.0.2.6'))])
+    chunks = list(targets.chunks(4))
+
+    assert [len(chunk) for chunk in chunks] == [4, 4, 4, 4, 1]
+    assert [address for chunk in chunks for address in chunk] == list(targets)
+
+
+def test_from_lines_and_cidrs_round_trip():
+    targets = TargetSet.from_lines(['# comment', '192.0.2.0/30', '192.0.2.4 - 192.0.2.8', ''])
+
+    assert list(targets.cidrs()) == ['192.0.2.0/29', '192.0.2.8']
+    assert TargetSet.from_lines(targets.cidrs()).ranges == targets.ranges
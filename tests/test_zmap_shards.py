@@ -0,0 +1,63 @@
+import copy
+import ipaddress
+import json
+
+import zmap_scanner_module
+from targets import TargetSet
+
+# Answers on every odd address of its shard's slice, like `--shards N
+# --shard i` splitting one permutation, and logs how it was invoked
+ZMAP_STUB = r'''
+import ipaddress, json, os, sys
+args = sys.argv[1:]
+if '--version' in args:
+    print('zmap 4.0.0 (stub)')
+    sys.exit(0)
+with open(os.environ['STUB_LOG'], 'a') as log:
+    log.write(json.dumps(args) + '\n')
+shards = int(args[args.index('--shards') + 1]) if '--shards' in args else 1
+shard = int(args[args.index('--shard') + 1]) if '--shard' in args else 0
+port = args[args.index('--target-ports') + 1]
+fields = args[args.index('--output-fields') + 1].split(',')
+print(','.join(fields))
+hits = 0
+for line in sys.stdin:
+    for ip in ipaddress.IPv4Network(line.strip()):
+        if int(ip) % shards == shard and int(ip) % 2:
+            print(','.join({'saddr': str(ip), 'dport': port}.get(f, '64') for f in fields))
+            hits += 1
+sys.stderr.write(f"0:01 100% (0:00 left); send: 10 10 p/s (10 p/s avg); recv: {hits} {hits} p/s "
+                 f"({hits} p/s avg); drops: 0 p/s (0 p/s avg); hitrate: 50.00%\n")
+'''
+
+
+def test_sharded_output_is_merged(tmp_path, monkeypatch, stub_binary):
+    stub_binary('zmap', ZMAP_STUB)
+    log = tmp_path / 'zmap.log'
+    monkeypatch.setenv('STUB_LOG', str(log))
+    monkeypatch.setattr(zmap_scanner_module.os, 'geteuid', lambda: 0)
+
+    scanner = zmap_scanner_module.create_instance()
+    scanner.options = copy.deepcopy(zmap_scanner_module.MODULE_INFO['options'])
+    output_file = tmp_path / 'zmap.csv'
+    for name, value in {'query_id': 'test_1', 'ports': '443', 'interface': 'lo', 'shards': '3',
+                        'output_fields': 'ttl', 'output_file': str(output_file),
+                        'results_db': str(tmp_path / 'results.db')}.items():
+        scanner.options[name]['value'] = value
+
+    first = int(ipaddress.IPv4Address('192.0.2.0'))
+    success, results = scanner.run(TargetSet([(first, first + 63)]))
+
+    assert success, results
+    invocations = [json.loads(line) for line in log.read_text().splitlines()]
+    assert sorted(args[args.index('--shard') + 1] for args in invocations) == ['0', '1', '2']
+    assert len({args[args.index('--seed') + 1] for args in invocations}) == 1
+
+    expected = [str(ipaddress.IPv4Address(ip)) for ip in range(first + 1, first + 64, 2)]
+    records = list(results)
+    assert [record['ip'] for record in records] == expected
+    assert all(record['open_ports'] == [443] and record['fields'] == {'ttl': '64'} for record in records)
+
+    lines = output_file.read_text().splitlines()
+    assert lines[0] == 'saddr,dport,ttl'
+    assert sorted(line.split(',')[0] for line in lines[1:]) == sorted(expected)
@@ -1,6 +1,10 @@
+import ast
+import csv
+import itertools
 import os
 import importlib
 import shlex
+import sqlite3
 import subprocess
 from rich.console import Console
 from rich.panel import Panel
@@ -10,12 +14,56 @@ from prompt_toolkit import PromptSession
 from prompt_toolkit.history import FileHistory
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
 from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.patch_stdout import patch_stdout
 from storage import IPRangeStorage
+from scan_results import LocatedResults, ScanResultAggregator
+from ip2location_query import IP2LocationQuery
+from targets import TargetSet
+from checkpoint import Checkpoint
+from jobs import JobManager
+from pipeline import Pipeline
+from distributed import DEFAULT_ADDRESS, TOKEN_ENV, Coordinator
+from budget import scheduler
+from results_db import LOCATION_FILTERS, RESULTS_DB_PATH, ScanResultStore
+
+MAX_CONCURRENT_JOBS = 2
+
+# Result tables are printed this many rows at a time
+TABLE_CHUNK = 1000
+
+def _literal_or_none(node):
+    if isinstance(node, ast.Dict):
+        return {_literal_or_none(key): _literal_or_none(value)
+                for key, value in zip(node.keys, node.values) if key is not None}
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal_or_none(element) for element in node.elts]
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+def read_module_info(path):
+    # MODULE_INFO straight from the source, without running the module;
+    # computed values (e.g. a probed default interface) come back as None
+    # until the module is actually imported
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(target, ast.Name) and target.id == 'MODULE_INFO' for target in node.targets):
+            return _literal_or_none(node.value)
+    return None
 
 class InteractiveConsole:
-    def __init__(self):
+    def __init__(self, interactive: bool = True):
         self.console = Console()
         self.running = True
+        self.interactive = interactive
+        # Outcome of the last command, for script mode: error is the last
+        # error message printed, result the data the command produced
+        self.error_message = None
+        self.last_result = None
+        self.emit = None
         self.current_city = None
         self.current_country = None
         self.current_country_code = None
@@ -26,24 +74,26 @@ class InteractiveConsole:
         self.modules = {}
         self.current_module = None
         self.load_modules()
+        self.jobs = JobManager(MAX_CONCURRENT_JOBS, on_finish=self._job_finished)
         
-        history_file = os.path.expanduser('~/.locus_history')
-
-        style = Style.from_dict({
-            'red': '#ff0000',
-            'cyan': '#00ffff'
-        })
+        self.history_file = os.path.expanduser('~/.locus_history')
+        self.session = None
+        
+        # Scripts never prompt, so they skip the prompt session and history
+        if interactive:
+            style = Style.from_dict({
+                'red': '#ff0000',
+                'cyan': '#00ffff'
+            })
 
-        self.session = PromptSession(
-            history=FileHistory(history_file),
-            auto_suggest=AutoSuggestFromHistory(),
-            enable_history_search=True,
-            complete_while_typing=True,
-            style=style
-        )
+            self.session = PromptSession(
+                history=FileHistory(self.history_file),
+                auto_suggest=AutoSuggestFromHistory(),
+                enable_history_search=True,
+                complete_while_typing=True,
+                style=style
+            )
 
-        
-        
         self._init_commands()
         self._init_completer()
     
@@ -63,6 +113,15 @@ class InteractiveConsole:
             'export_ranges': self.export_ranges,
             'get_ips': self.get_ips,
             'select_ranges': self.select_ranges,
+            'resume': self.resume,
+            'jobs': self.show_jobs,
+            'job_status': self.job_status,
+            'job_kill': self.job_kill,
+            'pipeline': self.run_pipeline,
+            'distribute': self.distribute,
+            'budget': self.budget,
+            'show_scans': self.show_scans,
+            'query_results': self.query_results,
         }
     
     def _init_completer(self):
@@ -71,7 +130,8 @@ class InteractiveConsole:
             'update', 'help', 'exit', 'back', 'clear', 'history', 
             'show current', 'show ranges', 'show modules', 'show options',
             'show selections', 'use module', 'export ranges', 'get ips',
-            'select ranges', 'run'
+            'select ranges', 'run', 'run -j', 'resume', 'jobs', 'job status', 'job kill',
+            'pipeline', 'distribute', 'budget', 'show scans', 'query results'
         ])
     
     def _get_prompt(self):
@@ -89,6 +149,10 @@ class InteractiveConsole:
             ('class:default', '] > ')
         ]
     
+    def error(self, message):
+        self.error_message = message
+        self.console.print(f"[red]{message}[/red]")
+    
     def back(self, *args):
         if self.current_module:
             self.current_module = None
@@ -112,11 +176,11 @@ class InteractiveConsole:
                 self.console.print(result.stdout.strip())
             
             if result.stderr:
-                self.console.print(f"[red]{result.stderr.strip()}[/red]")
+                self.error(f"{result.stderr.strip()}")
                 
             return result.returncode == 0
         except Exception as e:
-            self.console.print(f"[red]Error executing command: {str(e)}[/red]")
+            self.error(f"Error executing command: {str(e)}")
             return False
     def load_modules(self):
         current_dir = os.path.dirname(__file__)
@@ -124,14 +188,27 @@ class InteractiveConsole:
             if file.endswith('_module.py'):
                 module_name = file[:-3]
                 try:
-                    module = importlib.import_module(module_name)
-                    if hasattr(module, 'MODULE_INFO'):
+                    info = read_module_info(os.path.join(current_dir, file))
+                    if info is not None:
                         self.modules[module_name] = {
-                            'info': module.MODULE_INFO,
-                            'module': module
+                            'info': info,
+                            'module': None
                         }
                 except Exception as e:
-                    self.console.print(f"[red]Error loading module {module_name}: {str(e)}[/red]")
+                    self.error(f"Error loading module {module_name}: {str(e)}")
+    
+    def import_module(self, module_id):
+        # Modules are only imported once they are used
+        module_data = self.modules[module_id]
+        if module_data['module'] is None:
+            try:
+                module = importlib.import_module(module_id)
+            except Exception as e:
+                self.error(f"Error loading module {module_id}: {str(e)}")
+                return False
+            module_data['module'] = module
+            module_data['info'] = module.MODULE_INFO
+        return True
     
     def show_help(self, *args):
         help_text = """
@@ -153,6 +230,29 @@ class InteractiveConsole:
             use module       Switch to a specific module
             set <option>     Set module option value
             run              Run current module
+            run -j           Run current module as a background job
+            run [-j] [weight=W] [priority=P]
+                             Run with a weight/priority for the shared budget
+            resume FILE      Continue an interrupted scan from its checkpoint file
+            pipeline MOD MOD [geo] [-j]
+                             Stream each module's results into the next one
+            distribute [listen=ADDR] [workers=N] [shard_size=N] [lease=S] [attempts=N] [token=T] [-j]
+                             Split the current module's targets into shards for
+                             workers (python locus.py --worker ADDR)
+
+            [yellow]Job Commands:[/yellow]
+            jobs              List background jobs
+            job status ID     Show a job's options, progress and results
+            job kill ID       Stop a queued or running job
+            budget [pps=N] [sockets=N]
+                              Show or set the pps/socket budget shared by all modules
+
+            [yellow]Result Commands:[/yellow]
+            show scans [db=PATH]
+                              List scans stored in the results database
+            query results [port=N] [city=|region=|country=|country-code=NAME]
+                          [last=N] [scan=ID] [module=ID] [ip=CIDR] [limit=N] [db=PATH]
+                              Query stored results, e.g. open 443 in a city
 
             [yellow]Target Commands:[/yellow]
             set city NAME        Set target city
@@ -189,6 +289,8 @@ class InteractiveConsole:
             Country: {self.current_country or 'Not set'}
             Country Code: {self.current_country_code or 'Not set'}
         """
+        self.last_result = {'city': self.current_city, 'region': self.current_region,
+                            'country': self.current_country, 'country_code': self.current_country_code}
         self.console.print(Panel(settings, border_style="blue"))
     
     def clear_screen(self, *args):
@@ -198,6 +300,10 @@ class InteractiveConsole:
         if self.current_module:
             self.back()
         else:
+            active = self.jobs.active()
+            if active:
+                self.console.print(f"[yellow]Stopping {len(active)} background job(s)...[/yellow]")
+                self.jobs.shutdown()
             self.running = False
             self.console.print("[yellow]Goodbye![/yellow]")
     
@@ -208,6 +314,12 @@ class InteractiveConsole:
         self.current_region = None
 
     def show_modules(self, *args):
+        self.last_result = [
+            {'id': module_id, 'name': module_data['info'].get('name'),
+             'description': module_data['info'].get('description'),
+             'version': module_data['info'].get('version'), 'loaded': module_data['module'] is not None}
+            for module_id, module_data in self.modules.items()
+        ]
         if not self.modules:
             self.console.print("[yellow]No modules available[/yellow]")
             return
@@ -231,10 +343,12 @@ class InteractiveConsole:
     
     def show_options(self, *args):
         if not self.current_module:
-            self.console.print("[red]Error: No module selected. Use 'use module <module_id>' first[/red]")
+            self.error("Error: No module selected. Use 'use module <module_id>' first")
             return
             
         module_options = self.modules[self.current_module]['info'].get('options', {})
+        self.last_result = {'module': self.current_module,
+                            'options': {option: details.get('value') for option, details in module_options.items()}}
         if not module_options:
             self.console.print("[yellow]No options available for this module[/yellow]")
             return
@@ -258,12 +372,15 @@ class InteractiveConsole:
     
     def use_module(self, *args):
         if len(args) < 1:
-            self.console.print("[red]Usage: use module <module_id>[/red]")
+            self.error("Usage: use module <module_id>")
             return
             
         module_id = args[0]
         if module_id not in self.modules:
-            self.console.print(f"[red]Module '{module_id}' not found[/red]")
+            self.error(f"Module '{module_id}' not found")
+            return
+            
+        if not self.import_module(module_id):
             return
             
         self.current_module = module_id
@@ -274,7 +391,8 @@ class InteractiveConsole:
             'set city', 'set country', 'set country-code', 'set region',
             'update', 'help', 'exit', 'back', 'clear', 'history', 
             'show current', 'show ranges', 'show modules', 'show options', 'show selections',
-            'use module', 'export ranges', 'get ips', 'select ranges', 'run'
+            'use module', 'export ranges', 'get ips', 'select ranges', 'run', 'run -j', 'resume',
+            'jobs', 'job status', 'job kill', 'pipeline', 'distribute', 'budget', 'show scans', 'query results'
         ]
         
         for option in module_options.keys():
@@ -289,7 +407,7 @@ class InteractiveConsole:
     
     def show_history(self, *args):
         try:
-            with open(self.session.history.filename, 'r') as f:
+            with open(self.history_file, 'r') as f:
                 history = f.readlines()
             
             history_text = "\n".join(f"[dim]{i+1}[/dim] {line.strip()}" 
@@ -298,16 +416,22 @@ class InteractiveConsole:
                                    title="Last 20 Commands", 
                                    border_style="blue"))
         except Exception as e:
-            self.console.print(f"[red]Error reading history: {str(e)}[/red]")
+            self.error(f"Error reading history: {str(e)}")
     
     def store_query_results(self, query_type, query_value, results):
         query_id = self.ip_storage.add_range(query_type, query_value, results)
+        self.last_result = {'query_id': query_id, 'ranges': len(results)}
         self.console.print(f"[green]Query results stored with ID: {query_id}[/green]")
         return query_id
     
     def show_ranges(self, *args):
         ranges = self.ip_storage.get_ranges()
         selections = self.ip_storage.selections
+        self.last_result = {
+            'ranges': [{'id': query_id, 'type': data['query_type'], 'value': data['query_value'],
+                        'count': len(data['ip_ranges'])} for query_id, data in ranges.items()],
+            'selections': self._selection_data()
+        }
         
         if not ranges and not selections:
             self.console.print("[yellow]No stored IP ranges or selections found[/yellow]")
@@ -337,8 +461,13 @@ class InteractiveConsole:
         
         self.console.print(table)
     
+    def _selection_data(self):
+        return [{'id': sel_id, 'query_id': data['query_id'], 'selection': data['selection_str'],
+                 'count': len(data['indices'])} for sel_id, data in self.ip_storage.selections.items()]
+    
     def show_selections(self, *args):
         selections = self.ip_storage.selections
+        self.last_result = self._selection_data()
         if not selections:
             self.console.print("[yellow]No selections found[/yellow]")
             return
@@ -361,7 +490,7 @@ class InteractiveConsole:
     
     def select_ranges(self, *args):
         if len(args) < 2:
-            self.console.print("[red]Usage: select ranges <query_id> <selection>[/red]")
+            self.error("Usage: select ranges <query_id> <selection>")
             self.console.print("[yellow]Examples:[/yellow]")
             self.console.print("  select ranges city_1 1-5")
             self.console.print("  select ranges city_1 1,3,5")
@@ -393,11 +522,11 @@ class InteractiveConsole:
             
             self.console.print(table)
         else:
-            self.console.print("[red]Error: Invalid selection format or query ID[/red]")
+            self.error("Error: Invalid selection format or query ID")
     
     def export_ranges(self, *args):
         if len(args) < 1:
-            self.console.print("[red]Usage: export ranges <query_id/selection_id> [filename] [--full][/red]")
+            self.error("Usage: export ranges <query_id/selection_id> [filename] [--full]")
             self.console.print("[yellow]Use --full flag to export all individual IPs instead of ranges[/yellow]")
             return
         
@@ -419,7 +548,7 @@ class InteractiveConsole:
         try:
             if export_full:
                 if not ip_list:
-                    self.console.print(f"[red]No IPs found for ID: {query_id}[/red]")
+                    self.error(f"No IPs found for ID: {query_id}")
                     return
                 
                 with open(filename, 'w') as f:
@@ -429,7 +558,7 @@ class InteractiveConsole:
                 self.console.print(f"[green]{len(ip_list)} IPs exported to {filename}[/green]")
             else:
                 if not ranges:
-                    self.console.print(f"[red]No ranges found for ID: {query_id}[/red]")
+                    self.error(f"No ranges found for ID: {query_id}")
                     return
                 
                 with open(filename, 'w') as f:
@@ -438,11 +567,11 @@ class InteractiveConsole:
                 
                 self.console.print(f"[green]{len(ranges)} IP ranges exported to {filename}[/green]")
         except Exception as e:
-            self.console.print(f"[red]Error exporting: {str(e)}[/red]")
+            self.error(f"Error exporting: {str(e)}")
     
     def get_ips(self, *args):
         if len(args) < 1:
-            self.console.print("[red]Usage: get ips <query_id/selection_id>[/red]")
+            self.error("Usage: get ips <query_id/selection_id>")
             return
         
         query_id = args[0]
@@ -453,7 +582,7 @@ class InteractiveConsole:
             ip_list = self.ip_storage.get_ip_list(query_id)
             
         if not ip_list:
-            self.console.print(f"[red]No IPs found for ID: {query_id}[/red]")
+            self.error(f"No IPs found for ID: {query_id}")
             return
         
         self.console.print(f"[cyan]IPs for {query_id} (Total: {len(ip_list)}):[/cyan]")
@@ -462,6 +591,502 @@ class InteractiveConsole:
             group = ip_list[i:i+5]
             self.console.print("  " + "  ".join(group))
     
+    def _location_ranges(self, results, module_options):
+        # The scanned query's ranges when there is one, otherwise the
+        # ip2location table from the first result on; None without either
+        query_id = module_options.get('query_id', {}).get('value')
+        if query_id:
+            ranges = self.ip_storage.get_location_ranges(query_id)
+            return lambda: ranges
+        if not os.path.exists(IP2LocationQuery().db_path):
+            return None
+        try:
+            first_ip = next(results.entries())[0]
+            next(IP2LocationQuery().iter_location_ranges(first_ip), None)
+        except sqlite3.Error:
+            return None
+        return lambda: IP2LocationQuery().iter_location_ranges(first_ip)
+    
+    def _locate_summary(self, summary, module_options):
+        # Host discovery returns a summary and writes its hosts to CSV; the
+        # alive ones are read back through an aggregator (which spills) so
+        # they come out in ip order, and counted per location
+        output_file = summary.get('output_file')
+        if not output_file or not os.path.exists(output_file):
+            return summary
+        hosts = ScanResultAggregator()
+        try:
+            with open(output_file, 'r', newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    if row.get('status') == 'alive':
+                        hosts.add(row['ip'])
+            ranges = self._location_ranges(hosts, module_options) if hosts else None
+            if not ranges:
+                return summary
+            locations = {}
+            for record in LocatedResults(hosts, ranges):
+                location = record.get('fields', {}).get('location') or {}
+                name = ", ".join(str(location[key]) for key in ('city', 'region', 'country')
+                                 if location.get(key)) or 'unknown'
+                locations[name] = locations.get(name, 0) + 1
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.console.print(f"[yellow]Cannot locate hosts in {output_file}: {str(e)}[/yellow]")
+            return summary
+        finally:
+            hosts.close()
+        return dict(summary, alive_by_location=dict(sorted(locations.items(), key=lambda item: -item[1])))
+    
+    def _locate_results(self, success, result, module_options):
+        # Results come out of the aggregator in ip order, so they are
+        # merge-joined with the ranges in one pass, lazily, every time the
+        # results are read
+        if not success or not result:
+            return result
+        if isinstance(result, dict):
+            return self._locate_summary(result, module_options)
+        if not isinstance(result, ScanResultAggregator):
+            return result
+        ranges = self._location_ranges(result, module_options)
+        return LocatedResults(result, ranges) if ranges else result
+    
+    def _result_data(self, result):
+        if isinstance(result, (ScanResultAggregator, LocatedResults)):
+            return list(result)
+        return result
+    
+    def show_module_results(self, success, result):
+        if success:
+            # Only scripts read the data back, and only they pay for a copy
+            self.last_result = None if self.interactive else self._result_data(result)
+            if not result:
+                self.console.print("[yellow]No results found[/yellow]")
+                return
+            
+            if isinstance(result, dict):
+                # Summary-style results (e.g. host discovery writes its
+                # hosts to CSV and returns counts)
+                summary = "\n".join(f"{name}: {value}" for name, value in result.items())
+                self.console.print(Panel(summary, title="Results", border_style="blue"))
+                return
+                
+            # Printed as the results are read, a chunk at a time
+            records = iter(result)
+            located = isinstance(result, LocatedResults)
+            first = True
+            while True:
+                chunk = list(itertools.islice(records, TABLE_CHUNK))
+                if not chunk:
+                    break
+                if first:
+                    located = located or any('location' in ip_result.get('fields', {}) for ip_result in chunk)
+                table = Table(show_header=first, header_style="bold magenta")
+                table.add_column("IP", style="cyan", min_width=15)
+                table.add_column("Open Ports", style="green", min_width=20)
+                if located:
+                    table.add_column("Location", style="blue")
+                for ip_result in chunk:
+                    row = [
+                        ip_result['ip'],
+                        ", ".join(map(str, ip_result['open_ports']))
+                    ]
+                    if located:
+                        location = ip_result.get('fields', {}).get('location') or {}
+                        row.append(", ".join(str(location[key]) for key in ('city', 'region', 'country')
+                                             if location.get(key)))
+                    table.add_row(*row)
+                self.console.print(table)
+                first = False
+        else:
+            self.error(f"Error running module: {result}")
+    
+    def _resolve_targets(self, module_options):
+        input_file = module_options.get('input_file', {}).get('value')
+        query_id = module_options.get('query_id', {}).get('value')
+        
+        if input_file and os.path.exists(input_file):
+            self.console.print(f"[yellow]Using input file: {input_file}[/yellow]")
+            return []
+        if not query_id:
+            self.error("Error: Either input_file or query_id must be set")
+            return None
+        
+        if '_sel_' in query_id:
+            targets = self.ip_storage.get_selection_target_set(query_id)
+        elif query_id.lower() == 'all':
+            targets = TargetSet()
+            for qid in self.ip_storage.get_ranges().keys():
+                targets.extend(self.ip_storage.get_target_set(qid))
+        else:
+            targets = self.ip_storage.get_target_set(query_id)
+        
+        if not targets:
+            self.error(f"Error: No IPs found for ID: {query_id}")
+            return None
+        
+        self.console.print(f"[yellow]Starting scan of {len(targets)} IP addresses...[/yellow]")
+        return targets
+    
+    def run_pipeline(self, *args):
+        flags = {arg.lower() for arg in args if arg.lower() in ('geo', '-j')}
+        module_ids = [arg for arg in args if arg.lower() not in ('geo', '-j')]
+        if len(module_ids) < 2:
+            self.error("Usage: pipeline <module_id> <module_id> [...] [geo] [-j]")
+            return
+        
+        for module_id in module_ids:
+            if module_id not in self.modules:
+                self.error(f"Module '{module_id}' not found")
+                return
+            if not self.import_module(module_id):
+                return
+        
+        # The first stage scans the usual targets; every later stage scans
+        # what the stage before it finds, using its own module options
+        first_options = self.modules[module_ids[0]]['info']['options']
+        targets = self._resolve_targets(first_options)
+        if targets is None:
+            return
+        
+        locator = None
+        if 'geo' in flags:
+            query_id = first_options.get('query_id', {}).get('value') or 'all'
+            locator = self.ip_storage.get_locator(query_id)
+        
+        stages = [
+            (module_id, self.modules[module_id]['module'], self.modules[module_id]['info']['options'])
+            for module_id in module_ids
+        ]
+        try:
+            pipeline = Pipeline(stages, locator)
+        except ValueError as e:
+            self.error(f"Error: {str(e)}")
+            return
+        
+        name = ' -> '.join(module_ids)
+        if '-j' in flags:
+            job = self.jobs.submit_instance(name, pipeline, targets)
+            self.last_result = {'job': job.id}
+            self.console.print(f"[green]Job {job.id} submitted ({job.status}); see 'jobs' and 'job status {job.id}'[/green]")
+            return
+        
+        success, result = pipeline.run(targets)
+        self.show_module_results(success, result)
+    
+    def _results_store(self, args):
+        # db=PATH, else the current module's results_db option; opened
+        # read-only, so looking never creates an empty database
+        db_path = None
+        rest = []
+        for arg in args:
+            if arg.lower().startswith('db='):
+                db_path = arg[len('db='):]
+            else:
+                rest.append(arg)
+        if not db_path and self.current_module:
+            option = self.modules[self.current_module]['info']['options'].get('results_db')
+            db_path = option['value'] if option else None
+        db_path = db_path or RESULTS_DB_PATH
+        try:
+            return ScanResultStore(db_path, read_only=True), rest
+        except FileNotFoundError as e:
+            self.error(f"Error: {str(e)}")
+            return None, rest
+    
+    def show_scans(self, *args):
+        store, _ = self._results_store(args)
+        if not store:
+            return
+        try:
+            scans = store.scans()
+        except sqlite3.Error as e:
+            self.error(f"Error reading {store.db_path}: {str(e)}")
+            return
+        self.last_result = [dict(scan) for scan in scans]
+        if not scans:
+            self.console.print("[yellow]No stored scans[/yellow]")
+            return
+        
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Scan", style="cyan")
+        table.add_column("Module", style="green")
+        table.add_column("Started", style="blue")
+        table.add_column("Finished", style="blue")
+        table.add_column("Results", style="yellow")
+        table.add_column("Output File")
+        
+        for scan in scans:
+            table.add_row(
+                str(scan['scan_id']),
+                scan['module'],
+                scan['started'],
+                scan['finished'] or 'running',
+                str(scan['result_count']),
+                scan['output_file'] or ''
+            )
+        
+        self.console.print(table)
+    
+    def query_results(self, *args):
+        store, args = self._results_store(args)
+        if not store:
+            return
+        filters = {}
+        for arg in args:
+            name, sep, value = arg.partition('=')
+            if not sep or not value:
+                self.error(f"Invalid filter '{arg}', expected name=value")
+                return
+            filters[name.lower()] = value
+        
+        location = {name: filters.pop(name) for name in list(filters) if name in LOCATION_FILTERS}
+        try:
+            results = store.query(
+                port=filters.pop('port', None),
+                last=filters.pop('last', None),
+                scan_id=filters.pop('scan', None),
+                module=filters.pop('module', None),
+                cidr=filters.pop('ip', None),
+                limit=filters.pop('limit', 1000),
+                **location
+            )
+        except (sqlite3.Error, ValueError) as e:
+            self.error(f"Error querying results: {str(e)}")
+            return
+        for name in filters:
+            self.console.print(f"[yellow]Ignoring unknown filter '{name}'[/yellow]")
+        
+        self.last_result = results
+        if not results:
+            self.console.print("[yellow]No results found[/yellow]")
+            return
+        
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Scan", style="cyan")
+        table.add_column("IP", style="cyan")
+        table.add_column("Port", style="green")
+        if location:
+            table.add_column("Location", style="blue")
+        
+        for result in results:
+            row = [str(result['scan_id']), result['ip'], str(result['port'] or '-')]
+            if location:
+                row.append(", ".join(str(result['location'][key]) for key in ('city', 'region', 'country')
+                                     if result['location'].get(key)))
+            table.add_row(*row)
+        
+        self.console.print(table)
+        self.console.print(f"[cyan]{len(results)} result(s)[/cyan]")
+    
+    def distribute(self, *args):
+        if not self.current_module:
+            self.error("Error: No module selected. Use 'use module <module_id>' first")
+            return
+        
+        settings = {'listen': DEFAULT_ADDRESS, 'workers': '0', 'shard_size': '65536',
+                    'lease': '120', 'attempts': '3', 'token': None}
+        for arg in args:
+            if arg == '-j':
+                continue
+            name, sep, value = arg.partition('=')
+            if not sep or name not in settings:
+                self.error(f"Invalid setting '{arg}'")
+                return
+            settings[name] = value
+        
+        module_options = self.modules[self.current_module]['info']['options']
+        targets = self._resolve_targets(module_options)
+        if targets is None:
+            return
+        if not targets:
+            # Shards need explicit addresses, so load the input file here
+            try:
+                targets = TargetSet.from_file(module_options['input_file']['value'])
+            except (OSError, ValueError) as e:
+                self.error(f"Error reading input file: {str(e)}")
+                return
+        
+        try:
+            coordinator = Coordinator(
+                self.current_module, module_options, settings['listen'],
+                shard_size=int(settings['shard_size']),
+                lease_timeout=float(settings['lease']),
+                max_attempts=int(settings['attempts']),
+                local_workers=int(settings['workers']),
+                token=settings['token']
+            )
+        except ValueError as e:
+            self.error(f"Invalid setting: {str(e)}")
+            return
+        
+        worker_command = f"{TOKEN_ENV}={coordinator.token} python locus.py --worker {settings['listen']}"
+        if '-j' in args:
+            job = self.jobs.submit_instance(f"{self.current_module} (distributed)", coordinator, targets)
+            self.last_result = {'job': job.id, 'token': coordinator.token}
+            self.console.print(f"[green]Job {job.id} submitted ({job.status}); see 'jobs' and 'job status {job.id}'[/green]")
+            self.console.print(f"[yellow]Start workers with: {worker_command}[/yellow]")
+            return
+        
+        self.console.print(f"[yellow]Waiting for workers on {settings['listen']} ({worker_command})[/yellow]")
+        success, result = coordinator.run(targets)
+        self.show_module_results(success, self._locate_results(success, result, module_options))
+    
+    def budget(self, *args):
+        limits = {}
+        for arg in args:
+            name, sep, value = arg.partition('=')
+            if not sep or name not in ('pps', 'sockets'):
+                self.error(f"Invalid setting '{arg}', expected pps=N or sockets=N")
+                return
+            try:
+                limits[name] = int(value)
+            except ValueError:
+                self.error(f"Invalid {name}: {value}")
+                return
+        if limits:
+            scheduler.configure(max_pps=limits.get('pps'), max_sockets=limits.get('sockets'))
+        
+        allocations = scheduler.snapshot()
+        self.last_result = {'limits': dict(scheduler.limits), 'allocations': allocations}
+        pps, sockets = scheduler.limits['pps'], scheduler.limits['sockets']
+        self.console.print(f"[cyan]Budget: {pps or 'unlimited'} pps, {sockets or 'unlimited'} sockets[/cyan]")
+        if not allocations:
+            return
+        
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("Module", style="cyan")
+        table.add_column("Weight", style="green")
+        table.add_column("Priority", style="green")
+        table.add_column("PPS Share", style="yellow")
+        table.add_column("Socket Share", style="yellow")
+        
+        for allocation in allocations:
+            table.add_row(
+                allocation['name'],
+                f"{allocation['weight']:g}",
+                str(allocation['priority']),
+                f"{allocation['pps']:.0f}" if allocation['pps'] is not None else '-',
+                str(allocation['sockets']) if allocation['sockets'] is not None else '-'
+            )
+        
+        self.console.print(table)
+    
+    def _job_data(self, job):
+        return {
+            'id': job.id,
+            'module': job.module_id,
+            'status': job.status,
+            'runtime': round(job.runtime, 1),
+            'targets': len(job.targets) if job.targets else None,
+            'weight': job.weight,
+            'priority': job.priority
+        }
+    
+    def show_jobs(self, *args):
+        jobs = self.jobs.list()
+        self.last_result = [self._job_data(job) for job in jobs]
+        if not jobs:
+            self.console.print("[yellow]No jobs[/yellow]")
+            return
+        
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("ID", style="cyan")
+        table.add_column("Module", style="green")
+        table.add_column("Status", style="yellow")
+        table.add_column("Runtime", style="blue")
+        table.add_column("Targets", style="blue")
+        
+        for job in jobs:
+            table.add_row(
+                str(job.id),
+                job.module_id,
+                job.status,
+                f"{job.runtime:.0f}s",
+                str(len(job.targets)) if job.targets else 'input_file'
+            )
+        
+        self.console.print(table)
+    
+    def job_status(self, *args):
+        if len(args) < 1:
+            self.error("Usage: job status <job_id>")
+            return
+        
+        job = self.jobs.get(args[0])
+        if not job:
+            self.error(f"Job '{args[0]}' not found")
+            return
+        
+        options = "\n".join(
+            f"  {name} = {option['value']}"
+            for name, option in job.options.items() if option.get('value') is not None
+        )
+        self.console.print(Panel(
+            f"Module: {job.module_id}\nStatus: {job.status}\nRuntime: {job.runtime:.0f}s\n"
+            f"Weight: {job.weight}  Priority: {job.priority}\nOptions:\n{options}",
+            title=f"Job {job.id}", border_style="blue"
+        ))
+        
+        status = self._job_data(job)
+        status['options'] = {name: option.get('value') for name, option in job.options.items()}
+        progress = getattr(job.instance, 'progress', None)
+        if job.status == 'running' and progress:
+            status['progress'] = progress
+            self.console.print(f"[cyan]Progress: {progress}[/cyan]")
+        if job.status in ('done', 'failed', 'killed') and job.result is not None:
+            self.show_module_results(job.success, self._locate_results(job.success, job.result, job.options))
+            status['success'] = bool(job.success)
+            status['result'] = self.last_result if job.success else job.result
+        self.last_result = status
+    
+    def job_kill(self, *args):
+        if len(args) < 1:
+            self.error("Usage: job kill <job_id>")
+            return
+        
+        if self.jobs.kill(args[0]):
+            self.console.print(f"[yellow]Job {args[0]} stopping[/yellow]")
+        else:
+            self.error(f"Job '{args[0]}' is not queued or running, or cannot be stopped")
+    
+    def _job_finished(self, job):
+        if self.emit:
+            result = self._locate_results(job.success, job.result, job.options)
+            self.emit({'job': job.id, 'module': job.module_id, 'status': job.status,
+                       'success': bool(job.success), 'result': self._result_data(result)})
+        self.console.print(f"\n[cyan]Job {job.id} ({job.module_id}) {job.status} after {job.runtime:.0f}s; "
+                           f"'job status {job.id}' shows the results[/cyan]")
+    
+    def resume(self, *args):
+        if len(args) < 1:
+            self.error("Usage: resume <checkpoint_file>")
+            return
+        
+        try:
+            checkpoint = Checkpoint.load(args[0])
+        except (OSError, ValueError, KeyError) as e:
+            self.error(f"Error loading checkpoint: {str(e)}")
+            return
+        
+        if checkpoint.module not in self.modules:
+            self.error(f"Module '{checkpoint.module}' not found")
+            return
+        
+        self.use_module(checkpoint.module)
+        if self.current_module != checkpoint.module:
+            return
+        module_options = self.modules[checkpoint.module]['info']['options']
+        for name, value in checkpoint.options.items():
+            if name in module_options:
+                module_options[name]['value'] = value
+        module_options['checkpoint_file']['value'] = checkpoint.path
+        
+        remaining = len(checkpoint.targets) - checkpoint.cursor
+        self.console.print(f"[yellow]Resuming scan: {checkpoint.cursor} addresses done, {remaining} remaining...[/yellow]")
+        
+        module_instance = self.modules[checkpoint.module]['module'].create_instance()
+        success, result = module_instance.run(None, checkpoint=checkpoint)
+        self.show_module_results(success, self._locate_results(success, result, module_options))
+    
     def process_command(self, command_line):
         if not command_line.strip():
             return
@@ -485,7 +1110,7 @@ class InteractiveConsole:
             
             if command == 'set':
                 if len(args) < 3:
-                    self.console.print("[red]Error: Invalid set command[/red]")
+                    self.error("Error: Invalid set command")
                     return
                 
                 target_type = args[1].lower()
@@ -517,63 +1142,40 @@ class InteractiveConsole:
                     self.console.print(f"[green]Region target set to: {target_value}[/green]")
                     return "--region " + shlex.quote(target_value)
                 else:
-                    self.console.print("[red]Error: Invalid target type[/red]")
+                    self.error("Error: Invalid target type")
                     return
             
             if command == 'run':
                 if not self.current_module:
-                    self.console.print("[red]Error: No module selected. Use 'use module <module_id>' first[/red]")
+                    self.error("Error: No module selected. Use 'use module <module_id>' first")
                     return
                 
+                background = '-j' in args[1:]
+                share = {'weight': 1.0, 'priority': 0}
+                for arg in args[1:]:
+                    name, sep, value = arg.partition('=')
+                    if sep and name in share:
+                        try:
+                            share[name] = type(share[name])(value)
+                        except ValueError:
+                            self.error(f"Invalid {name}: {value}")
+                            return
                 module_options = self.modules[self.current_module]['info']['options']
-                input_file = module_options.get('input_file', {}).get('value')
-                query_id = module_options.get('query_id', {}).get('value')
+                targets = self._resolve_targets(module_options)
+                if targets is None:
+                    return
                 
-                if input_file and os.path.exists(input_file):
-                    self.console.print(f"[yellow]Using input file: {input_file}[/yellow]")
-                    module_instance = self.modules[self.current_module]['module'].create_instance()
-                    success, result = module_instance.run([])
-                elif query_id:
-                    if '_sel_' in query_id:
-                        ip_list = self.ip_storage.get_selection_ip_list(query_id)
-                    else:
-                        if query_id.lower() == 'all':
-                            ip_list = []
-                            for qid in self.ip_storage.get_ranges().keys():
-                                ip_list.extend(self.ip_storage.get_ip_list(qid))
-                        else:
-                            ip_list = self.ip_storage.get_ip_list(query_id)
-                    
-                    if not ip_list:
-                        self.console.print(f"[red]Error: No IPs found for ID: {query_id}[/red]")
-                        return
-                    
-                    self.console.print(f"[yellow]Starting scan of {len(ip_list)} IP addresses...[/yellow]")
-                    
-                    module_instance = self.modules[self.current_module]['module'].create_instance()
-                    success, result = module_instance.run(ip_list)
-                else:
-                    self.console.print("[red]Error: Either input_file or query_id must be set[/red]")
+                module = self.modules[self.current_module]['module']
+                if background:
+                    job = self.jobs.submit(self.current_module, module, module_options, targets, **share)
+                    self.last_result = {'job': job.id}
+                    self.console.print(f"[green]Job {job.id} submitted ({job.status}); see 'jobs' and 'job status {job.id}'[/green]")
                     return
                 
-                if success:
-                    if not result:
-                        self.console.print("[yellow]No results found[/yellow]")
-                        return
-                        
-                    table = Table(show_header=True, header_style="bold magenta")
-                    table.add_column("IP", style="cyan")
-                    table.add_column("Open Ports", style="green")
-                    
-                    for ip_result in result:
-                        table.add_row(
-                            ip_result['ip'],
-                            ", ".join(map(str, ip_result['open_ports']))
-                        )
-                    
-                    self.console.print(table)
-                else:
-                    self.console.print(f"[red]Error running module: {result}[/red]")
+                module_instance = module.create_instance()
+                module_instance.weight, module_instance.priority = share['weight'], share['priority']
+                success, result = module_instance.run(targets)
+                self.show_module_results(success, self._locate_results(success, result, module_options))
                 return
             
             if command in self.commands:
@@ -581,27 +1183,30 @@ class InteractiveConsole:
             elif command == 'update':
                 return '--update'
             else:
-                self.console.print(f"[red]Unknown command: {command}[/red]")
+                self.error(f"Unknown command: {command}")
                 
         except Exception as e:
-            self.console.print(f"[red]Error processing command: {str(e)}[/red]")
+            self.error(f"Error processing command: {str(e)}")
     
     def run(self):
-        while self.running:
-            try:
-                command_line = self.session.prompt(
-                    self._get_prompt(),
-                    completer=self.completer,
-                    complete_while_typing=True
-                )
-                
-                result = self.process_command(command_line)
-                
-                if result:
-                    return result
+        # Background jobs print while the prompt is active; patch_stdout
+        # keeps their output above the input line
+        with patch_stdout():
+            while self.running:
+                try:
+                    command_line = self.session.prompt(
+                        self._get_prompt(),
+                        completer=self.completer,
+                        complete_while_typing=True
+                    )
                     
-            except KeyboardInterrupt:
-                self.console.print("\n[yellow]Use 'exit' to quit[/yellow]")
-            except EOFError:
-                self.exit()
-                break
\ No newline at end of file
+                    result = self.process_command(command_line)
+                    
+                    if result:
+                        return result
+                        
+                except KeyboardInterrupt:
+                    self.console.print("\n[yellow]Use 'exit' to quit[/yellow]")
+                except EOFError:
+                    self.exit()
+                    break
\ No newline at end of file
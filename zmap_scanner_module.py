@@ -1,8 +1,18 @@
 import subprocess
-import tempfile
 import os
+import re
+import random
+import threading
+import time
 from datetime import datetime
 import netifaces
+from process_supervisor import ProcessSupervisor
+from targets import TargetSet, as_target_set
+from scan_results import ScanResultAggregator
+from checkpoint import open_checkpoint
+from rate_control import AdaptiveRateController
+from results_db import RESULTS_DB_PATH, ScanResultStore
+from budget import scheduler
 
 def get_default_interface():
     try:
@@ -62,6 +72,46 @@ MODULE_INFO = {
             'required': False,
             'value': None
         },
+        'results_db': {
+            'description': 'SQLite database that responders are also stored in (empty to disable)',
+            'required': False,
+            'value': RESULTS_DB_PATH
+        },
+        'output_fields': {
+            'description': 'Extra zmap output fields to record per responder (e.g., ttl,window,classification,timestamp_str)',
+            'required': False,
+            'value': None
+        },
+        'shards': {
+            'description': 'Number of concurrent zmap processes sharing the rate/bandwidth budget',
+            'required': False,
+            'value': '1'
+        },
+        'sender_threads': {
+            'description': 'Sender threads per zmap process (default: zmap decides)',
+            'required': False,
+            'value': None
+        },
+        'timeout': {
+            'description': 'Maximum scan duration in seconds (0 = no limit)',
+            'required': False,
+            'value': '0'
+        },
+        'adaptive': {
+            'description': 'Adapt the send rate between segments from observed drops (rate becomes the ceiling, bandwidth is ignored)',
+            'required': False,
+            'value': 'false'
+        },
+        'checkpoint_file': {
+            'description': 'State file for checkpointing progress (continue with: resume <file>)',
+            'required': False,
+            'value': None
+        },
+        'segment_size': {
+            'description': 'Addresses per zmap run between checkpoints/rate adjustments (checkpoint_file or adaptive)',
+            'required': False,
+            'value': '1048576'
+        },
         'blacklist': {
             'description': 'Path to IP blacklist file',
             'required': False,
@@ -75,10 +125,151 @@ MODULE_INFO = {
     }
 }
 
+STATUS_PATTERN = re.compile(
+    r'^\s*(?P<elapsed>\d+:\d+(?::\d+)?)\s+(?P<percent>\d+)%'
+    r'(?:\s+\((?P<remaining>[^)]*) left\))?;'
+    r'\s*send:\s+(?P<sent>\d+)\s+(?P<send_rate>[\d.]+\s*[KMG]?p/s)'
+    r'.*?recv:\s+(?P<recv>\d+)\s+(?P<recv_rate>[\d.]+\s*[KMG]?p/s)'
+    r'.*?drops:\s+(?P<drop_rate>[\d.]+\s*[KMG]?p/s)'
+    r'.*?hitrate:\s+(?P<hitrate>[\d.]+)%'
+)
+
+RATE_UNITS = {'': 1, 'K': 1e3, 'M': 1e6, 'G': 1e9}
+
+def parse_rate(value):
+    match = re.match(r'([\d.]+)\s*([KMG]?)p/s', value)
+    if not match:
+        return 0.0
+    return float(match.group(1)) * RATE_UNITS[match.group(2)]
+
+def parse_elapsed(value):
+    # zmap prints m:ss, or h:mm:ss once past an hour
+    seconds = 0
+    for part in value.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def parse_status_line(line):
+    match = STATUS_PATTERN.match(line)
+    if not match:
+        return None
+    return {
+        'elapsed': match.group('elapsed'),
+        'percent': int(match.group('percent')),
+        'remaining': match.group('remaining'),
+        'sent': int(match.group('sent')),
+        'send_rate': parse_rate(match.group('send_rate')),
+        'recv': int(match.group('recv')),
+        'recv_rate': parse_rate(match.group('recv_rate')),
+        'drop_rate': parse_rate(match.group('drop_rate')),
+        'hitrate': float(match.group('hitrate'))
+    }
+
+BANDWIDTH_UNITS = {'': 1, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+# zmap's own default rate, and the bytes on the wire per SYN probe (frame
+# plus preamble and inter-frame gap) it divides -B by
+DEFAULT_RATE = 10000
+PROBE_WIRE_BYTES = 78
+
+def parse_bandwidth(bandwidth):
+    match = re.match(r'^\s*([\d.]+)\s*([KMG]?)\s*$', str(bandwidth), re.IGNORECASE)
+    if not match:
+        return None
+    return float(match.group(1)) * BANDWIDTH_UNITS[match.group(2).upper()]
+
+def split_bandwidth(bandwidth, parts):
+    if parts == 1:
+        return bandwidth
+    bps = parse_bandwidth(bandwidth)
+    if bps is None:
+        return bandwidth
+    return str(max(1, int(bps / parts)))
+
+class ZmapResultCollector:
+    def __init__(self, output_file, extra_fields=False, append=False, result_sink=None):
+        self.extra_fields = extra_fields
+        self.result_sink = result_sink
+        self.results = ScanResultAggregator()
+        self.header = None
+        self.header_written = False
+        self.output = open(output_file, 'a' if append else 'w')
+        self.lock = threading.Lock()
+
+    def _parse(self, line):
+        # (ip, port, extra fields), or None for the header and bad lines
+        values = line.split(',')
+        if self.header is None:
+            if 'saddr' in values:
+                self.header = values
+                return None
+            self.header = ['saddr', 'dport']
+        try:
+            record = dict(zip(self.header, values))
+            return record.pop('saddr'), int(record.pop('dport')), record
+        except (KeyError, ValueError):
+            return None
+
+    def restore(self, lines):
+        # Results an interrupted run already wrote to the output file
+        for line in lines:
+            line = line.strip()
+            if 'saddr' in line.split(','):
+                self.header_written = True
+            parsed = self._parse(line) if line else None
+            if parsed:
+                ip, port, record = parsed
+                self.results.add(ip, port, record if self.extra_fields else None)
+
+    def handle_line(self, line):
+        # Shards deliver lines from several reader threads
+        with self.lock:
+            self._handle_line(line)
+
+    def _handle_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        if 'saddr' in line.split(','):
+            # Every zmap run (shard, segment) starts with the header
+            self.header = None
+            self._parse(line)
+            if not self.header_written:
+                self.output.write(line + '\n')
+                self.header_written = True
+            return
+        parsed = self._parse(line)
+        if not parsed:
+            return
+        ip, port, record = parsed
+        fields = record if self.extra_fields else None
+        if not self.results.add(ip, port, fields):
+            # Also covers results replayed on resume and found again
+            return
+
+        self.output.write(line + '\n')
+        self.output.flush()
+        print(f"\r{ip}:{port}")
+        if self.result_sink:
+            self.result_sink(ip, port, fields)
+
+    def close(self):
+        self.output.close()
+
 class ZmapScanner:
+    zmap_binary = 'zmap'
+
     def __init__(self):
         self.options = MODULE_INFO['options']
         self.stop_scan = False
+        self.result_sink = None
+        self.weight = 1.0
+        self.priority = 0
+        self._allocation = None
+        self.progress = {}
+        self._shard_progress = {}
+        self._supervisors = []
+        self._controller = None
         
     def validate_options(self):
         for name, opt in self.options.items():
@@ -95,20 +286,39 @@ class ZmapScanner:
     
     def _check_zmap_installed(self):
         try:
-            subprocess.run(['zmap', '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            subprocess.run([self.zmap_binary, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
             return True
         except FileNotFoundError:
             return False
     
-    def _create_target_file(self, ip_list):
-        fd, path = tempfile.mkstemp()
-        with os.fdopen(fd, 'w') as temp:
-            for ip in ip_list:
-                temp.write(ip + '\n')
-        return path
+    def _output_fields(self):
+        fields = ['saddr', 'dport']
+        extra = self.options['output_fields']['value']
+        if extra:
+            for field in extra.split(','):
+                field = field.strip()
+                if field and field not in fields:
+                    fields.append(field)
+        return fields
+    
+    def _bool_option(self, name):
+        return str(self.options[name]['value']).lower() in ('true', 'yes', '1')
+    
+    def _shard_count(self):
+        return max(1, int(self.options['shards']['value'] or 1))
     
-    def _build_zmap_command(self, input_file, output_file):
-        cmd = ['sudo', 'zmap']
+    def _effective_rate(self):
+        # Packets per second zmap sends with these options; -B wins over -r
+        bandwidth = self.options['bandwidth']['value']
+        bps = parse_bandwidth(bandwidth) if bandwidth else None
+        if bps:
+            return max(1, int(bps / (8 * PROBE_WIRE_BYTES)))
+        rate = self.options['rate']['value']
+        return int(rate) if rate else DEFAULT_RATE
+    
+    def _build_zmap_command(self, input_file, shard=0, seed=None):
+        cmd = [self.zmap_binary] if os.geteuid() == 0 else ['sudo', self.zmap_binary]
+        shards = self._shard_count()
         
         # Add ports
         ports = self.options['ports']['value']
@@ -117,63 +327,104 @@ class ZmapScanner:
         # Add input file
         cmd.extend(['-w', input_file])
         
-        # Add output file
-        cmd.extend(['-o', output_file])
+        # Results are streamed over stdout and written to output_file by us
+        cmd.extend(['-o', '-'])
         
         # Add required interface
         cmd.extend(['-i', self.options['interface']['value']])
         
-        # Add optional parameters
-        if self.options['bandwidth']['value']:
-            cmd.extend(['-B', self.options['bandwidth']['value']])
+        # Shards walk disjoint slices of the same permutation, which needs
+        # a shared seed, and split one global rate/bandwidth budget
+        if shards > 1:
+            cmd.extend(['--shards', str(shards), '--shard', str(shard), '--seed', str(seed)])
             
-        if self.options['rate']['value']:
-            cmd.extend(['-r', self.options['rate']['value']])
+        if self.options['sender_threads']['value']:
+            cmd.extend(['--sender-threads', str(self.options['sender_threads']['value'])])
+        
+        # Add optional parameters
+        rate = self._controller.rate if self._controller else None
+        if self._allocation and self._allocation.pps is not None:
+            # Capped by this scan's share of the global budget
+            rate = int(self._allocation.limit('pps', rate or self._effective_rate()))
+        if rate:
+            # zmap derives the rate from -B when both are given, so an
+            # adaptive or budgeted rate is passed alone
+            cmd.extend(['-r', str(max(1, rate // shards))])
+        else:
+            if self.options['bandwidth']['value']:
+                cmd.extend(['-B', split_bandwidth(self.options['bandwidth']['value'], shards)])
+            if self.options['rate']['value']:
+                cmd.extend(['-r', str(max(1, int(self.options['rate']['value']) // shards))])
             
         if self.options['blacklist']['value']:
             cmd.extend(['--blacklist-file', self.options['blacklist']['value']])
         
         # Add output format
-        cmd.extend(['--output-fields', 'saddr,dport'])
+        cmd.extend(['--output-module', 'csv'])
+        cmd.extend(['--output-fields', ','.join(self._output_fields())])
         
         return cmd
     
-    def _parse_zmap_output(self, output_file):
-        results = []
+    def _scan_segment(self, target_file, targets, collector, deadline):
+        seed = random.getrandbits(32)
+        self._shard_progress = {}
+        self._supervisors = []
         try:
-            with open(output_file, 'r') as f:
-                for line in f:
-                    try:
-                        ip, port = line.strip().split(',')
-                        results.append({
-                            'ip': ip,
-                            'port': int(port)
-                        })
-                    except (ValueError, IndexError):
-                        continue
-        except Exception as e:
-            return False, f"Error parsing results: {str(e)}"
-            
-        grouped_results = {}
-        for result in results:
-            ip = result['ip']
-            if ip not in grouped_results:
-                grouped_results[ip] = {
-                    'ip': ip,
-                    'open_ports': set()
-                }
-            grouped_results[ip]['open_ports'].add(result['port'])
-            
-        final_results = []
-        for ip_data in grouped_results.values():
-            ip_data['open_ports'] = sorted(list(ip_data['open_ports']))
-            final_results.append(ip_data)
+            for shard in range(self._shard_count()):
+                cmd = self._build_zmap_command(target_file, shard, seed)
+                print(f"Running command: {' '.join(cmd)}")
+                # Every shard reads the full allowlist; zmap picks its slice
+                supervisor = ProcessSupervisor(
+                    cmd,
+                    on_stdout=collector.handle_line,
+                    on_stderr=lambda line, shard=shard: self._handle_status_line(shard, line),
+                    stdin_lines=targets.cidrs() if targets is not None else None
+                )
+                self._supervisors.append(supervisor)
+                supervisor.start()
+                if self.stop_scan:
+                    break
             
-        return True, final_results
+            if self.stop_scan:
+                self.stop()
+
+            # One deadline covers all shards, which run side by side
+            returncodes = [
+                supervisor.wait(timeout=max(0.001, deadline - time.monotonic()) if deadline else None)
+                for supervisor in self._supervisors
+            ]
+        finally:
+            for supervisor in self._supervisors:
+                supervisor.stop()
+                supervisor.terminate()
+        if self.progress:
+            print()
+
+        if self.stop_scan:
+            return False, "Scan stopped by user"
+
+        if any(supervisor.timed_out for supervisor in self._supervisors):
+            return False, f"Zmap timed out after {self.options['timeout']['value']} seconds"
+
+        for supervisor, returncode in zip(self._supervisors, returncodes):
+            if returncode != 0:
+                return False, f"Zmap failed with error: {supervisor.stderr_tail}"
+        
+        return True, None
+    
+    def run(self, ip_list=None, checkpoint=None):
+        # Adaptive runs pass -r alone and ramp up towards the rate option
+        if self._bool_option('adaptive'):
+            demand = int(self.options['rate']['value'] or 1000)
+        else:
+            demand = self._effective_rate()
+        with scheduler.register(__name__, self.weight, self.priority, pps=demand) as self._allocation:
+            return self._run(ip_list, checkpoint)
     
-    def run(self, ip_list=None):
+    def _run(self, ip_list=None, checkpoint=None):
         # Reset stop flag
         self.stop_scan = False
+        self._controller = None
         
         # Validate options
         valid, error = self.validate_options()
@@ -181,67 +432,131 @@ class ZmapScanner:
             return False, error
             
         try:
-            # Determine input file
-            target_file = None
-            cleanup_target = False
-            
-            if self.options['input_file']['value']:
+            # Determine target source. Ranges are streamed to zmap's allowlist
+            # as aggregated CIDRs over stdin, so nothing is expanded or written
+            # to disk before the first packet goes out.
+            targets = None
+            if checkpoint:
+                targets = checkpoint.remaining_targets()
+            elif self.options['input_file']['value']:
                 target_file = self.options['input_file']['value']
                 if not os.path.exists(target_file):
                     return False, f"Input file not found: {target_file}"
+                if self.options['checkpoint_file']['value']:
+                    targets = TargetSet.from_file(target_file)
             else:
                 if not ip_list:
                     return False, "No IP list provided and no input file specified"
-                target_file = self._create_target_file(ip_list)
-                cleanup_target = True
+                targets = as_target_set(ip_list)
             
-            if not self.options['output_file']['value']:
+            if checkpoint and checkpoint.output_file:
+                output_file = checkpoint.output_file
+            elif not self.options['output_file']['value']:
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 output_file = f'zmap_results_{timestamp}.txt'
             else:
                 output_file = self.options['output_file']['value']
             
-            cmd = self._build_zmap_command(target_file, output_file)
+            collector = ZmapResultCollector(
+                output_file,
+                extra_fields=len(self._output_fields()) > 2,
+                append=bool(checkpoint and checkpoint.cursor),
+                result_sink=self.result_sink
+            )
+            
+            timeout = int(self.options['timeout']['value'] or 0)
+            deadline = time.monotonic() + timeout if timeout else None
             
             try:
-                print(f"Running command: {' '.join(cmd)}")
-                # Run zmap
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True
-                )
-                
-                while process.poll() is None:
-                    if self.stop_scan:
-                        process.terminate()
-                        return False, "Scan stopped by user"
+                if targets is None:
+                    success, error = self._scan_segment(target_file, None, collector, deadline)
+                else:
+                    checkpoint = open_checkpoint(__name__, self.options, targets, output_file, checkpoint)
+                    if checkpoint:
+                        collector.restore(checkpoint.output_lines())
+                        print(f"Checkpointing to {checkpoint.path} ({checkpoint.cursor} addresses already scanned)")
+                    if self._bool_option('adaptive'):
+                        self._controller = AdaptiveRateController(int(self.options['rate']['value'] or 1000))
+                        print(f"Adaptive rate enabled (ceiling {self._controller.ceiling} p/s)")
                     
-                stdout, stderr = process.communicate()
-                
-                if process.returncode != 0:
-                    return False, f"Zmap failed with error: {stderr}"
-                
-                success, results = self._parse_zmap_output(output_file)
-                if not success:
-                    return False, results
-                
-                print(f"\nScan results saved to: {output_file}")
-                return True, results
-                
+                    # zmap can neither resume inside a permutation nor change
+                    # rate mid-run, so checkpointed, adaptive or budgeted jobs
+                    # run as consecutive segments with a cursor/rate step
+                    # after each
+                    if checkpoint or self._controller or self._allocation.pps is not None:
+                        segment_size = max(1, int(self.options['segment_size']['value'] or 1048576))
+                        segments = targets.chunks(segment_size)
+                    else:
+                        segments = [targets]
+                    
+                    success, error = True, None
+                    for segment in segments:
+                        self.progress = {}
+                        success, error = self._scan_segment('/dev/stdin', segment, collector, deadline)
+                        if not success:
+                            break
+                        if self._controller and self.progress:
+                            rate = self._controller.update(
+                                self.progress['send_rate'],
+                                self.progress['recv_rate'],
+                                self.progress['drop_rate']
+                            )
+                            print(f"[*] Next segment rate: {rate} p/s")
+                        if checkpoint:
+                            checkpoint.update(checkpoint.cursor + len(segment))
+                    
+                    if checkpoint:
+                        if success:
+                            checkpoint.remove()
+                        else:
+                            checkpoint.update(checkpoint.cursor, force=True)
+                            print(f"Checkpoint saved to {checkpoint.path}")
             finally:
-                if cleanup_target:
-                    try:
-                        os.unlink(target_file)
-                    except:
-                        pass
+                collector.close()
+            
+            if not success:
+                return False, error
+            
+            print(f"\nScan results saved to: {output_file}")
+            if self.options['results_db']['value']:
+                scan_id = ScanResultStore(self.options['results_db']['value']).record(
+                    __name__, collector.results, output_file)
+                print(f"Results stored as scan {scan_id} in {self.options['results_db']['value']}")
+            return True, collector.results
                 
         except Exception as e:
             return False, str(e)
     
+    def _handle_status_line(self, shard, line):
+        status = parse_status_line(line)
+        if not status:
+            return
+        self._shard_progress[shard] = status
+        shards = list(self._shard_progress.values())
+        status = {
+            'elapsed': max((s['elapsed'] for s in shards), key=parse_elapsed),
+            'percent': min(s['percent'] for s in shards),
+            'sent': sum(s['sent'] for s in shards),
+            'send_rate': sum(s['send_rate'] for s in shards),
+            'recv': sum(s['recv'] for s in shards),
+            'recv_rate': sum(s['recv_rate'] for s in shards),
+            'drop_rate': sum(s['drop_rate'] for s in shards),
+        }
+        status['hitrate'] = (status['recv'] / status['sent']) * 100 if status['sent'] else 0.0
+        self.progress = status
+        print(
+            f"\r[*] {status['elapsed']} {status['percent']}% | "
+            f"sent: {status['sent']} ({status['send_rate']:.0f} p/s) | "
+            f"recv: {status['recv']} ({status['recv_rate']:.0f} p/s) | "
+            f"drops: {status['drop_rate']:.0f} p/s | hitrate: {status['hitrate']:.2f}%",
+            end='',
+            flush=True
+        )
+
     def stop(self):
         self.stop_scan = True
+        for supervisor in self._supervisors:
+            supervisor.stop()
 
 def create_instance():
     return ZmapScanner()
\ No newline at end of file